@@ -157,6 +157,21 @@ def get_parser(default_config_files, git_root):
         default=1024,
         help="Max number of tokens to use for repo map, use 0 to disable (default: 1024)",
     )
+    group.add_argument(
+        "--map-workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of processes used to parse files for the repo map, use 0 for one per CPU"
+            " (default: 1)"
+        ),
+    )
+    group.add_argument(
+        "--map-render-cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Enable/disable saving rendered repo map snippets between sessions (default: False)",
+    )
     group.add_argument(
         "--max-chat-history-tokens",
         type=int,
@@ -166,6 +181,21 @@ def get_parser(default_config_files, git_root):
             " max_chat_history_tokens."
         ),
     )
+    group.add_argument(
+        "--completion-cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Enable/disable caching LLM responses on disk, identical requests are replayed"
+            " without calling the API (default: False)"
+        ),
+    )
+    group.add_argument(
+        "--completion-cache-ttl",
+        type=int,
+        default=None,
+        help="Seconds before a cached LLM response expires (default: never)",
+    )
     default_env_file = os.path.join(git_root, ".env") if git_root else ".env"
     group.add_argument(
         "--env-file",
@@ -285,6 +315,15 @@ def get_parser(default_config_files, git_root):
         default=default_aiderignore_file,
         help="Specify the aider ignore file (default: .aiderignore in git root)",
     )
+    group.add_argument(
+        "--watch-files",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Enable/disable watching the repo in the background instead of rescanning it every"
+            " message, uses watchdog if installed (default: False)"
+        ),
+    )
     group.add_argument(
         "--auto-commits",
         action=argparse.BooleanOptionalAction,
@@ -297,6 +336,15 @@ def get_parser(default_config_files, git_root):
         default=True,
         help="Enable/disable commits when repo is found dirty (default: True)",
     )
+    group.add_argument(
+        "--speculative-commit-messages",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help=(
+            "Enable/disable having the weak model write commit messages while the LLM replies"
+            " and lint/tests run, at the cost of a request that may go unused (default: True)"
+        ),
+    )
     group.add_argument(
         "--dry-run",
         action=argparse.BooleanOptionalAction,
@@ -393,6 +441,19 @@ def get_parser(default_config_files, git_root):
         help="Enable verbose output",
         default=False,
     )
+    group.add_argument(
+        "--trace",
+        metavar="TRACE_FILE",
+        help="Write Chrome trace events of where the time of each chat turn goes (debug)",
+    )
+    group.add_argument(
+        "--profile",
+        metavar="PROFILE_FILE",
+        help=(
+            "Profile each chat turn into PROFILE_FILE with the turn number added, using"
+            " pyinstrument for .html files and cProfile otherwise (debug)"
+        ),
+    )
     group.add_argument(
         "--show-repo-map",
         action="store_true",
@@ -17,17 +17,19 @@ from jsonschema import Draft7Validator
 from rich.console import Console, Text
 from rich.markdown import Markdown
 
-from aider import __version__, models, prompts, utils
+from aider import __version__, models, prompts, trace, utils
 from aider.commands import Commands
 from aider.history import ChatSummary
 from aider.io import InputOutput
 from aider.linter import Linter
 from aider.litellm import litellm
 from aider.mdstream import MarkdownStream
+from aider.metrics import ResponseMetrics, SessionMetrics
 from aider.repo import GitRepo
 from aider.repomap import RepoMap
 from aider.sendchat import send_with_retries
 from aider.utils import is_image_file
+from aider.watch import FileWatcher
 
 from ..dump import dump  # noqa: F401
 
@@ -51,6 +53,7 @@ class Coder:
     aider_edited_files = None
     last_asked_for_commit_time = 0
     repo_map = None
+    watcher = None
     functions = None
     total_cost = 0.0
     num_exhausted_context_windows = 0
@@ -63,6 +66,9 @@ class Coder:
     temperature = 0
     auto_lint = True
     auto_test = False
+    edit_stream = None
+    send_start = None
+    response_metrics = None
     test_cmd = None
     lint_outcome = None
     test_outcome = None
@@ -114,6 +120,8 @@ class Coder:
                 fnames=from_coder.get_inchat_relative_files(),
                 done_messages=done_messages,
                 cur_messages=from_coder.cur_messages,
+                file_watcher=from_coder.watcher,
+                metrics=from_coder.metrics,
             )
 
             use_kwargs.update(update)  # override to complete the switch
@@ -201,8 +209,14 @@ class Coder:
         show_diffs=False,
         auto_commits=True,
         dirty_commits=True,
+        speculative_commit_messages=True,
         dry_run=False,
         map_tokens=1024,
+        map_workers=1,
+        map_render_cache=False,
+        watch_files=False,
+        file_watcher=None,
+        metrics=None,
         verbose=False,
         assistant_output_color="blue",
         code_theme="default",
@@ -250,6 +264,7 @@ class Coder:
 
         self.auto_commits = auto_commits
         self.dirty_commits = dirty_commits
+        self.speculative_commit_messages = speculative_commit_messages
         self.assistant_output_color = assistant_output_color
         self.code_theme = code_theme
 
@@ -280,6 +295,15 @@ class Coder:
             except FileNotFoundError:
                 self.repo = None
 
+        # the latency and throughput of the LLM responses, kept across /model switches
+        self.metrics = metrics or SessionMetrics()
+
+        if file_watcher:
+            self.watcher = file_watcher
+        elif watch_files and self.repo:
+            self.watcher = FileWatcher(self.repo, verbose=self.verbose)
+            self.watcher.start()
+
         for fname in fnames:
             fname = Path(fname)
             if not fname.exists():
@@ -311,6 +335,9 @@ class Coder:
                 self.gpt_prompts.repo_content_prefix,
                 self.verbose,
                 self.main_model.info.get("max_input_tokens"),
+                map_workers=map_workers,
+                render_cache_disk=map_render_cache,
+                cache_mtimes=bool(self.watcher),
             )
 
         if max_chat_history_tokens is None:
@@ -468,6 +495,7 @@ class Coder:
         words = set(re.split(r"\W+", text))
         return words
 
+    @trace.traced("coder.get_repo_map")
     def get_repo_map(self):
         if not self.repo_map:
             return
@@ -476,6 +504,10 @@ class Coder:
         mentioned_fnames = self.get_file_mentions(cur_msg_text)
         mentioned_idents = self.get_ident_mentions(cur_msg_text)
 
+        if self.watcher:
+            # the chat files are always re-statted, we may have just edited them
+            self.repo_map.invalidate(self.watcher.pop_changed() | self.abs_fnames)
+
         other_files = set(self.get_all_abs_files()) - set(self.abs_fnames)
         repo_content = self.repo_map.get_repo_map(
             self.abs_fnames,
@@ -563,7 +595,8 @@ class Coder:
     def run_stream(self, user_message):
         self.io.user_input(user_message)
         self.init_before_message()
-        yield from self.send_new_user_message(user_message)
+        # the caller renders between the chunks, only time the turn itself
+        yield from trace.turn("coder.turn", self.send_new_user_message(user_message))
 
     def init_before_message(self):
         self.reflected_message = None
@@ -585,7 +618,8 @@ class Coder:
 
                 while new_user_message:
                     self.reflected_message = None
-                    list(self.send_new_user_message(new_user_message))
+                    with trace.span("coder.turn"), trace.profile():
+                        list(self.send_new_user_message(new_user_message))
                     if self.num_reflections < self.max_reflections:
                         self.num_reflections += 1
                         new_user_message = self.reflected_message
@@ -695,6 +729,7 @@ class Coder:
         prompt = prompt.format(fence=self.fence, lazy_prompt=lazy_prompt)
         return prompt
 
+    @trace.traced("coder.format_messages")
     def format_messages(self):
         self.choose_fence()
         main_sys = self.fmt_system_prompt(self.gpt_prompts.main_system)
@@ -783,6 +818,12 @@ class Coder:
 
         if self.verbose:
             utils.show_messages(messages, functions=self.functions)
+            self.io.tool_output(f"Token count cache: {self.main_model.token_cache.stats()}")
+            weak_model = self.main_model.weak_model
+            if weak_model and weak_model is not self.main_model:
+                self.io.tool_output(
+                    f"Weak model token count cache: {weak_model.token_cache.stats()}"
+                )
 
         exhausted = False
         interrupted = False
@@ -835,6 +876,7 @@ class Coder:
             return
         if edited:
             self.edit_outcome = True
+            self.start_auto_commit_message(edited)
 
         if edited and self.auto_lint:
             lint_errors = self.lint_edited(edited)
@@ -876,6 +918,7 @@ class Coder:
             else:
                 self.reflected_message = add_rel_files_message
 
+    @trace.traced("coder.lint_edited")
     def lint_edited(self, fnames):
         res = ""
         for fname in fnames:
@@ -957,12 +1000,18 @@ class Coder:
 
         self.partial_response_content = ""
         self.partial_response_function_call = dict()
+        self.streamed_edit_paths = set()
+        self.streamed_dirty_fnames = set()
+        self.edit_stream = self.make_edit_stream()
+        self.send_start = trace.now()
+        self.response_metrics = ResponseMetrics(model, self.stream)
 
         interrupted = False
         try:
-            hash_object, completion = send_with_retries(
-                model, messages, functions, self.stream, self.temperature
-            )
+            with trace.span("coder.send.request", model=model, stream=self.stream):
+                hash_object, completion = send_with_retries(
+                    model, messages, functions, self.stream, self.temperature
+                )
             self.chat_completion_call_hashes.append(hash_object.hexdigest())
 
             if self.stream:
@@ -972,6 +1021,12 @@ class Coder:
         except KeyboardInterrupt:
             self.keyboard_interrupt()
             interrupted = True
+        except Exception as err:
+            self.response_metrics.error = type(err).__name__
+            raise
+        finally:
+            # failed and throttled requests are recorded too
+            self.record_response_metrics()
 
         if self.partial_response_content:
             self.io.ai_output(self.partial_response_content)
@@ -981,9 +1036,37 @@ class Coder:
             if args:
                 self.io.ai_output(json.dumps(args, indent=4))
 
+        trace.complete("coder.send", self.send_start, model=model, interrupted=interrupted)
+
         if interrupted:
             raise KeyboardInterrupt
 
+    def record_response_metrics(self):
+        metrics = self.response_metrics
+        metrics.finish()
+
+        if metrics.output_tokens is None:
+            # streams don't report their usage
+            if self.partial_response_content:
+                content = self.partial_response_content
+            elif self.partial_response_function_call:
+                content = json.dumps(self.partial_response_function_call)
+            else:
+                content = None
+
+            # count the finished reply with the real tokenizer, the estimate
+            # runs about 10% high and would skew the tokens/sec
+            if content:
+                try:
+                    metrics.output_tokens = self.main_model.token_count(content)
+                except Exception:
+                    metrics.output_tokens = None
+                if metrics.output_tokens is None:
+                    metrics.output_tokens = self.main_model.token_count(content, estimate=True)
+                    metrics.estimated = True
+
+        self.metrics.add(metrics)
+
     def show_send_output(self, completion):
         if self.verbose:
             print(completion)
@@ -1028,6 +1111,11 @@ class Coder:
                     cost += completion_tokens * self.main_model.info.get("output_cost_per_token")
                 tokens += f", ${cost:.6f} cost"
                 self.total_cost += cost
+                if self.response_metrics:
+                    self.response_metrics.cost = cost
+
+            if self.response_metrics:
+                self.response_metrics.output_tokens = completion_tokens
 
         show_resp = self.render_incremental_response(True)
         if self.show_pretty():
@@ -1049,6 +1137,7 @@ class Coder:
         else:
             mdstream = None
 
+        first_token = None
         try:
             for chunk in completion:
                 if len(chunk.choices) == 0:
@@ -1069,15 +1158,24 @@ class Coder:
                         else:
                             self.partial_response_function_call[k] = v
                 except AttributeError:
-                    pass
+                    func = None
 
                 try:
                     text = chunk.choices[0].delta.content
-                    if text:
-                        self.partial_response_content += text
                 except AttributeError:
                     text = None
 
+                if self.response_metrics and (text or func):
+                    self.response_metrics.chunk()
+
+                if text:
+                    if first_token is None:
+                        first_token = trace.now()
+                        trace.complete("coder.send.first_token", self.send_start)
+                    self.partial_response_content += text
+                    if self.edit_stream:
+                        self.edit_stream.feed(text)
+
                 if self.show_pretty():
                     self.live_incremental_response(mdstream, False)
                 elif text:
@@ -1087,6 +1185,16 @@ class Coder:
         finally:
             if mdstream:
                 self.live_incremental_response(mdstream, True)
+            if first_token is not None:
+                trace.complete("coder.send.stream", first_token)
+
+    def make_edit_stream(self):
+        """
+        Return a parser to feed the reply to as it streams in, so the edits
+        can be parsed and checked before the reply is complete. It needs a
+        feed(text) method.
+        """
+        return None
 
     def live_incremental_response(self, mdstream, final):
         show_resp = self.render_incremental_response(final)
@@ -1106,6 +1214,9 @@ class Coder:
         return sorted(set(files))
 
     def get_all_relative_files(self):
+        if self.watcher:
+            return self.watcher.get_files()
+
         if self.repo:
             files = self.repo.get_tracked_files()
         else:
@@ -1115,6 +1226,9 @@ class Coder:
         return sorted(set(files))
 
     def get_all_abs_files(self):
+        if self.watcher:
+            return self.watcher.get_abs_files()
+
         files = self.get_all_relative_files()
         files = [self.abs_root_path(path) for path in files]
         return files
@@ -1207,7 +1321,7 @@ class Coder:
             if is_image_file(relative_fname):
                 continue
             content = self.io.read_text(fname)
-            tokens += self.main_model.token_count(content)
+            tokens += self.main_model.token_count(content, estimate=True)
 
         if tokens < warn_number_of_tokens:
             return
@@ -1246,6 +1360,7 @@ class Coder:
         self.apply_edits(edits)
         return set(edit[0] for edit in edits)
 
+    @trace.traced("coder.apply_updates")
     def apply_updates(self):
         try:
             edited = self.update_files()
@@ -1321,6 +1436,27 @@ class Coder:
 
         return context
 
+    def start_auto_commit_message(self, edited):
+        """
+        Have the weak model write the commit message for the edits while lint
+        and tests run. auto_commit() uses it if the diffs are unchanged.
+        """
+        if not self.speculative_commit_messages:
+            return
+        if not self.repo or not self.auto_commits or self.dry_run:
+            return
+        if self.partial_response_function_call:
+            return
+
+        # the context auto_commit() will see, once update_cur_messages() adds the reply
+        history = list(self.cur_messages)
+        if self.partial_response_content:
+            history += [dict(role="assistant", content=self.partial_response_content)]
+        context = self.get_context_from_history(history)
+
+        self.repo.start_commit_message(edited, context)
+
+    @trace.traced("coder.auto_commit")
     def auto_commit(self, edited):
         context = self.get_context_from_history(self.cur_messages)
         res = self.repo.commit(fnames=edited, context=context, prefix="aider: ")
@@ -1339,6 +1475,31 @@ class Coder:
         self.io.tool_output("No changes made to git tracked files.")
         return self.gpt_prompts.files_content_gpt_no_edits
 
+    def start_dirty_commit_message(self, path):
+        """
+        Called as each edit streams in. If it edits a chat file with
+        uncommitted changes, dirty_commit() will commit that file first, so
+        have the weak model write that commit message while the rest of the
+        reply streams in.
+        """
+        if not self.speculative_commit_messages:
+            return
+        if not self.repo or not self.dirty_commits or self.dry_run:
+            return
+        if path in self.streamed_edit_paths:
+            return
+        self.streamed_edit_paths.add(path)
+
+        # the same checks as allowed_to_edit() and check_for_dirty_commit()
+        full_path = Path(self.abs_root_path(path))
+        if str(full_path) not in self.abs_fnames or not full_path.is_file():
+            return
+        if not full_path.stat().st_size or not self.repo.is_dirty(path):
+            return
+
+        self.streamed_dirty_fnames.add(path)
+        self.repo.start_commit_message(sorted(self.streamed_dirty_fnames))
+
     def dirty_commit(self):
         if not self.need_commit_before_edits:
             return
@@ -1347,7 +1508,8 @@ class Coder:
         if not self.repo:
             return
 
-        self.repo.commit(fnames=self.need_commit_before_edits)
+        # sorted, to match the diffs start_dirty_commit_message() used
+        self.repo.commit(fnames=sorted(self.need_commit_before_edits))
 
         # files changed, move cur messages back behind the files messages
         # self.move_back_cur_messages(self.gpt_prompts.files_content_local_edits)
@@ -1,8 +1,15 @@
 import math
 import re
+from collections import Counter, defaultdict
 from difflib import SequenceMatcher
+from functools import lru_cache
 from pathlib import Path
 
+try:
+    from rapidfuzz.distance import Indel
+except ImportError:
+    Indel = None
+
 from ..dump import dump  # noqa: F401
 from .base_coder import Coder
 from .editblock_prompts import EditBlockPrompts
@@ -10,19 +17,69 @@ from .editblock_prompts import EditBlockPrompts
 
 class EditBlockCoder(Coder):
     edit_format = "diff"
+    preview_edits = True
 
     def __init__(self, *args, **kwargs):
         self.gpt_prompts = EditBlockPrompts()
+        self.edit_previews = dict()
         super().__init__(*args, **kwargs)
 
+    def make_edit_stream(self):
+        self.edit_previews = dict()
+        self.preview_contents = dict()
+
+        return EditBlockStream(self.fence, on_edit=self.on_streamed_edit)
+
+    def on_streamed_edit(self, edit):
+        self.start_dirty_commit_message(edit[0])
+        if self.preview_edits:
+            self.preview_edit(edit)
+
+    def preview_edit(self, edit):
+        """
+        Match an edit against its file while the rest of the reply streams in,
+        so apply_edits() can reuse the result if the file hasn't changed.
+        Earlier edits to the same file are applied in memory first.
+        """
+        path, original, updated = edit
+        full_path = self.abs_root_path(path)
+
+        content = self.preview_contents.get(full_path)
+        if content is None:
+            if not Path(full_path).is_file():
+                # new files are cheap, and do_replace() would create them
+                return
+            content = self.io.read_text(full_path)
+            if content is None:
+                return
+
+        try:
+            new_content = do_replace(full_path, content, original, updated, self.fence)
+        except Exception:
+            return
+
+        self.edit_previews[(full_path, original, updated)] = (content, new_content)
+        if new_content:
+            self.preview_contents[full_path] = new_content
+
     def get_edits(self):
         content = self.partial_response_content
 
         # might raise ValueError for malformed ORIG/UPD blocks
-        edits = list(find_original_update_blocks(content, self.fence))
+        if self.edit_stream:
+            edits = self.edit_stream.finish(content)
+        else:
+            edits = list(find_original_update_blocks(content, self.fence))
 
         return edits
 
+    def replace(self, full_path, content, original, updated):
+        preview = self.edit_previews.get((full_path, original, updated))
+        if preview and preview[0] == content:
+            return preview[1]
+
+        return do_replace(full_path, content, original, updated, self.fence)
+
     def apply_edits(self, edits):
         failed = []
         passed = []
@@ -30,7 +87,7 @@ class EditBlockCoder(Coder):
             path, original, updated = edit
             full_path = self.abs_root_path(path)
             content = self.io.read_text(full_path)
-            new_content = do_replace(full_path, content, original, updated, self.fence)
+            new_content = self.replace(full_path, content, original, updated)
             if not new_content:
                 # try patching any of the other files in the chat
                 for full_path in self.abs_fnames:
@@ -100,23 +157,74 @@ def prep(content):
     return content, lines
 
 
-def perfect_or_whitespace(whole_lines, part_lines, replace_lines):
+class LineIndex:
+    """
+    The offsets of each line in a file, exactly and without leading
+    whitespace. Only the offsets where the first non-blank line of a block
+    matches need to be compared, instead of every offset in the file.
+    """
+
+    def __init__(self, content):
+        self.content, self.lines = prep(content)
+
+        self.exact = defaultdict(list)
+        self.stripped = defaultdict(list)
+        for i, line in enumerate(self.lines):
+            self.exact[line].append(i)
+            self.stripped[line.lstrip()].append(i)
+
+    def candidates(self, part_lines, stripped=False):
+        """The offsets where part_lines might start, in order"""
+        last = len(self.lines) - len(part_lines)
+
+        for num, line in enumerate(part_lines):
+            if line.strip():
+                break
+        else:
+            # all blank, nothing to narrow it down
+            return range(last + 1)
+
+        if stripped:
+            offsets = self.stripped.get(line.lstrip(), ())
+        else:
+            offsets = self.exact.get(line, ())
+
+        return [i - num for i in offsets if num <= i <= last + num]
+
+
+@lru_cache(maxsize=32)
+def get_line_index(content):
+    """
+    Cached by content, so the edits in a reply share the index of each
+    version of a file, including when they're tried against other files.
+    """
+    return LineIndex(content)
+
+
+def perfect_or_whitespace(whole_lines, part_lines, replace_lines, index=None):
     # Try for a perfect match
-    res = perfect_replace(whole_lines, part_lines, replace_lines)
+    res = perfect_replace(whole_lines, part_lines, replace_lines, index)
     if res:
         return res
 
     # Try being flexible about leading whitespace
-    res = replace_part_with_missing_leading_whitespace(whole_lines, part_lines, replace_lines)
+    res = replace_part_with_missing_leading_whitespace(
+        whole_lines, part_lines, replace_lines, index
+    )
     if res:
         return res
 
 
-def perfect_replace(whole_lines, part_lines, replace_lines):
+def perfect_replace(whole_lines, part_lines, replace_lines, index=None):
     part_tup = tuple(part_lines)
     part_len = len(part_lines)
 
-    for i in range(len(whole_lines) - part_len + 1):
+    if index:
+        offsets = index.candidates(part_lines)
+    else:
+        offsets = range(len(whole_lines) - part_len + 1)
+
+    for i in offsets:
         whole_tup = tuple(whole_lines[i : i + part_len])
         if part_tup == whole_tup:
             res = whole_lines[:i] + replace_lines + whole_lines[i + part_len :]
@@ -126,18 +234,21 @@ def perfect_replace(whole_lines, part_lines, replace_lines):
 def replace_most_similar_chunk(whole, part, replace):
     """Best efforts to find the `part` lines in `whole` and replace them with `replace`"""
 
-    whole, whole_lines = prep(whole)
+    index = get_line_index(whole)
+    whole, whole_lines = index.content, index.lines
     part, part_lines = prep(part)
     replace, replace_lines = prep(replace)
 
-    res = perfect_or_whitespace(whole_lines, part_lines, replace_lines)
+    res = perfect_or_whitespace(whole_lines, part_lines, replace_lines, index)
     if res:
         return res
 
     # drop leading empty line, GPT sometimes adds them spuriously (issue #25)
     if len(part_lines) > 2 and not part_lines[0].strip():
         skip_blank_line_part_lines = part_lines[1:]
-        res = perfect_or_whitespace(whole_lines, skip_blank_line_part_lines, replace_lines)
+        res = perfect_or_whitespace(
+            whole_lines, skip_blank_line_part_lines, replace_lines, index
+        )
         if res:
             return res
 
@@ -209,7 +320,9 @@ def try_dotdotdots(whole, part, replace):
     return whole
 
 
-def replace_part_with_missing_leading_whitespace(whole_lines, part_lines, replace_lines):
+def replace_part_with_missing_leading_whitespace(
+    whole_lines, part_lines, replace_lines, index=None
+):
     # GPT often messes up leading whitespace.
     # It usually does it uniformly across the ORIG and UPD blocks.
     # Either omitting all leading whitespace, or including only some of it.
@@ -227,7 +340,12 @@ def replace_part_with_missing_leading_whitespace(whole_lines, part_lines, replac
     # can we find an exact match not including the leading whitespace
     num_part_lines = len(part_lines)
 
-    for i in range(len(whole_lines) - num_part_lines + 1):
+    if index:
+        offsets = index.candidates(part_lines, stripped=True)
+    else:
+        offsets = range(len(whole_lines) - num_part_lines + 1)
+
+    for i in offsets:
         add_leading = match_but_for_leading_whitespace(
             whole_lines[i : i + num_part_lines], part_lines
         )
@@ -262,32 +380,94 @@ def match_but_for_leading_whitespace(whole_lines, part_lines):
     return add.pop()
 
 
+def bounded_ratio(matcher, cutoff, best=0):
+    """
+    matcher.ratio(), or 0 if a cheap upper bound shows it is below cutoff or
+    below best. rapidfuzz's normalized LCS is used as a bound if installed,
+    it is never less than SequenceMatcher's ratio.
+    """
+    cutoff = max(cutoff, best)
+
+    if matcher.real_quick_ratio() < cutoff:
+        return 0
+
+    if Indel:
+        # allow for rounding, the two compute the same fraction differently
+        if Indel.normalized_similarity(matcher.a, matcher.b) + 1e-9 < cutoff:
+            return 0
+    elif matcher.quick_ratio() < cutoff:
+        return 0
+
+    return matcher.ratio()
+
+
+def line_overlaps(lines, part_lines, length):
+    """
+    How many lines of each window of length lines are also in part_lines,
+    counting duplicates. Updated as the window slides.
+    """
+    part_counts = Counter(part_lines)
+    window = Counter()
+    overlap = 0
+
+    for i, line in enumerate(lines):
+        window[line] += 1
+        if window[line] <= part_counts[line]:
+            overlap += 1
+
+        if i >= length:
+            line = lines[i - length]
+            if window[line] <= part_counts[line]:
+                overlap -= 1
+            window[line] -= 1
+
+        if i >= length - 1:
+            yield overlap
+
+
 def replace_closest_edit_distance(whole_lines, part, part_lines, replace_lines):
     similarity_thresh = 0.8
 
     max_similarity = 0
-    most_similar_chunk_start = -1
-    most_similar_chunk_end = -1
+    most_similar_chunk = None
 
     scale = 0.1
     min_len = math.floor(len(part_lines) * (1 - scale))
     max_len = math.ceil(len(part_lines) * (1 + scale))
 
-    for length in range(min_len, max_len):
-        for i in range(len(whole_lines) - length + 1):
-            chunk = whole_lines[i : i + length]
-            chunk = "".join(chunk)
+    # Try the chunks which share the most lines with part first. A high
+    # similarity found early lets the cheap bounds skip most of the rest.
+    chunks = []
+    for length in range(max(min_len, 1), min(max_len, len(whole_lines) + 1)):
+        for i, overlap in enumerate(line_overlaps(whole_lines, part_lines, length)):
+            chunks.append((-overlap, length, i))
+    chunks.sort()
+
+    matcher = SequenceMatcher(None)
+    matcher.set_seq2(part)
 
-            similarity = SequenceMatcher(None, chunk, part).ratio()
+    for _, length, i in chunks:
+        chunk = whole_lines[i : i + length]
+        chunk = "".join(chunk)
 
-            if similarity > max_similarity and similarity:
-                max_similarity = similarity
-                most_similar_chunk_start = i
-                most_similar_chunk_end = i + length
+        matcher.set_seq1(chunk)
+        similarity = bounded_ratio(matcher, similarity_thresh, max_similarity)
+        if not similarity or similarity < max_similarity:
+            continue
+
+        # on a tie, keep the chunk an in-order scan would have found first
+        if similarity == max_similarity and (length, i) > most_similar_chunk:
+            continue
+
+        max_similarity = similarity
+        most_similar_chunk = (length, i)
 
     if max_similarity < similarity_thresh:
         return
 
+    length, most_similar_chunk_start = most_similar_chunk
+    most_similar_chunk_end = most_similar_chunk_start + length
+
     modified_whole = (
         whole_lines[:most_similar_chunk_start]
         + replace_lines
@@ -387,7 +567,7 @@ def strip_filename(filename, fence):
     return filename
 
 
-def find_original_update_blocks(content, fence=DEFAULT_FENCE):
+def find_original_update_blocks(content, fence=DEFAULT_FENCE, filename=None):
     # make sure we end with a newline, otherwise the regex will miss <<UPD on the last line
     if not content.endswith("\n"):
         content = content + "\n"
@@ -399,7 +579,7 @@ def find_original_update_blocks(content, fence=DEFAULT_FENCE):
 
     # Keep using the same filename in cases where GPT produces an edit block
     # without a filename.
-    current_filename = None
+    current_filename = filename
     try:
         while pieces:
             cur = pieces.pop()
@@ -460,6 +640,75 @@ def find_original_update_blocks(content, fence=DEFAULT_FENCE):
         raise ValueError(f"{processed}\n^^^ Error parsing SEARCH/REPLACE block.")
 
 
+updated_re = re.compile(r"^" + UPDATED + r"[ ]*\n", re.MULTILINE)
+
+
+class EditBlockStream:
+    """
+    Parses the SEARCH/REPLACE blocks out of a reply as it streams in. Each
+    block is parsed as soon as its REPLACE marker arrives, and passed to
+    on_edit. The text after the last complete block is left for finish().
+    """
+
+    def __init__(self, fence=DEFAULT_FENCE, on_edit=None):
+        self.fence = fence
+        self.on_edit = on_edit
+
+        self.content = ""
+        self.edits = []
+        self.parsed = 0  # len of the content which was split into edits
+        self.scanned = 0  # len of the content searched for REPLACE markers
+        self.filename = None
+        self.failed = False
+
+    def feed(self, text):
+        self.content += text
+        if self.failed:
+            return
+
+        end = self.content.rfind("\n") + 1
+        if end <= self.scanned:
+            return
+
+        # back up to the start of the line, a marker may have been split
+        start = self.content.rfind("\n", 0, self.scanned) + 1
+        for match in updated_re.finditer(self.content, start, end):
+            self.parse(match.end())
+
+        self.scanned = end
+
+    def parse(self, end):
+        try:
+            edits = list(
+                find_original_update_blocks(
+                    self.content[self.parsed : end], self.fence, self.filename
+                )
+            )
+        except ValueError:
+            # leave it for finish() to report, against the whole reply
+            self.failed = True
+            return
+
+        self.parsed = end
+        for edit in edits:
+            self.filename = edit[0]
+            self.edits.append(edit)
+            if self.on_edit:
+                self.on_edit(edit)
+
+    def finish(self, content):
+        """All the edits in the complete reply"""
+        if self.failed or content != self.content:
+            return list(find_original_update_blocks(content, self.fence))
+
+        try:
+            rest = find_original_update_blocks(content[self.parsed :], self.fence, self.filename)
+            return self.edits + list(rest)
+        except ValueError:
+            # raise with the whole reply in the message
+            return list(find_original_update_blocks(content, self.fence))
+
+
 if __name__ == "__main__":
     edit = """
 Here's the change:
@@ -485,9 +734,20 @@ def find_similar_lines(search_lines, content_lines, threshold=0.6):
     best_ratio = 0
     best_match = None
 
-    for i in range(len(content_lines) - len(search_lines) + 1):
-        chunk = content_lines[i : i + len(search_lines)]
-        ratio = SequenceMatcher(None, search_lines, chunk).ratio()
+    num_lines = len(search_lines)
+    matcher = SequenceMatcher(None)
+    matcher.set_seq1(search_lines)
+
+    # a chunk can't score above the share of its lines which are in
+    # search_lines, only compare the ones which could beat the best so far
+    overlaps = line_overlaps(content_lines, search_lines, num_lines) if num_lines else []
+    for i, overlap in enumerate(overlaps):
+        if overlap / num_lines < max(threshold, best_ratio):
+            continue
+
+        chunk = content_lines[i : i + num_lines]
+        matcher.set_seq2(chunk)
+        ratio = matcher.ratio()
         if ratio > best_ratio:
             best_ratio = ratio
             best_match = chunk
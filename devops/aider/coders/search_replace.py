@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import sys
+from difflib import SequenceMatcher
 from pathlib import Path
 
 import git
@@ -531,6 +532,136 @@ def git_cherry_pick_sr_onto_so(texts):
         return new_text
 
 
+def compact_changes(lines, changed):
+    """
+    Like git's diff, slide each run of changed lines up as far as it will
+    go, merging with any runs it meets, and then as far down as it will go.
+    Only swaps equal lines, so the unchanged lines still match up.
+    """
+    num = len(lines)
+    start = 0
+    while start < num:
+        if not changed[start]:
+            start += 1
+            continue
+
+        end = start
+        while end < num and changed[end]:
+            end += 1
+
+        while True:
+            size = end - start
+
+            while start and lines[start - 1] == lines[end - 1]:
+                start -= 1
+                end -= 1
+                changed[start] = True
+                changed[end] = False
+                while start and changed[start - 1]:
+                    start -= 1
+
+            while end < num and lines[start] == lines[end]:
+                changed[start] = False
+                changed[end] = True
+                start += 1
+                end += 1
+                while end < num and changed[end]:
+                    end += 1
+
+            if end - start == size:
+                break
+
+        start = end
+
+
+def matching_lines(a, b):
+    """Pairs of (a index, b index) for the lines which a diff keeps"""
+    a_changed = [True] * len(a)
+    b_changed = [True] * len(b)
+    for i, j, size in SequenceMatcher(None, a, b, autojunk=False).get_matching_blocks():
+        a_changed[i : i + size] = [False] * size
+        b_changed[j : j + size] = [False] * size
+
+    compact_changes(a, a_changed)
+    compact_changes(b, b_changed)
+
+    a_kept = [i for i, changed in enumerate(a_changed) if not changed]
+    b_kept = [j for j, changed in enumerate(b_changed) if not changed]
+    return dict(zip(a_kept, b_kept))
+
+
+def find_sync_regions(base, ours, theirs):
+    """
+    The runs of lines which are unchanged in both ours and theirs, as
+    (base_start, base_end, ours_start, ours_end, theirs_start, theirs_end).
+    Ends with an empty region at the end of all three.
+    """
+    ours_kept = matching_lines(base, ours)
+    theirs_kept = matching_lines(base, theirs)
+
+    regions = []
+    for i in range(len(base)):
+        j = ours_kept.get(i)
+        k = theirs_kept.get(i)
+        if j is None or k is None:
+            continue
+
+        if regions and regions[-1][1::2] == (i, j, k):
+            bstart, _, ostart, _, tstart, _ = regions[-1]
+            regions[-1] = (bstart, i + 1, ostart, j + 1, tstart, k + 1)
+        else:
+            regions.append((i, i + 1, j, j + 1, k, k + 1))
+
+    regions.append((len(base), len(base), len(ours), len(ours), len(theirs), len(theirs)))
+    return regions
+
+
+def diff3_merge(base_text, ours_text, theirs_text):
+    """
+    Merge the base -> theirs changes into ours, like a cherry-pick. Returns
+    None if they conflict: both sides changed the same or adjacent lines of
+    base, and not in the same way.
+    """
+    base = base_text.splitlines(keepends=True)
+    ours = ours_text.splitlines(keepends=True)
+    theirs = theirs_text.splitlines(keepends=True)
+
+    merged = []
+    bpos = opos = tpos = 0
+    for bstart, bend, ostart, oend, tstart, tend in find_sync_regions(base, ours, theirs):
+        # the lines changed by either side since the last sync region
+        base_lines = base[bpos:bstart]
+        ours_lines = ours[opos:ostart]
+        theirs_lines = theirs[tpos:tstart]
+
+        if ours_lines == theirs_lines or theirs_lines == base_lines:
+            merged += ours_lines
+        elif ours_lines == base_lines:
+            merged += theirs_lines
+        else:
+            # conflict
+            return
+
+        merged += ours[ostart:oend]
+        bpos, opos, tpos = bend, oend, tend
+
+    return "".join(merged)
+
+
+def diff3_osr_onto_o(texts):
+    """
+    Apply the search -> replace changes to original with an in memory
+    diff3 merge, the same as git_cherry_pick_osr_onto_o() without git.
+    """
+    search_text, replace_text, original_text = texts
+
+    new_text = diff3_merge(search_text, original_text, replace_text)
+
+    # git won't cherry-pick a change which is already in original
+    if new_text != original_text:
+        return new_text
+
+
 class SearchTextNotUnique(ValueError):
     pass
 
@@ -556,7 +687,7 @@ always_relative_indent = [
 
 editblock_strategies = [
     (search_and_replace, all_preprocs),
-    (git_cherry_pick_osr_onto_o, all_preprocs),
+    (diff3_osr_onto_o, all_preprocs),
     (dmp_lines_apply, all_preprocs),
 ]
 
@@ -567,7 +698,7 @@ never_relative = [
 
 udiff_strategies = [
     (search_and_replace, all_preprocs),
-    (git_cherry_pick_osr_onto_o, all_preprocs),
+    (diff3_osr_onto_o, all_preprocs),
     (dmp_lines_apply, all_preprocs),
 ]
 
@@ -647,6 +778,7 @@ def proc(dname):
         # (search_and_replace, all_preprocs),
         # (git_cherry_pick_osr_onto_o, all_preprocs),
         # (git_cherry_pick_sr_onto_so, all_preprocs),
+        # (diff3_osr_onto_o, all_preprocs),
         # (dmp_apply, all_preprocs),
         (dmp_lines_apply, all_preprocs),
     ]
@@ -657,6 +789,7 @@ def proc(dname):
         search_and_replace="sr",
         git_cherry_pick_osr_onto_o="cp_o",
         git_cherry_pick_sr_onto_so="cp_so",
+        diff3_osr_onto_o="d3_o",
         dmp_apply="dmp",
         dmp_lines_apply="dmpl",
     )
@@ -8,7 +8,7 @@ import git
 import openai
 from prompt_toolkit.completion import Completion
 
-from aider import models, prompts, voice
+from aider import models, prompts, trace, voice
 from aider.litellm import litellm
 from aider.scrape import Scraper
 from aider.utils import is_image_file
@@ -278,6 +278,14 @@ class Commands:
         self.io.tool_output("=" * (width + cost_width + 1))
         self.io.tool_output(f"${total_cost:7.4f} {fmt(total)} tokens total")
 
+        metrics_lines = self.coder.metrics.format_lines()
+        if metrics_lines:
+            self.io.tool_output()
+            self.io.tool_output(f"${self.coder.total_cost:7.4f} spent this session")
+            for line in metrics_lines:
+                self.io.tool_output(f"{cost_pad}{line}")
+            self.io.tool_output()
+
         limit = self.coder.main_model.info.get("max_input_tokens", 0)
         if not limit:
             return
@@ -404,7 +412,7 @@ class Commands:
 
         # if repo, filter against it
         if self.coder.repo:
-            git_files = self.coder.repo.get_tracked_files()
+            git_files = set(self.coder.repo.get_tracked_files())
             matched_files = [fn for fn in matched_files if str(fn) in git_files]
 
         res = list(map(str, matched_files))
@@ -539,6 +547,25 @@ class Commands:
 
         self.io.tool_output(combined_output)
 
+    def cmd_metrics(self, args):
+        "Show the latency and speed of this session's LLM responses as json, or save it to a file"
+        res = self.coder.metrics.to_json(total_cost=self.coder.total_cost)
+
+        fname = args.strip()
+        if not fname:
+            self.io.tool_output(res)
+            return
+
+        try:
+            with open(fname, "w", encoding=self.io.encoding) as f:
+                f.write(res + "\n")
+        except OSError as err:
+            self.io.tool_error(f"Unable to write {fname}: {err}")
+            return
+
+        self.io.tool_output(f"Saved the response metrics to {fname}")
+
+    @trace.traced("commands.cmd_test")
     def cmd_test(self, args):
         "Run a shell command and add the output to the chat on non-zero exit code"
         if not args and self.coder.test_cmd:
@@ -749,6 +749,7 @@ class GUI:
             self.do_add_to_chat()
             self.do_recent_msgs()
             self.do_clear_chat_history()
+            self.do_tokens_and_cost()
 
             st.warning(
                 "This browser version of Agentic Devops is experimental. Please share feedback in [GitHub"
@@ -986,8 +987,8 @@ class GUI:
             )
 
     def do_tokens_and_cost(self):
-        with st.expander("Tokens and costs", expanded=True):
-            pass
+        with st.expander("Tokens and costs", expanded=False):
+            self.do_show_metrics()
 
     def do_show_token_usage(self):
         with st.popover("Show token usage"):
@@ -1001,9 +1002,36 @@ class GUI:
             self.info("Cleared chat history. Now the LLM can't see anything before this line.")
 
     def do_show_metrics(self):
-        st.metric("Cost of last message send & reply", "$0.0019", help="foo")
-        st.metric("Cost to send next message", "$0.0013", help="foo")
-        st.metric("Total cost this session", "$0.22")
+        metrics = self.coder.metrics
+        summary = metrics.summary()
+
+        last_cost = metrics.requests[-1]["cost"] if metrics.requests else None
+        if last_cost is not None:
+            st.metric("Cost of last message send & reply", f"${last_cost:.4f}")
+        st.metric("Total cost this session", f"${self.coder.total_cost:.4f}")
+
+        if summary["ttft_p50"] is not None:
+            st.metric(
+                "Time to first token",
+                f"{summary['ttft_p50']:.2f}s",
+                help=f"Median of {summary['requests']} responses, p90 {summary['ttft_p90']:.2f}s",
+            )
+        if summary["tokens_per_sec"]:
+            st.metric("Output speed", f"{summary['tokens_per_sec']:.1f} tokens/sec")
+        if summary["gap_p99"] is not None:
+            st.metric(
+                "Slowest gaps between chunks",
+                f"{summary['gap_p99'] * 1000:.0f}ms",
+                help="p99, long gaps are a sign of throttling",
+            )
+
+        if metrics.requests:
+            st.download_button(
+                "Download metrics as json",
+                metrics.to_json(total_cost=self.coder.total_cost),
+                file_name="aider-metrics.json",
+                mime="application/json",
+            )
 
     def do_git(self):
         with st.expander("Git", expanded=False):
@@ -12,14 +12,15 @@ class ChatSummary:
         self.model = model
 
     def too_big(self, messages):
-        sized = self.tokenize(messages)
+        # summarize() makes the final decision with exact counts
+        sized = self.tokenize(messages, estimate=True)
         total = sum(tokens for tokens, _msg in sized)
         return total > self.max_tokens
 
-    def tokenize(self, messages):
+    def tokenize(self, messages, estimate=False):
         sized = []
         for msg in messages:
-            tokens = self.token_count(msg)
+            tokens = self.token_count(msg, estimate=estimate)
             sized.append((tokens, msg))
         return sized
 
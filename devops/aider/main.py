@@ -9,7 +9,7 @@ import git
 from dotenv import load_dotenv
 from streamlit.web import cli
 
-from aider import __version__, models, utils
+from aider import __version__, models, sendchat, trace, utils
 from aider.args import get_parser
 from aider.coders import Coder
 from aider.commands import SwitchModel
@@ -361,6 +361,16 @@ def main(argv=None, input=None, output=None, force_git_root=None, return_coder=F
     if args.openai_organization_id:
         os.environ["OPENAI_ORGANIZATION"] = args.openai_organization_id
 
+    if args.completion_cache:
+        sendchat.enable_cache(ttl=args.completion_cache_ttl)
+
+    if args.trace:
+        trace.enable_trace(args.trace)
+    if args.profile:
+        profile_fname = trace.enable_profile(args.profile)
+        if profile_fname != args.profile:
+            io.tool_error(f"pyinstrument isn't installed, saving cProfile stats to {profile_fname}")
+
     main_model = models.Model(args.model, weak_model=args.weak_model)
 
     lint_cmds = parse_lint_cmds(args.lint_cmd, io)
@@ -382,8 +392,12 @@ def main(argv=None, input=None, output=None, force_git_root=None, return_coder=F
             show_diffs=args.show_diffs,
             auto_commits=args.auto_commits,
             dirty_commits=args.dirty_commits,
+            speculative_commit_messages=args.speculative_commit_messages,
             dry_run=args.dry_run,
             map_tokens=args.map_tokens,
+            map_workers=args.map_workers,
+            map_render_cache=args.map_render_cache,
+            watch_files=args.watch_files,
             verbose=args.verbose,
             assistant_output_color=args.assistant_output_color,
             code_theme=args.code_theme,
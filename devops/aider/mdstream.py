@@ -3,6 +3,7 @@
 import io
 import time
 
+from markdown_it import MarkdownIt
 from rich.console import Console
 from rich.live import Live
 from rich.markdown import Markdown
@@ -41,9 +42,17 @@ The end.
 
 
 class MarkdownStream:
+    """
+    Renders a streaming markdown reply. Top-level blocks which can no longer
+    change are rendered and printed once, so each update only re-renders the
+    trailing open block. Long fenced code blocks are frozen a chunk at a time.
+    The refresh rate backs off when rendering gets slow.
+    """
+
     live = None
     when = 0
     min_delay = 0.050
+    max_delay = 1.0
     live_window = 6
 
     def __init__(self, mdargs=None):
@@ -54,6 +63,15 @@ class MarkdownStream:
         else:
             self.mdargs = dict()
 
+        # the same parser config as rich.markdown.Markdown
+        self.parser = MarkdownIt().enable("strikethrough").enable("table")
+
+        self.delay = self.min_delay
+        self.frozen = 0  # len of the text which has been printed for good
+        self.fence = ""  # opening line of a partly frozen fenced code block
+        self.prefix = ""  # markdown to render before the unfrozen text...
+        self.skip = 0  # ... and how many lines of output it makes
+
         self.live = Live(Text(""), refresh_per_second=1.0 / self.min_delay)
         self.live.start()
 
@@ -66,19 +84,14 @@ class MarkdownStream:
 
     def update(self, text, final=False):
         now = time.time()
-        if not final and now - self.when < self.min_delay:
+        if not final and now - self.when < self.delay:
             return
-        self.when = now
 
-        string_io = io.StringIO()
-        console = Console(file=string_io, force_terminal=True)
+        start = time.perf_counter()
 
-        markdown = Markdown(text, **self.mdargs)
+        self.freeze(text)
+        lines = self.render(text[self.frozen :])
 
-        console.print(markdown)
-        output = string_io.getvalue()
-
-        lines = output.splitlines(keepends=True)
         num_lines = len(lines)
 
         if not final:
@@ -87,28 +100,121 @@ class MarkdownStream:
         if final or num_lines > 0:
             num_printed = len(self.printed)
 
-            show = num_lines - num_printed
-
-            if show <= 0:
-                return
-
-            show = lines[num_printed:num_lines]
-            show = "".join(show)
-            show = Text.from_ansi(show)
-            self.live.console.print(show)
-
-            self.printed = lines[:num_lines]
+            if num_lines > num_printed:
+                self.print_lines(lines[num_printed:num_lines])
+                self.printed = lines[:num_lines]
 
         if final:
             self.live.update(Text(""))
             self.live.stop()
             self.live = None
-        else:
-            rest = lines[num_lines:]
-            rest = "".join(rest)
-            # rest = '...\n' + rest
-            rest = Text.from_ansi(rest)
-            self.live.update(rest)
+            return
+
+        rest = lines[max(num_lines, 0) :]
+        rest = "".join(rest)
+        # rest = '...\n' + rest
+        rest = Text.from_ansi(rest)
+        self.live.update(rest)
+
+        # spend at most ~10% of the time rendering
+        elapsed = time.perf_counter() - start
+        self.delay = min(max(elapsed * 10, self.min_delay), self.max_delay)
+        self.when = time.time()
+
+    def freeze(self, text):
+        """
+        Print the top-level blocks which are followed by another block, they
+        are complete. Only whole lines are parsed, the last one may still grow.
+        """
+        pending = text[self.frozen :]
+        pending = pending[: pending.rfind("\n") + 1]
+        if not pending:
+            return
+
+        src = self.fence + pending
+        lines = src.splitlines(keepends=True)
+        offsets = [0]
+        for line in lines:
+            offsets.append(offsets[-1] + len(line))
+
+        blocks = [
+            token
+            for token in self.parser.parse(src)
+            if token.level == 0 and token.map and token.nesting != -1
+        ]
+        if not blocks:
+            return
+
+        last = blocks[-1]
+        first_line, last_line = last.map
+        start = len(self.fence)
+
+        if len(blocks) > 1:
+            self.emit(src[start : offsets[first_line]])
+            start = offsets[first_line]
+
+            element_class = Markdown.elements.get(blocks[-2].type)
+            if element_class is None or element_class.new_line:
+                # rich puts a blank line after most elements, render the rest
+                # after a dummy paragraph to get the same spacing
+                self.prefix = "x\n\n"
+                self.skip = 1
+            else:
+                self.prefix = ""
+                self.skip = 0
+
+        if last.type != "fence":
+            return
+
+        # freeze a long code block up to a blank line before an unindented
+        # line, where the highlighter is most likely in a clean state. The
+        # blank line is stripped and the padding below the code stands in for it
+        split = None
+        for num in range(last_line - self.live_window - 1, first_line + 2, -1):
+            if (
+                lines[num][:1] not in " \t\r\n"
+                and not lines[num - 1].strip()
+                and lines[num - 2].strip()
+            ):
+                split = num
+                break
+        if not split:
+            return
+
+        self.emit(src[start : offsets[split]])
+
+        self.fence = lines[first_line]
+        self.prefix = self.fence
+        self.skip = 1  # the padding line above the code
+
+    def emit(self, text):
+        """
+        Freeze the text which follows the frozen text, printing its rendering
+        less the lines already printed from above the live window.
+        """
+        lines = self.render(text)
+
+        self.print_lines(lines[len(self.printed) :])
+        self.printed = self.printed[len(lines) :]
+
+        self.frozen += len(text)
+        self.fence = ""
+
+    def render(self, text):
+        string_io = io.StringIO()
+        console = Console(file=string_io, force_terminal=True)
+
+        markdown = Markdown(self.prefix + text, **self.mdargs)
+
+        console.print(markdown)
+        output = string_io.getvalue()
+
+        return output.splitlines(keepends=True)[self.skip :]
+
+    def print_lines(self, lines):
+        show = "".join(lines)
+        show = Text.from_ansi(show)
+        self.live.console.print(show)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import json
+import math
+import time
+
+from aider.dump import dump  # noqa: F401
+
+
+def percentile(values, pct):
+    """The nearest rank percentile of values, or None if there are none"""
+    if not values:
+        return
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, math.ceil(pct * len(values) / 100) - 1))
+    return values[rank]
+
+
+class ResponseMetrics:
+    """
+    The latency and throughput of one LLM request: time to first token,
+    the gaps between streamed chunks and the output tokens per second.
+    """
+
+    def __init__(self, model, stream):
+        self.model = model
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.last_chunk = None
+        self.end = None
+        self.gaps = []
+        self.output_tokens = None
+        self.estimated = False
+        self.cost = None
+        self.error = None
+
+    def chunk(self):
+        """Call as each chunk with content arrives"""
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        else:
+            self.gaps.append(now - self.last_chunk)
+        self.last_chunk = now
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def generation_time(self):
+        if self.end is None:
+            return
+
+        # streams are timed from the first token, to measure the generation
+        start = self.first_token if self.first_token is not None else self.start
+        return self.end - start
+
+    def tokens_per_sec(self):
+        generation_time = self.generation_time()
+        if not self.output_tokens or not generation_time:
+            return
+        return self.output_tokens / generation_time
+
+    def as_dict(self):
+        def rnd(val):
+            return None if val is None else round(val, 4)
+
+        ttft = None
+        if self.first_token is not None:
+            ttft = self.first_token - self.start
+
+        return dict(
+            model=self.model,
+            stream=self.stream,
+            latency=rnd(self.end - self.start if self.end is not None else None),
+            ttft=rnd(ttft),
+            chunks=len(self.gaps) + (self.first_token is not None),
+            gap_p50=rnd(percentile(self.gaps, 50)),
+            gap_p90=rnd(percentile(self.gaps, 90)),
+            gap_p99=rnd(percentile(self.gaps, 99)),
+            output_tokens=self.output_tokens,
+            output_tokens_estimated=self.estimated,
+            tokens_per_sec=rnd(self.tokens_per_sec()),
+            cost=self.cost,
+            error=self.error,
+        )
+
+
+class SessionMetrics:
+    """The ResponseMetrics of every request this session, and their totals"""
+
+    def __init__(self):
+        self.requests = []
+        self.gaps = []
+        self.generation_time = 0.0
+        self.generated_tokens = 0
+
+    def add(self, response):
+        self.requests.append(response.as_dict())
+        self.gaps += response.gaps
+
+        if response.tokens_per_sec():
+            self.generated_tokens += response.output_tokens
+            self.generation_time += response.generation_time()
+
+    def summary(self):
+        ttfts = [req["ttft"] for req in self.requests if req["ttft"] is not None]
+        latencies = [req["latency"] for req in self.requests if req["latency"] is not None]
+
+        tokens_per_sec = None
+        if self.generation_time:
+            tokens_per_sec = self.generated_tokens / self.generation_time
+
+        return dict(
+            requests=len(self.requests),
+            errors=sum(1 for req in self.requests if req["error"]),
+            output_tokens=sum(req["output_tokens"] or 0 for req in self.requests),
+            latency_p50=percentile(latencies, 50),
+            ttft_p50=percentile(ttfts, 50),
+            ttft_p90=percentile(ttfts, 90),
+            gap_p50=percentile(self.gaps, 50),
+            gap_p90=percentile(self.gaps, 90),
+            gap_p99=percentile(self.gaps, 99),
+            tokens_per_sec=tokens_per_sec,
+        )
+
+    def to_json(self, **extra):
+        res = dict(summary=self.summary(), requests=self.requests)
+        res["summary"].update(extra)
+        return json.dumps(res, indent=4)
+
+    def format_lines(self):
+        """The summary as lines of text, for /tokens"""
+        if not self.requests:
+            return []
+
+        summary = self.summary()
+        lines = [f"{summary['requests']} LLM responses, {summary['output_tokens']:,} output tokens"]
+        if summary["errors"]:
+            lines.append(f"{summary['errors']} requests failed")
+
+        if summary["ttft_p50"] is not None:
+            lines.append(
+                f"time to first token: {summary['ttft_p50']:.2f}s median,"
+                f" {summary['ttft_p90']:.2f}s p90"
+            )
+        elif summary["latency_p50"] is not None:
+            lines.append(f"response time: {summary['latency_p50']:.2f}s median")
+
+        if summary["gap_p50"] is not None:
+            lines.append(
+                f"gaps between chunks: {summary['gap_p50'] * 1000:.0f}ms median,"
+                f" {summary['gap_p90'] * 1000:.0f}ms p90, {summary['gap_p99'] * 1000:.0f}ms p99"
+            )
+
+        if summary["tokens_per_sec"]:
+            lines.append(f"output speed: {summary['tokens_per_sec']:.1f} tokens/sec")
+
+        return lines
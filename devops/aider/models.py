@@ -1,8 +1,11 @@
 import difflib
+import hashlib
 import json
 import math
 import os
 import sys
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, fields
 from typing import Optional
 
@@ -13,6 +16,17 @@ from aider.litellm import litellm
 
 DEFAULT_MODEL_NAME = "gpt-4o"
 
+# Average utf-8 bytes per token on source code, by tokenizer family, for
+# token_count(estimate=True). Measured with benchmark/token_estimate.py.
+BYTES_PER_TOKEN = [
+    ("gpt-", 4.4),
+    ("claude", 3.85),
+]
+DEFAULT_BYTES_PER_TOKEN = 3.85
+
+# Estimates are inflated by this much, so they rarely come in under the real count
+TOKEN_ESTIMATE_MARGIN = 1.1
+
 
 @dataclass
 class ModelSettings:
@@ -235,6 +249,46 @@ MODEL_SETTINGS = [
 ]
 
 
+class TokenCountCache:
+    """
+    LRU of token counts keyed by a hash of the counted text, so unchanged
+    chat history and file contents are only tokenized once.
+    """
+
+    def __init__(self, max_size=16 * 1024):
+        self.max_size = max_size
+        self.counts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # the chat summarizer counts tokens from its own thread
+        self.lock = threading.Lock()
+
+    def count(self, text, tokenizer):
+        key = hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+
+        with self.lock:
+            num_tokens = self.counts.get(key)
+            if num_tokens is not None:
+                self.counts.move_to_end(key)
+                self.hits += 1
+                return num_tokens
+            self.misses += 1
+
+        num_tokens = len(tokenizer(text))
+
+        with self.lock:
+            self.counts[key] = num_tokens
+            while len(self.counts) > self.max_size:
+                self.counts.popitem(last=False)
+
+        return num_tokens
+
+    def stats(self):
+        total = self.hits + self.misses
+        pct = 100 * self.hits / total if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({pct:.0f}% hit rate)"
+
+
 class Model:
     name = None
 
@@ -252,6 +306,8 @@ class Model:
 
     def __init__(self, model, weak_model=None):
         self.name = model
+        self.token_cache = TokenCountCache()
+        self.bytes_per_token = get_bytes_per_token(model)
 
         # Do we have the model_info?
         try:
@@ -354,16 +410,39 @@ class Model:
     def tokenizer(self, text):
         return litellm.encode(model=self.name, text=text)
 
-    def token_count(self, messages):
+    def token_count(self, messages, estimate=False):
+        """
+        Count the tokens in a string, a message dict or a list of messages.
+        Lists are counted one message at a time and summed, so the counts of
+        unchanged messages come from the token cache. The json list syntax
+        between messages is estimated as one token each.
+
+        With estimate=True the count is approximated from the utf-8 length,
+        for threshold checks that don't need the real tokenizer.
+        """
+        if estimate:
+            return self.estimate_token_count(messages)
+
         if not self.tokenizer:
             return
 
         if type(messages) is str:
-            msgs = messages
-        else:
-            msgs = json.dumps(messages)
+            return self.token_cache.count(messages, self.tokenizer)
+
+        if type(messages) is list:
+            return sum(self.token_count(msg) for msg in messages) + len(messages)
 
-        return len(self.tokenizer(msgs))
+        return self.token_cache.count(json.dumps(messages), self.tokenizer)
+
+    def estimate_token_count(self, messages):
+        if type(messages) is list:
+            return sum(self.estimate_token_count(msg) for msg in messages) + len(messages)
+
+        if type(messages) is not str:
+            messages = json.dumps(messages)
+
+        num_bytes = len(messages.encode("utf-8", "surrogatepass"))
+        return math.ceil(num_bytes / self.bytes_per_token * TOKEN_ESTIMATE_MARGIN)
 
     def token_count_for_image(self, fname):
         """
@@ -426,6 +505,13 @@ class Model:
         return res
 
 
+def get_bytes_per_token(model):
+    for family, bytes_per_token in BYTES_PER_TOKEN:
+        if family in model:
+            return bytes_per_token
+    return DEFAULT_BYTES_PER_TOKEN
+
+
 def validate_variables(vars):
     missing = []
     for var in vars:
@@ -1,11 +1,14 @@
 import os
+import stat
+import threading
+from collections import OrderedDict
 from pathlib import Path, PurePosixPath
 
 import git
 import pathspec
 
 from aider import prompts, utils
-from aider.sendchat import simple_send_with_retries
+from aider.sendchat import simple_send_with_retries, simple_send_with_retries_async, submit
 
 from .dump import dump  # noqa: F401
 
@@ -14,11 +17,23 @@ class GitRepo:
     repo = None
     aider_ignore_file = None
     aider_ignore_spec = None
-    aider_ignore_ts = 0
+    aider_ignore_key = None
+    tracked_files = None
+    tracked_files_key = None
+    head_files = None
+    head_files_sha = None
+
+    # at most this many commit messages are generated ahead of time
+    max_commit_message_futures = 8
 
     def __init__(self, io, fnames, git_dname, aider_ignore_file=None, models=None):
         self.io = io
         self.models = models
+        self.commit_message_futures = OrderedDict()
+
+        # guards the cached tracked files and aiderignore spec, which the
+        # FileWatcher thread reloads too
+        self.tracked_files_lock = threading.RLock()
 
         if git_dname:
             check_fnames = [git_dname]
@@ -104,6 +119,71 @@ class GitRepo:
             return self.repo.git_dir
 
     def get_commit_message(self, diffs, context):
+        # use the message started ahead of time by start_commit_message(), if any
+        future = self.commit_message_futures.pop((diffs, context), None)
+        if future:
+            try:
+                commit_message = future.result()
+            except Exception:
+                commit_message = None
+            if commit_message:
+                return commit_message
+
+        messages = self.get_commit_message_messages(diffs, context)
+        if not messages:
+            return
+
+        commit_message = None
+        for model in self.models:
+            commit_message = simple_send_with_retries(model.name, messages)
+            if commit_message:
+                break
+
+        if not commit_message:
+            self.io.tool_error("Failed to generate commit message!")
+            return
+
+        return self.clean_commit_message(commit_message)
+
+    async def get_commit_message_async(self, diffs, context):
+        messages = self.get_commit_message_messages(diffs, context)
+        if not messages:
+            return
+
+        commit_message = None
+        for model in self.models:
+            commit_message = await simple_send_with_retries_async(model.name, messages)
+            if commit_message:
+                break
+
+        # errors are reported when get_commit_message() retries
+        if commit_message:
+            return self.clean_commit_message(commit_message)
+
+    def start_commit_message(self, fnames=None, context=None):
+        """
+        Start writing the commit message for the current diffs of fnames on
+        the async event loop, so the weak model works while we do something
+        else. commit() will use it if the diffs and context still match.
+        """
+        diffs = self.get_diffs(fnames)
+        if not diffs:
+            return
+
+        key = (diffs, context)
+        if key in self.commit_message_futures:
+            return
+
+        # don't print the "too large" error twice
+        if len(diffs) >= 4 * 1024 * 4:
+            return
+
+        future = submit(self.get_commit_message_async(diffs, context))
+        self.commit_message_futures[key] = future
+        while len(self.commit_message_futures) > self.max_commit_message_futures:
+            self.commit_message_futures.popitem(last=False)
+
+    def get_commit_message_messages(self, diffs, context):
         if len(diffs) >= 4 * 1024 * 4:
             self.io.tool_error("Diff is too large to generate a commit message.")
             return
@@ -119,16 +199,9 @@ class GitRepo:
             dict(role="system", content=prompts.commit_system),
             dict(role="user", content=content),
         ]
+        return messages
 
-        for model in self.models:
-            commit_message = simple_send_with_retries(model.name, messages)
-            if commit_message:
-                break
-
-        if not commit_message:
-            self.io.tool_error("Failed to generate commit message!")
-            return
-
+    def clean_commit_message(self, commit_message):
         commit_message = commit_message.strip()
         if commit_message and commit_message[0] == '"' and commit_message[-1] == '"':
             commit_message = commit_message[1:-1].strip()
@@ -184,35 +257,96 @@ class GitRepo:
         if not self.repo:
             return []
 
+        return list(self.get_tracked_files_set())
+
+    def get_tracked_files_set(self):
+        """
+        The tracked files only change when HEAD moves, the index is rewritten
+        or the aiderignore file is edited. So they are cached and only
+        reloaded when get_tracked_files_key() changes. Returns a frozenset,
+        so callers can't change the cache.
+        """
+        with self.tracked_files_lock:
+            key = self.get_tracked_files_key()
+            if key != self.tracked_files_key:
+                self.tracked_files = frozenset(self.load_tracked_files(key[0]))
+                self.tracked_files_key = key
+
+            return self.tracked_files
+
+    def get_tracked_files_key(self):
         try:
-            commit = self.repo.head.commit
+            head_sha = self.repo.head.commit.hexsha
         except ValueError:
-            commit = None
-
-        files = []
-        if commit:
-            for blob in commit.tree.traverse():
-                if blob.type == "blob":  # blob is a file
-                    files.append(blob.path)
+            head_sha = None
+
+        index_fname = os.path.join(self.repo.git_dir, "index")
+        return (head_sha, get_stat_key(index_fname), self.get_aider_ignore_key())
+
+    def load_tracked_files(self, head_sha):
+        # the HEAD tree is only traversed again once HEAD moves
+        if head_sha != self.head_files_sha or self.head_files is None:
+            files = set()
+            if head_sha:
+                commit = self.repo.commit(head_sha)
+                for blob in commit.tree.traverse():
+                    if blob.type == "blob":  # blob is a file
+                        files.add(blob.path)
+            self.head_files = files
+            self.head_files_sha = head_sha
 
         # Add staged files
         index = self.repo.index
         staged_files = [path for path, _ in index.entries.keys()]
 
-        files.extend(staged_files)
+        files = self.head_files.union(staged_files)
 
         # convert to appropriate os.sep, since git always normalizes to /
-        res = set(self.normalize_path(path) for path in files)
+        res = set(self.normalize_git_path(path) for path in files)
 
-        res = [fname for fname in res if not self.ignored_file(fname)]
+        aider_ignore_spec = self.load_aider_ignore()
+        if aider_ignore_spec:
+            res = set(fname for fname in res if not aider_ignore_spec.match_file(fname))
 
         return res
 
+    def normalize_git_path(self, path):
+        """Like normalize_path(), for the clean relative posix paths that git returns"""
+        if os.sep == "/":
+            return path
+        return str(Path(PurePosixPath(path)))
+
     def normalize_path(self, path):
         return str(Path(PurePosixPath((Path(self.root) / path).relative_to(self.root))))
 
+    def get_aider_ignore_key(self):
+        if not self.aider_ignore_file:
+            return
+        return get_stat_key(self.aider_ignore_file)
+
+    def load_aider_ignore(self):
+        """(Re)load the aiderignore spec if the file changed, returns the spec or None"""
+        with self.tracked_files_lock:
+            key = self.get_aider_ignore_key()
+            if key is None:
+                self.aider_ignore_spec = None
+                self.aider_ignore_key = None
+                return
+
+            if key != self.aider_ignore_key:
+                lines = self.aider_ignore_file.read_text().splitlines()
+                # the key is only set once the spec it belongs to is ready
+                self.aider_ignore_spec = pathspec.PathSpec.from_lines(
+                    pathspec.patterns.GitWildMatchPattern,
+                    lines,
+                )
+                self.aider_ignore_key = key
+
+            return self.aider_ignore_spec
+
     def ignored_file(self, fname):
-        if not self.aider_ignore_file or not self.aider_ignore_file.is_file():
+        aider_ignore_spec = self.load_aider_ignore()
+        if not aider_ignore_spec:
             return
 
         try:
@@ -220,23 +354,13 @@ class GitRepo:
         except ValueError:
             return
 
-        mtime = self.aider_ignore_file.stat().st_mtime
-        if mtime != self.aider_ignore_ts:
-            self.aider_ignore_ts = mtime
-            lines = self.aider_ignore_file.read_text().splitlines()
-            self.aider_ignore_spec = pathspec.PathSpec.from_lines(
-                pathspec.patterns.GitWildMatchPattern,
-                lines,
-            )
-
-        return self.aider_ignore_spec.match_file(fname)
+        return aider_ignore_spec.match_file(fname)
 
     def path_in_repo(self, path):
         if not self.repo:
             return
 
-        tracked_files = set(self.get_tracked_files())
-        return self.normalize_path(path) in tracked_files
+        return self.normalize_path(path) in self.get_tracked_files_set()
 
     def abs_root_path(self, path):
         res = Path(self.root) / path
@@ -264,3 +388,16 @@ class GitRepo:
             return True
 
         return self.repo.is_dirty(path=path)
+
+
+def get_stat_key(fname):
+    """(mtime, size) of fname, or None if it isn't a regular file"""
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return
+
+    if not stat.S_ISREG(st.st_mode):
+        return
+
+    return (st.st_mtime_ns, st.st_size)
@@ -1,37 +1,101 @@
 import colorsys
+import fnmatch
+import functools
+import hashlib
 import os
 import random
 import sys
 import warnings
-from collections import Counter, defaultdict, namedtuple
+from array import array
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from importlib import resources
 from pathlib import Path
 
 import networkx as nx
+import numpy as np
 from diskcache import Cache
 from grep_ast import TreeContext, filename_to_lang
-from pygments.lexers import guess_lexer_for_filename
+from pygments.lexers import find_lexer_class, get_all_lexers, guess_lexer_for_filename
 from pygments.token import Token
 from pygments.util import ClassNotFound
+from scipy import sparse
 from tqdm import tqdm
 
 # tree_sitter is throwing a FutureWarning
 warnings.simplefilter("ignore", category=FutureWarning)
 from tree_sitter_languages import get_language, get_parser  # noqa: E402
 
+from aider import trace  # noqa: E402
 from aider.dump import dump  # noqa: F402,E402
+from aider.utils import get_mtimes  # noqa: E402
 
 Tag = namedtuple("Tag", "rel_fname fname line name kind".split())
 
 
+class RenderCache:
+    """
+    Bounded LRU of rendered file snippets which lives across chat turns.
+    When given a path it is backed by a diskcache, so it also survives
+    across sessions.
+    """
+
+    def __init__(self, max_size, path=None):
+        self.max_size = max_size
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            self.disk = Cache(
+                path, size_limit=64 * 1024 * 1024, eviction_policy="least-recently-used"
+            )
+        else:
+            self.disk = None
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        if self.disk is not None:
+            res = self.disk.get(key)
+            if res is not None:
+                self.remember(key, res)
+                self.hits += 1
+                return res
+
+        self.misses += 1
+
+    def set(self, key, value):
+        self.remember(key, value)
+        if self.disk is not None:
+            self.disk[key] = value
+
+    def remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+
 class RepoMap:
-    CACHE_VERSION = 3
+    CACHE_VERSION = 4
     TAGS_CACHE_DIR = f".aider.tags.cache.v{CACHE_VERSION}"
+    RENDER_CACHE_DIR = f".aider.render.cache.v{CACHE_VERSION}"
+
+    render_cache_size = 4096
 
     cache_missing = False
 
     warned_files = set()
 
+    map_batch_size = 64
+
+    # pagerank_networkx() is kept as the reference implementation
+    sparse_ranking = True
+
     def __init__(
         self,
         map_tokens=1024,
@@ -41,6 +105,10 @@ class RepoMap:
         repo_content_prefix=None,
         verbose=False,
         max_context_window=None,
+        map_workers=1,
+        estimate_map_tokens=True,
+        render_cache_disk=False,
+        cache_mtimes=False,
     ):
         self.io = io
         self.verbose = verbose
@@ -50,10 +118,21 @@ class RepoMap:
         self.root = root
 
         self.load_tags_cache()
+        self.load_render_cache(render_cache_disk)
+        self.reset_symbol_index()
 
         self.max_map_tokens = map_tokens
         self.max_context_window = max_context_window
 
+        if not map_workers:
+            map_workers = os.cpu_count() or 1
+        self.map_workers = map_workers
+        self.estimate_map_tokens = estimate_map_tokens
+
+        # mtimes are only remembered between calls when something (like the
+        # file watcher) tells us which files changed
+        self.mtime_cache = dict() if cache_mtimes else None
+
         self.token_count = main_model.token_count
         self.repo_content_prefix = repo_content_prefix
 
@@ -94,6 +173,10 @@ class RepoMap:
         num_tokens = self.token_count(files_listing)
         if self.verbose:
             self.io.tool_output(f"Repo-map: {num_tokens/1024:.1f} k-tokens")
+            self.io.tool_output(
+                f"Repo-map render cache: {self.tree_cache.hits} hits,"
+                f" {self.tree_cache.misses} misses"
+            )
 
         if chat_files:
             other = "other "
@@ -116,6 +199,13 @@ class RepoMap:
         path = os.path.relpath(path, self.root)
         return [path + ":"]
 
+    def load_render_cache(self, render_cache_disk):
+        path = None
+        if render_cache_disk:
+            path = Path(self.root) / self.RENDER_CACHE_DIR
+        self.tree_cache = RenderCache(self.render_cache_size, path)
+        self.content_hashes = dict()
+
     def load_tags_cache(self):
         path = Path(self.root) / self.TAGS_CACHE_DIR
         if not path.exists():
@@ -132,18 +222,25 @@ class RepoMap:
             self.io.tool_error(f"File not found error: {fname}")
 
     def get_tags(self, fname, rel_fname):
+        record = self.get_tags_record(fname, rel_fname)
+        if record is None:
+            return []
+        return unpack_tags(record, rel_fname, fname)
+
+    def get_tags_record(self, fname, rel_fname):
         # Check if the file is in the cache and if the modification time has not changed
         file_mtime = self.get_mtime(fname)
         if file_mtime is None:
-            return []
+            return
 
         cache_key = fname
-        if cache_key in self.TAGS_CACHE and self.TAGS_CACHE[cache_key]["mtime"] == file_mtime:
-            return self.TAGS_CACHE[cache_key]["data"]
+        cached = self.TAGS_CACHE.get(cache_key)
+        if cached and cached["mtime"] == file_mtime:
+            return cached["data"]
 
         # miss!
 
-        data = list(self.get_tags_raw(fname, rel_fname))
+        data = pack_tags(self.get_tags_raw(fname, rel_fname))
 
         # Update the cache
         self.TAGS_CACHE[cache_key] = {"mtime": file_mtime, "data": data}
@@ -155,84 +252,229 @@ class RepoMap:
         if not lang:
             return
 
-        language = get_language(lang)
-        parser = get_parser(lang)
-
-        # Load the tags queries
-        try:
-            scm_fname = resources.files(__package__).joinpath(
-                "queries", f"tree-sitter-{lang}-tags.scm"
-            )
-        except KeyError:
-            return
-        query_scm = scm_fname
-        if not query_scm.exists():
+        if not get_lang_tagger(lang):
             return
-        query_scm = query_scm.read_text()
 
         code = self.io.read_text(fname)
         if not code:
             return
-        tree = parser.parse(bytes(code, "utf-8"))
 
-        # Run the tags queries
-        query = language.query(query_scm)
-        captures = query.captures(tree.root_node)
+        yield from get_tags_from_code(fname, rel_fname, lang, code)
 
-        captures = list(captures)
+    def get_mtimes(self, fnames):
+        """
+        Return {fname: mtime} for the fnames which are regular files. With
+        cache_mtimes, only the fnames not seen before or invalidated since
+        are statted, the caller is responsible for calling invalidate().
+        """
+        if self.mtime_cache is None:
+            return get_mtimes(fnames)
 
-        saw = set()
-        for node, tag in captures:
-            if tag.startswith("name.definition."):
-                kind = "def"
-            elif tag.startswith("name.reference."):
-                kind = "ref"
+        mtimes = dict()
+        unknown = []
+        for fname in fnames:
+            mtime = self.mtime_cache.get(fname)
+            if mtime is None:
+                unknown.append(fname)
             else:
-                continue
-
-            saw.add(kind)
+                mtimes[fname] = mtime
 
-            result = Tag(
-                rel_fname=rel_fname,
-                fname=fname,
-                name=node.text.decode("utf-8"),
-                kind=kind,
-                line=node.start_point[0],
-            )
+        if unknown:
+            fresh = get_mtimes(unknown)
+            self.mtime_cache.update(fresh)
+            mtimes.update(fresh)
 
-            yield result
+        return mtimes
 
-        if "ref" in saw:
-            return
-        if "def" not in saw:
+    def invalidate(self, fnames):
+        """Forget the cached mtimes of fnames, which have changed on disk"""
+        if self.mtime_cache is None:
             return
 
-        # We saw defs, without any refs
-        # Some tags files only provide defs (cpp, for example)
-        # Use pygments to backfill refs
+        for fname in fnames:
+            self.mtime_cache.pop(fname, None)
+
+    def get_cached_tags(self, fnames, mtimes):
+        """
+        Fetch the cached tag records of every fname whose cache entry is
+        fresh, reading them all inside one cache transaction.
+        """
+        res = dict()
+        with self.TAGS_CACHE.transact():
+            for fname in fnames:
+                cached = self.TAGS_CACHE.get(fname)
+                if cached and cached["mtime"] == mtimes[fname]:
+                    res[fname] = cached["data"]
+        return res
 
-        try:
-            lexer = guess_lexer_for_filename(fname, code)
-        except ClassNotFound:
-            return
+    def get_tags_bulk(self, fnames, mtimes):
+        """
+        Return {fname: tag record} for fnames. Fresh entries come from the
+        tags cache in bulk, the misses are parsed (in parallel with
+        map_workers) and written back into the cache.
+        """
+        res = self.get_cached_tags(fnames, mtimes)
+        misses = [fname for fname in fnames if fname not in res]
+        if not misses:
+            return res
+
+        if self.map_workers > 1 and len(misses) > self.map_batch_size:
+            res.update(self.get_tags_parallel(misses, mtimes))
+            return res
 
-        tokens = list(lexer.get_tokens(code))
-        tokens = [token[1] for token in tokens if token[0] in Token.Name]
+        if self.cache_missing:
+            misses = tqdm(misses)
 
-        for token in tokens:
-            yield Tag(
-                rel_fname=rel_fname,
-                fname=fname,
-                name=token,
-                kind="ref",
-                line=-1,
-            )
+        for fname in misses:
+            data = pack_tags(self.get_tags_raw(fname, self.get_rel_fname(fname)))
+            self.TAGS_CACHE[fname] = {"mtime": mtimes[fname], "data": data}
+            res[fname] = data
 
-    def get_ranked_tags(self, chat_fnames, other_fnames, mentioned_fnames, mentioned_idents):
-        defines = defaultdict(set)
-        references = defaultdict(list)
-        definitions = defaultdict(set)
+        self.save_tags_cache()
+        return res
+
+    def get_tags_parallel(self, fnames, mtimes):
+        """
+        Parse fnames spreading the work over a pool of processes. The results
+        are written back into TAGS_CACHE and returned as {fname: tag record}.
+        """
+        res = dict()
+        batches = []
+        batch = []
+        for fname in fnames:
+            rel_fname = self.get_rel_fname(fname)
+
+            lang = filename_to_lang(fname)
+            code = None
+            if lang and get_lang_tagger(lang):
+                code = self.io.read_text(fname)
+
+            if not code:
+                data = pack_tags([])
+                self.TAGS_CACHE[fname] = {"mtime": mtimes[fname], "data": data}
+                res[fname] = data
+                continue
+
+            batch.append((fname, rel_fname, lang, code))
+            if len(batch) >= self.map_batch_size:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+
+        if not batches:
+            return res
+
+        progress = None
+        if self.cache_missing:
+            progress = tqdm(total=sum(len(batch) for batch in batches))
+
+        with ProcessPoolExecutor(max_workers=self.map_workers) as executor:
+            futures = {executor.submit(get_tags_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                for job, data in zip(batch, future.result()):
+                    fname = job[0]
+                    self.TAGS_CACHE[fname] = {"mtime": mtimes[fname], "data": data}
+                    res[fname] = data
+                if progress:
+                    progress.update(len(batch))
+
+        if progress:
+            progress.close()
+
+        return res
+
+    def reset_symbol_index(self):
+        # fname -> (mtime, rel_fname, def names, ref names) for every indexed file
+        self.file_index = dict()
+
+        # ident -> set of rel_fnames that define it
+        self.defines = defaultdict(set)
+        # ident -> Counter of rel_fname -> number of references
+        self.references = defaultdict(Counter)
+        # (rel_fname, ident) -> set of def Tags
+        self.definitions = defaultdict(set)
+
+        # bumped whenever defines/references change, invalidates the graph
+        self.index_generation = 0
+        self.ranking_graph = None
+        self.ranking_graph_key = None
+        self.last_ranked = None
+
+    def is_indexed(self, fname, file_mtime):
+        entry = self.file_index.get(fname)
+        return entry is not None and entry[0] == file_mtime
+
+    def index_file(self, fname, rel_fname, file_mtime=None, record=None):
+        """Add fname's defs and refs to the symbol index, unless its mtime is unchanged"""
+        if file_mtime is None:
+            file_mtime = self.get_mtime(fname)
 
+        if self.is_indexed(fname, file_mtime):
+            return
+
+        if fname in self.file_index:
+            self.unindex_file(fname)
+
+        if record is None:
+            record = self.get_tags_record(fname, rel_fname) or pack_tags([])
+
+        names, name_ids, kinds, lines = iter_tags_record(record)
+
+        # Only the defs need real Tags, refs are just counted by name
+        def_names = set()
+        ref_counts = Counter()
+        for name_id, kind, line in zip(name_ids, kinds, lines):
+            name = names[name_id]
+            if kind == DEF:
+                self.defines[name].add(rel_fname)
+                self.definitions[(rel_fname, name)].add(
+                    Tag(rel_fname=rel_fname, fname=fname, line=line, name=name, kind="def")
+                )
+                def_names.add(name)
+            else:
+                ref_counts[name] += 1
+
+        for name, num_refs in ref_counts.items():
+            self.references[name][rel_fname] += num_refs
+        ref_names = set(ref_counts)
+
+        self.file_index[fname] = (file_mtime, rel_fname, def_names, ref_names)
+        self.index_generation += 1
+
+    def unindex_file(self, fname):
+        """Remove all of fname's contributions from the symbol index"""
+        _mtime, rel_fname, def_names, ref_names = self.file_index.pop(fname)
+
+        for name in def_names:
+            definers = self.defines[name]
+            definers.discard(rel_fname)
+            if not definers:
+                del self.defines[name]
+            self.definitions.pop((rel_fname, name), None)
+
+        for name in ref_names:
+            referencers = self.references[name]
+            del referencers[rel_fname]
+            if not referencers:
+                del self.references[name]
+
+        self.index_generation += 1
+
+    def get_ranking_graph(self, defines, references, idents, mentioned_idents):
+        """Reuse the sparse graph from the last turn if no file or mention changed"""
+        mentioned_idents = frozenset(ident for ident in mentioned_idents if ident in idents)
+        key = (self.index_generation, mentioned_idents, references is self.references)
+        if self.ranking_graph is not None and key == self.ranking_graph_key:
+            return self.ranking_graph
+
+        self.ranking_graph = build_sparse_graph(defines, references, idents, mentioned_idents)
+        self.ranking_graph_key = key
+        return self.ranking_graph
+
+    @trace.traced("repomap.get_ranked_tags")
+    def get_ranked_tags(self, chat_fnames, other_fnames, mentioned_fnames, mentioned_idents):
         personalization = dict()
 
         fnames = set(chat_fnames).union(set(other_fnames))
@@ -244,12 +486,21 @@ class RepoMap:
         # https://networkx.org/documentation/stable/_modules/networkx/algorithms/link_analysis/pagerank_alg.html#pagerank
         personalize = 10 / len(fnames)
 
-        if self.cache_missing:
-            fnames = tqdm(fnames)
+        tags_start = trace.now()
+        mtimes = self.get_mtimes(fnames)
+
+        # Only files that changed since the last turn need their tags
+        stale_fnames = [
+            fname
+            for fname in fnames
+            if fname in mtimes and not self.is_indexed(fname, mtimes[fname])
+        ]
+        stale_tags = self.get_tags_bulk(stale_fnames, mtimes)
         self.cache_missing = False
 
+        indexed_fnames = set()
         for fname in fnames:
-            if not Path(fname).is_file():
+            if fname not in mtimes:
                 if fname not in self.warned_files:
                     if Path(fname).exists():
                         self.io.tool_error(
@@ -271,18 +522,18 @@ class RepoMap:
             if fname in mentioned_fnames:
                 personalization[rel_fname] = personalize
 
-            tags = list(self.get_tags(fname, rel_fname))
-            if tags is None:
-                continue
+            self.index_file(fname, rel_fname, mtimes[fname], stale_tags.get(fname))
+            indexed_fnames.add(fname)
+
+        # forget files which are no longer part of the map
+        for fname in set(self.file_index) - indexed_fnames:
+            self.unindex_file(fname)
 
-            for tag in tags:
-                if tag.kind == "def":
-                    defines[tag.name].add(rel_fname)
-                    key = (rel_fname, tag.name)
-                    definitions[key].add(tag)
+        trace.complete("repomap.tags", tags_start, files=len(fnames), stale=len(stale_fnames))
 
-                if tag.kind == "ref":
-                    references[tag.name].append(rel_fname)
+        defines = self.defines
+        references = self.references
+        definitions = self.definitions
 
         ##
         # dump(defines)
@@ -294,43 +545,27 @@ class RepoMap:
 
         idents = set(defines.keys()).intersection(set(references.keys()))
 
-        G = nx.MultiDiGraph()
-
-        for ident in idents:
-            definers = defines[ident]
-            if ident in mentioned_idents:
-                mul = 10
-            else:
-                mul = 1
-            for referencer, num_refs in Counter(references[ident]).items():
-                for definer in definers:
-                    # if referencer == definer:
-                    #    continue
-                    G.add_edge(referencer, definer, weight=mul * num_refs, ident=ident)
-
-        if not references:
-            pass
-
         if personalization:
             pers_args = dict(personalization=personalization, dangling=personalization)
         else:
             pers_args = dict()
 
+        ranking_start = trace.now()
         try:
-            ranked = nx.pagerank(G, weight="weight", **pers_args)
+            if self.sparse_ranking:
+                graph = self.get_ranking_graph(defines, references, idents, mentioned_idents)
+                ranked, ranked_definitions = rank_sparse_graph(
+                    graph, nstart=self.last_ranked, **pers_args
+                )
+            else:
+                ranked, ranked_definitions = pagerank_networkx(
+                    defines, references, idents, mentioned_idents, **pers_args
+                )
         except ZeroDivisionError:
             return []
 
-        # distribute the rank from each source node, across all of its out edges
-        ranked_definitions = defaultdict(float)
-        for src in G.nodes:
-            src_rank = ranked[src]
-            total_weight = sum(data["weight"] for _src, _dst, data in G.out_edges(src, data=True))
-            # dump(src, src_rank, total_weight)
-            for _src, dst, data in G.out_edges(src, data=True):
-                data["rank"] = src_rank * data["weight"] / total_weight
-                ident = data["ident"]
-                ranked_definitions[(dst, ident)] += data["rank"]
+        self.last_ranked = ranked
+        trace.complete("repomap.ranking", ranking_start, idents=len(idents))
 
         ranked_tags = []
         ranked_definitions = sorted(ranked_definitions.items(), reverse=True, key=lambda x: x[1])
@@ -359,6 +594,7 @@ class RepoMap:
 
         return ranked_tags
 
+    @trace.traced("repomap.get_ranked_tags_map")
     def get_ranked_tags_map(
         self,
         chat_fnames,
@@ -383,22 +619,62 @@ class RepoMap:
         num_tags = len(ranked_tags)
         lower_bound = 0
         upper_bound = num_tags
-        best_tree = None
-        best_tree_tokens = 0
 
         chat_rel_fnames = [self.get_rel_fname(fname) for fname in chat_fnames]
 
         # Guess a small starting number to help with giant repos
         middle = min(max_map_tokens // 25, num_tags)
 
-        self.tree_cache = dict()
+        self.block_tokens_cache = dict()
+
+        def count_tokens(tags):
+            return self.token_count(self.to_tree(tags, chat_rel_fnames))
+
+        if self.estimate_map_tokens:
+
+            def estimate_tokens(tags):
+                return self.estimate_tree_tokens(tags, chat_rel_fnames)
+
+            best = self.search_map_size(
+                ranked_tags, max_map_tokens, lower_bound, upper_bound, middle, estimate_tokens
+            )
+
+            # If nothing fits by the estimate, which runs high, a map may
+            # still fit with exact counts, so search them all again below
+            if best is not None:
+                # One real tokenization to confirm the estimate fits
+                best_tree = self.to_tree(ranked_tags[:best], chat_rel_fnames)
+                if self.token_count(best_tree) < max_map_tokens:
+                    return best_tree
+
+                # The estimate was too low, finish the search below it with exact counts
+                upper_bound = best - 1
+                middle = upper_bound // 2
+
+        best = self.search_map_size(
+            ranked_tags, max_map_tokens, lower_bound, upper_bound, middle, count_tokens
+        )
+        if best is None:
+            return
+
+        return self.to_tree(ranked_tags[:best], chat_rel_fnames)
+
+    @trace.traced("repomap.search_map_size")
+    def search_map_size(
+        self, ranked_tags, max_map_tokens, lower_bound, upper_bound, middle, count_tokens
+    ):
+        """
+        Binary search for the longest prefix of ranked_tags that fits in
+        max_map_tokens, according to count_tokens(). Returns the prefix length.
+        """
+        best = None
+        best_tree_tokens = 0
 
         while lower_bound <= upper_bound:
-            tree = self.to_tree(ranked_tags[:middle], chat_rel_fnames)
-            num_tokens = self.token_count(tree)
+            num_tokens = count_tokens(ranked_tags[:middle])
 
             if num_tokens < max_map_tokens and num_tokens > best_tree_tokens:
-                best_tree = tree
+                best = middle
                 best_tree_tokens = num_tokens
 
             if num_tokens < max_map_tokens:
@@ -408,17 +684,64 @@ class RepoMap:
 
             middle = (lower_bound + upper_bound) // 2
 
-        return best_tree
+        return best
+
+    def estimate_tree_tokens(self, tags, chat_rel_fnames):
+        """
+        Estimate token_count(to_tree(tags)) as the sum of the estimated token
+        counts of each file's block. Block counts are cached, so each probe of
+        the binary search only looks at the blocks it hasn't seen yet.
+        """
+        if not tags:
+            return 0
 
-    tree_cache = dict()
+        num_tokens = 0
+        for rel_fname, abs_fname, lois in self.group_tags(tags, chat_rel_fnames):
+            if lois is None:
+                key = (rel_fname,)
+            else:
+                key = (rel_fname, tuple(sorted(lois)))
 
-    def render_tree(self, abs_fname, rel_fname, lois):
-        key = (rel_fname, tuple(sorted(lois)))
+            block_tokens = self.block_tokens_cache.get(key)
+            if block_tokens is None:
+                block = self.render_block(rel_fname, abs_fname, lois)
+                block = "\n".join([line[:100] for line in block.splitlines()]) + "\n"
+                block_tokens = self.token_count(block, estimate=True)
+                self.block_tokens_cache[key] = block_tokens
+
+            num_tokens += block_tokens
+
+        return num_tokens
 
-        if key in self.tree_cache:
-            return self.tree_cache[key]
+    def get_content_hash(self, abs_fname):
+        """sha1 of the file's content, only re-read when its mtime changes"""
+        if self.mtime_cache is not None and abs_fname in self.mtime_cache:
+            file_mtime = self.mtime_cache[abs_fname]
+        else:
+            try:
+                file_mtime = os.path.getmtime(abs_fname)
+            except OSError:
+                file_mtime = None
+
+        entry = self.content_hashes.get(abs_fname)
+        if entry and file_mtime is not None and entry[0] == file_mtime:
+            return entry[1], None
 
         code = self.io.read_text(abs_fname) or ""
+        content_hash = hashlib.sha1(code.encode("utf-8")).hexdigest()
+        self.content_hashes[abs_fname] = (file_mtime, content_hash)
+        return content_hash, code
+
+    def render_tree(self, abs_fname, rel_fname, lois):
+        content_hash, code = self.get_content_hash(abs_fname)
+        key = (rel_fname, content_hash, tuple(sorted(lois)))
+
+        res = self.tree_cache.get(key)
+        if res is not None:
+            return res
+
+        if code is None:
+            code = self.io.read_text(abs_fname) or ""
         if not code.endswith("\n"):
             code += "\n"
 
@@ -439,20 +762,26 @@ class RepoMap:
         context.add_lines_of_interest(lois)
         context.add_context()
         res = context.format()
-        self.tree_cache[key] = res
+        self.tree_cache.set(key, res)
         return res
 
-    def to_tree(self, tags, chat_rel_fnames):
-        if not tags:
-            return ""
+    def render_block(self, rel_fname, abs_fname, lois):
+        if lois is None:
+            return "\n" + rel_fname + "\n"
+
+        return "\n" + rel_fname + ":\n" + self.render_tree(abs_fname, rel_fname, lois)
 
+    def group_tags(self, tags, chat_rel_fnames):
+        """
+        Group the tags by file, yielding (rel_fname, abs_fname, lois). Files
+        which only have a bare (rel_fname,) entry get lois of None.
+        """
         tags = [tag for tag in tags if tag[0] not in chat_rel_fnames]
         tags = sorted(tags)
 
         cur_fname = None
         cur_abs_fname = None
         lois = None
-        output = ""
 
         # add a bogus tag at the end so we trip the this_fname != cur_fname...
         dummy_tag = (None,)
@@ -462,12 +791,10 @@ class RepoMap:
             # ... here ... to output the final real entry in the list
             if this_rel_fname != cur_fname:
                 if lois is not None:
-                    output += "\n"
-                    output += cur_fname + ":\n"
-                    output += self.render_tree(cur_abs_fname, cur_fname, lois)
+                    yield cur_fname, cur_abs_fname, lois
                     lois = None
                 elif cur_fname:
-                    output += "\n" + cur_fname + "\n"
+                    yield cur_fname, None, None
                 if type(tag) is Tag:
                     lois = []
                     cur_abs_fname = tag.fname
@@ -476,12 +803,384 @@ class RepoMap:
             if lois is not None:
                 lois.append(tag.line)
 
+    @trace.traced("repomap.to_tree")
+    def to_tree(self, tags, chat_rel_fnames):
+        if not tags:
+            return ""
+
+        output = ""
+        for rel_fname, abs_fname, lois in self.group_tags(tags, chat_rel_fnames):
+            output += self.render_block(rel_fname, abs_fname, lois)
+
         # truncate long lines, in case we get minified js or something else crazy
         output = "\n".join([line[:100] for line in output.splitlines()]) + "\n"
 
         return output
 
 
+def get_scm_fname(lang):
+    # Load the tags queries
+    try:
+        scm_fname = resources.files(__package__).joinpath(
+            "queries", f"tree-sitter-{lang}-tags.scm"
+        )
+    except KeyError:
+        return
+    if not scm_fname.exists():
+        return
+    return scm_fname
+
+
+LangTagger = namedtuple("LangTagger", "lang parser query lexers")
+
+# Per-process registry of the parser, compiled tags query and pygments
+# lexers for each language, so they are built once instead of once per file
+LANG_TAGGERS = dict()
+
+
+def get_lang_tagger(lang):
+    if lang in LANG_TAGGERS:
+        return LANG_TAGGERS[lang]
+
+    tagger = None
+    query_scm = get_scm_fname(lang)
+    if query_scm:
+        language = get_language(lang)
+        tagger = LangTagger(
+            lang=lang,
+            parser=get_parser(lang),
+            query=language.query(query_scm.read_text()),
+            lexers=dict(),
+        )
+
+    LANG_TAGGERS[lang] = tagger
+    return tagger
+
+
+def get_fallback_lexer(tagger, fname, code):
+    # Lexers are remembered per file extension, unless several pygments
+    # lexers claim it (.h is C or Objective-C). Then guess_lexer_for_filename()
+    # picks one by content, so each file has to be guessed.
+    ext = os.path.splitext(fname)[1]
+    if ext in tagger.lexers:
+        return tagger.lexers[ext]
+
+    try:
+        lexer = guess_lexer_for_filename(fname, code)
+    except ClassNotFound:
+        lexer = None
+
+    if ext and count_lexers_for_ext(ext) <= 1:
+        tagger.lexers[ext] = lexer
+    return lexer
+
+
+@functools.lru_cache(maxsize=None)
+def count_lexers_for_ext(ext):
+    """The number of pygments lexers guess_lexer_for_filename() considers for ext"""
+    fname = "x" + ext
+    count = 0
+    for name, *_ in get_all_lexers():
+        lexer_class = find_lexer_class(name)
+        patterns = list(lexer_class.filenames) + list(lexer_class.alias_filenames)
+        if any(fnmatch.fnmatch(fname, pattern) for pattern in patterns):
+            count += 1
+    return count
+
+
+def get_tags_from_code(fname, rel_fname, lang, code):
+    tagger = get_lang_tagger(lang)
+    if not tagger:
+        return
+
+    tree = tagger.parser.parse(bytes(code, "utf-8"))
+
+    # Run the tags queries
+    captures = tagger.query.captures(tree.root_node)
+
+    captures = list(captures)
+
+    saw = set()
+    for node, tag in captures:
+        if tag.startswith("name.definition."):
+            kind = "def"
+        elif tag.startswith("name.reference."):
+            kind = "ref"
+        else:
+            continue
+
+        saw.add(kind)
+
+        result = Tag(
+            rel_fname=rel_fname,
+            fname=fname,
+            name=node.text.decode("utf-8"),
+            kind=kind,
+            line=node.start_point[0],
+        )
+
+        yield result
+
+    if "ref" in saw:
+        return
+    if "def" not in saw:
+        return
+
+    # We saw defs, without any refs
+    # Some tags files only provide defs (cpp, for example)
+    # Use pygments to backfill refs
+
+    lexer = get_fallback_lexer(tagger, fname, code)
+    if not lexer:
+        return
+
+    tokens = list(lexer.get_tokens(code))
+    tokens = [token[1] for token in tokens if token[0] in Token.Name]
+
+    for token in tokens:
+        yield Tag(
+            rel_fname=rel_fname,
+            fname=fname,
+            name=token,
+            kind="ref",
+            line=-1,
+        )
+
+
+def get_tags_batch(batch):
+    """Process pool worker, parses a batch of (fname, rel_fname, lang, code) jobs"""
+    return [pack_tags(get_tags_from_code(*job)) for job in batch]
+
+
+# Tag kinds, as stored in the kinds array of a tags record
+DEF = 0
+REF = 1
+TAG_KINDS = ("def", "ref")
+
+
+def pack_tags(tags):
+    """
+    Pack a file's Tags into a compact cache record: a table of the distinct
+    names in the file, and parallel (name id, kind, line) arrays stored as
+    bytes. The rel_fname and fname are implied by the cache key.
+    """
+    name_table = dict()
+    name_ids = array("I")
+    kinds = array("B")
+    lines = array("i")
+
+    for tag in tags:
+        name_ids.append(name_table.setdefault(tag.name, len(name_table)))
+        kinds.append(DEF if tag.kind == "def" else REF)
+        lines.append(tag.line)
+
+    return (tuple(name_table), name_ids.tobytes(), kinds.tobytes(), lines.tobytes())
+
+
+def iter_tags_record(record):
+    """
+    Return (names, name_ids, kinds, lines) views of a tags record, without
+    copying the arrays. Names are interned so they are shared across files.
+    """
+    names, name_ids, kinds, lines = record
+    names = tuple(map(sys.intern, names))
+    return names, memoryview(name_ids).cast("I"), memoryview(kinds), memoryview(lines).cast("i")
+
+
+def unpack_tags(record, rel_fname, fname):
+    names, name_ids, kinds, lines = iter_tags_record(record)
+    return [
+        Tag(rel_fname=rel_fname, fname=fname, line=line, name=names[name_id], kind=TAG_KINDS[kind])
+        for name_id, kind, line in zip(name_ids, kinds, lines)
+    ]
+
+
+def get_ident_edges(defines, references, idents, mentioned_idents):
+    """
+    Yield a (referencer, definer, weight, ident) edge for every file that
+    references an ident defined in another (or the same) file.
+    """
+    for ident in idents:
+        definers = defines[ident]
+        if ident in mentioned_idents:
+            mul = 10
+        else:
+            mul = 1
+        num_refs_by_file = references[ident]
+        if not isinstance(num_refs_by_file, Counter):
+            num_refs_by_file = Counter(num_refs_by_file)
+        for referencer, num_refs in num_refs_by_file.items():
+            for definer in definers:
+                # if referencer == definer:
+                #    continue
+                yield referencer, definer, mul * num_refs, ident
+
+
+def pagerank_networkx(
+    defines, references, idents, mentioned_idents, personalization=None, dangling=None
+):
+    """
+    Rank the files with networkx and spread each file's rank across the
+    definitions it references.
+
+    Returns ({rel_fname: rank}, {(rel_fname, ident): rank}).
+    """
+    G = nx.MultiDiGraph()
+
+    for referencer, definer, weight, ident in get_ident_edges(
+        defines, references, idents, mentioned_idents
+    ):
+        G.add_edge(referencer, definer, weight=weight, ident=ident)
+
+    ranked = nx.pagerank(G, weight="weight", personalization=personalization, dangling=dangling)
+
+    # distribute the rank from each source node, across all of its out edges
+    ranked_definitions = defaultdict(float)
+    for src in G.nodes:
+        src_rank = ranked[src]
+        total_weight = sum(data["weight"] for _src, _dst, data in G.out_edges(src, data=True))
+        # dump(src, src_rank, total_weight)
+        for _src, dst, data in G.out_edges(src, data=True):
+            data["rank"] = src_rank * data["weight"] / total_weight
+            ident = data["ident"]
+            ranked_definitions[(dst, ident)] += data["rank"]
+
+    return ranked, ranked_definitions
+
+
+SparseGraph = namedtuple(
+    "SparseGraph", "nodes idents matrix rows cols weights edge_idents inv_out_weight is_dangling"
+)
+
+
+def build_sparse_graph(defines, references, idents, mentioned_idents):
+    """
+    Build the ranking graph as a scipy CSR matrix over file indices, with the
+    edge weights summed per (referencer, definer) and each row normalized by
+    its out weight. The raw edges are kept so rank can be spread over the
+    definitions afterwards.
+    """
+    node_index = dict()
+    ident_index = dict()
+    rows = []
+    cols = []
+    weights = []
+    edge_idents = []
+
+    for referencer, definer, weight, ident in get_ident_edges(
+        defines, references, idents, mentioned_idents
+    ):
+        rows.append(node_index.setdefault(referencer, len(node_index)))
+        cols.append(node_index.setdefault(definer, len(node_index)))
+        weights.append(weight)
+        edge_idents.append(ident_index.setdefault(ident, len(ident_index)))
+
+    N = len(node_index)
+
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+    weights = np.array(weights, dtype=float)
+    edge_idents = np.array(edge_idents, dtype=np.int64)
+
+    # duplicate (row, col) entries are summed when building the csr matrix
+    A = sparse.csr_array((weights, (rows, cols)), shape=(N, N))
+    out_weight = np.asarray(A.sum(axis=1)).ravel()
+    is_dangling = out_weight == 0
+
+    inv_out_weight = np.zeros(N)
+    inv_out_weight[~is_dangling] = 1.0 / out_weight[~is_dangling]
+    A = sparse.diags_array(inv_out_weight) @ A
+
+    return SparseGraph(
+        nodes=list(node_index),
+        idents=list(ident_index),
+        matrix=A,
+        rows=rows,
+        cols=cols,
+        weights=weights,
+        edge_idents=edge_idents,
+        inv_out_weight=inv_out_weight,
+        is_dangling=is_dangling,
+    )
+
+
+def rank_sparse_graph(
+    graph,
+    personalization=None,
+    dangling=None,
+    nstart=None,
+    alpha=0.85,
+    max_iter=100,
+    tol=1.0e-6,
+):
+    """
+    Run the nx.pagerank power iteration over a SparseGraph. The iteration
+    starts from nstart when given, so a previous ranking can warm start it.
+    """
+    nodes = graph.nodes
+    N = len(nodes)
+    if not N:
+        return dict(), defaultdict(float)
+
+    A = graph.matrix
+    is_dangling = graph.is_dangling
+
+    # personalization and dangling vectors, normalized over the graph's nodes
+    if personalization:
+        p = np.array([personalization.get(node, 0) for node in nodes], dtype=float)
+        if p.sum() == 0:
+            raise ZeroDivisionError
+        p /= p.sum()
+    else:
+        p = np.repeat(1.0 / N, N)
+
+    if dangling:
+        dangling_weights = np.array([dangling.get(node, 0) for node in nodes], dtype=float)
+        dangling_weights /= dangling_weights.sum()
+    else:
+        dangling_weights = p
+
+    if nstart:
+        x = np.array([nstart.get(node, 1.0 / N) for node in nodes], dtype=float)
+        x /= x.sum()
+    else:
+        x = np.repeat(1.0 / N, N)
+
+    for _ in range(max_iter):
+        xlast = x
+        x = alpha * (x @ A + x[is_dangling].sum() * dangling_weights) + (1 - alpha) * p
+        if np.absolute(x - xlast).sum() < N * tol:
+            break
+
+    ranked = dict(zip(nodes, x.tolist()))
+
+    # distribute the rank from each source node, across all of its out edges
+    rows = graph.rows
+    edge_rank = x[rows] * graph.weights * graph.inv_out_weight[rows]
+    num_idents = len(graph.idents)
+    keys = graph.cols * num_idents + graph.edge_idents
+    keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=edge_rank)
+
+    ranked_definitions = defaultdict(float)
+    for key, rank in zip(keys.tolist(), sums.tolist()):
+        ranked_definitions[(nodes[key // num_idents], graph.idents[key % num_idents])] = rank
+
+    return ranked, ranked_definitions
+
+
+def pagerank_sparse(
+    defines, references, idents, mentioned_idents, personalization=None, dangling=None
+):
+    """
+    Same as pagerank_networkx(), but the graph is a scipy CSR matrix over
+    file indices and the rank is spread over the definitions with numpy
+    instead of walking the out edges of every node.
+    """
+    graph = build_sparse_graph(defines, references, idents, mentioned_idents)
+    return rank_sparse_graph(graph, personalization=personalization, dangling=dangling)
+
+
 def find_src_files(directory):
     if not os.path.isdir(directory):
         return [directory]
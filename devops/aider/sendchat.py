@@ -1,19 +1,92 @@
+import asyncio
 import hashlib
 import json
+import os
+import threading
 
 import backoff
 import httpx
 import openai
+from diskcache import Cache
 
 from aider.dump import dump  # noqa: F401
 from aider.litellm import litellm
 
-# from diskcache import Cache
+CACHE_PATH = "~/.aider.send.cache.v2"
+CACHE_SIZE_LIMIT = 512 * 1024 * 1024
 
-
-CACHE_PATH = "~/.aider.send.cache.v1"
+# Any store with get(key) and set(key, value, expire=seconds) can be plugged
+# in here, enable_cache() uses a size bounded diskcache
 CACHE = None
-# CACHE = Cache(CACHE_PATH)
+CACHE_TTL = None
+
+# The event loop used by the async sends, see get_async_loop()
+ASYNC_LOOP = None
+ASYNC_LOOP_LOCK = threading.Lock()
+
+
+def enable_cache(path=CACHE_PATH, size_limit=CACHE_SIZE_LIMIT, ttl=None):
+    global CACHE, CACHE_TTL
+
+    CACHE = Cache(
+        os.path.expanduser(path),
+        size_limit=size_limit,
+        eviction_policy="least-recently-used",
+    )
+    CACHE_TTL = ttl
+    return CACHE
+
+
+def record_stream(key, chunks):
+    """
+    Pass the streamed chunks through, and cache the whole list of them
+    once the stream finishes. Interrupted streams are not cached.
+    """
+    recorded = []
+    for chunk in chunks:
+        recorded.append(chunk)
+        yield chunk
+
+    if CACHE is not None:
+        CACHE.set(key, recorded, expire=CACHE_TTL)
+
+
+async def record_stream_async(key, chunks):
+    recorded = []
+    async for chunk in chunks:
+        recorded.append(chunk)
+        yield chunk
+
+    if CACHE is not None:
+        CACHE.set(key, recorded, expire=CACHE_TTL)
+
+
+async def replay_stream_async(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def get_async_loop():
+    """
+    One event loop, running in a daemon thread, shared by all the async
+    sends. Keeping it alive lets litellm reuse its async http clients and
+    their connection pools from one call to the next.
+    """
+    global ASYNC_LOOP
+
+    with ASYNC_LOOP_LOCK:
+        if ASYNC_LOOP is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, daemon=True)
+            thread.start()
+            ASYNC_LOOP = loop
+
+    return ASYNC_LOOP
+
+
+def submit(coro):
+    """Run coro on the shared event loop, returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_async_loop())
 
 
 def should_giveup(e):
@@ -30,7 +103,7 @@ def should_giveup(e):
     return not litellm._should_retry(e.status_code)
 
 
-@backoff.on_exception(
+retry_on_errors = backoff.on_exception(
     backoff.expo,
     (
         httpx.ConnectError,
@@ -48,7 +121,9 @@ def should_giveup(e):
         f"{details.get('exception','Exception')}\nRetry in {details['wait']:.1f} seconds."
     ),
 )
-def send_with_retries(model_name, messages, functions, stream, temperature=0):
+
+
+def get_completion_kwargs(model_name, messages, functions, stream, temperature):
     kwargs = dict(
         model=model_name,
         messages=messages,
@@ -63,15 +138,57 @@ def send_with_retries(model_name, messages, functions, stream, temperature=0):
     # Generate SHA1 hash of kwargs and append it to chat_completion_call_hashes
     hash_object = hashlib.sha1(key)
 
-    if not stream and CACHE is not None and key in CACHE:
-        return hash_object, CACHE[key]
+    return kwargs, hash_object
 
-    # del kwargs['stream']
+
+@retry_on_errors
+def send_with_retries(model_name, messages, functions, stream, temperature=0):
+    kwargs, hash_object = get_completion_kwargs(
+        model_name, messages, functions, stream, temperature
+    )
+    cache_key = hash_object.hexdigest()
+
+    if CACHE is not None:
+        cached = CACHE.get(cache_key)
+        if cached is not None:
+            if stream:
+                # replay the recorded chunks at full speed
+                return hash_object, iter(cached)
+            return hash_object, cached
 
     res = litellm.completion(**kwargs)
 
-    if not stream and CACHE is not None:
-        CACHE[key] = res
+    if CACHE is not None:
+        if stream:
+            res = record_stream(cache_key, res)
+        else:
+            CACHE.set(cache_key, res, expire=CACHE_TTL)
+
+    return hash_object, res
+
+
+@retry_on_errors
+async def send_with_retries_async(model_name, messages, functions, stream, temperature=0):
+    """Async send_with_retries() using litellm.acompletion, run it on the loop with submit()"""
+    kwargs, hash_object = get_completion_kwargs(
+        model_name, messages, functions, stream, temperature
+    )
+    cache_key = hash_object.hexdigest()
+
+    if CACHE is not None:
+        cached = CACHE.get(cache_key)
+        if cached is not None:
+            if stream:
+                return hash_object, replay_stream_async(cached)
+            return hash_object, cached
+
+    res = await litellm.acompletion(**kwargs)
+
+    if CACHE is not None:
+        if stream:
+            res = record_stream_async(cache_key, res)
+        else:
+            CACHE.set(cache_key, res, expire=CACHE_TTL)
 
     return hash_object, res
 
@@ -87,3 +204,16 @@ def simple_send_with_retries(model_name, messages):
         return response.choices[0].message.content
     except (AttributeError, openai.BadRequestError):
         return
+
+
+async def simple_send_with_retries_async(model_name, messages):
+    try:
+        _hash, response = await send_with_retries_async(
+            model_name=model_name,
+            messages=messages,
+            functions=None,
+            stream=False,
+        )
+        return response.choices[0].message.content
+    except (AttributeError, openai.BadRequestError):
+        return
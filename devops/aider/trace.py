@@ -0,0 +1,258 @@
+"""
+Spans which show where the time of a chat turn goes.
+
+With --trace FILE, each span is written to FILE as a Chrome trace event,
+viewable in chrome://tracing or https://ui.perfetto.dev. With --profile
+FILE, each turn is also profiled, with pyinstrument if FILE ends in .html
+and it is installed, and otherwise with cProfile into a .prof file.
+
+When neither is enabled span() returns a shared no-op, so the spans can
+stay in the hot paths.
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+from aider.dump import dump  # noqa: F401
+
+# The open trace file, see enable_trace()
+TRACE = None
+TRACE_LOCK = threading.Lock()
+
+# Where to save the per turn profiles, see enable_profile()
+PROFILE_FNAME = None
+PROFILE_TURNS = 0
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = now()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.args["error"] = exc_type.__name__
+        complete(self.name, self.start, **self.args)
+        return False
+
+    def set(self, **args):
+        """Add args to the span, eg results only known at the end"""
+        self.args.update(args)
+
+
+def enable_trace(fname):
+    global TRACE
+
+    disable_trace()
+
+    # the json array format, chrome accepts it without the closing ]
+    TRACE = open(fname, "w", encoding="utf-8")
+    TRACE.write("[\n")
+    atexit.register(disable_trace)
+    return TRACE
+
+
+def disable_trace():
+    global TRACE
+
+    with TRACE_LOCK:
+        if TRACE is None:
+            return
+        # a last event without a trailing comma, so the file is valid json
+        TRACE.write(json.dumps(dict(name="trace_end", ph="i", ts=now(), pid=os.getpid())))
+        TRACE.write("\n]\n")
+        TRACE.close()
+        TRACE = None
+
+
+def now():
+    """A timestamp for complete(), in microseconds"""
+    return time.perf_counter_ns() / 1000
+
+
+def span(name, **args):
+    """
+    A context manager which traces the time spent in its block:
+
+        with trace.span("repomap.render", files=len(fnames)) as s:
+            ...
+            s.set(tokens=num_tokens)
+    """
+    if TRACE is None:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def traced(name):
+    """Decorate a function to trace each call to it as a span"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if TRACE is None:
+                return func(*args, **kwargs)
+            with Span(name, dict()):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def complete(name, start, **args):
+    """
+    Trace a span which started at the now() timestamp start and ends now,
+    for spans which don't fit in one block, like the time to first token.
+    """
+    if TRACE is None or start is None:
+        return
+
+    end = now()
+    event = dict(
+        name=name,
+        ph="X",
+        ts=start,
+        dur=end - start,
+        pid=os.getpid(),
+        tid=threading.get_ident(),
+    )
+    if args:
+        event["args"] = args
+
+    line = json.dumps(event, default=str) + ",\n"
+    with TRACE_LOCK:
+        if TRACE is not None:
+            TRACE.write(line)
+            TRACE.flush()
+
+
+def turn(name, gen):
+    """
+    Yield from the generator gen in a span and a profile() which only count
+    its own execution. The profiler is paused while gen is suspended at a
+    yield, and the span's own_ms arg leaves that time out. The span's
+    duration still includes it, eg the GUI rendering each chunk.
+    """
+    if TRACE is None and PROFILE_FNAME is None:
+        return (yield from gen)
+
+    own = 0
+    with span(name) as s, profile() as prof:
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(gen)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    own += time.perf_counter() - start
+
+                prof.pause()
+                try:
+                    yield item
+                finally:
+                    prof.resume()
+        finally:
+            gen.close()
+            s.set(own_ms=round(own * 1000, 3))
+
+
+def enable_profile(fname):
+    """
+    Profile each turn into fname. Without pyinstrument, .html can't be
+    written, and the cProfile stats go to a .prof file instead.
+    """
+    global PROFILE_FNAME, PROFILE_TURNS
+
+    root, ext = os.path.splitext(fname)
+    if ext == ".html" and not pyinstrument:
+        fname = root + ".prof"
+
+    PROFILE_FNAME = fname
+    PROFILE_TURNS = 0
+    return fname
+
+
+def profile():
+    """
+    A context manager which profiles a chat turn into PROFILE_FNAME, with
+    the turn number added, eg aider.prof becomes aider-1.prof.
+    """
+    if PROFILE_FNAME is None:
+        return NULL_SPAN
+    return Profile()
+
+
+class Profile:
+    def __enter__(self):
+        global PROFILE_TURNS
+
+        PROFILE_TURNS += 1
+        root, ext = os.path.splitext(PROFILE_FNAME)
+        self.fname = f"{root}-{PROFILE_TURNS}{ext}"
+
+        if pyinstrument and ext == ".html":
+            self.profiler = pyinstrument.Profiler()
+            self.profiler.start()
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def pause(self):
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+
+    def resume(self):
+        # pyinstrument combines the samples of each start() and stop()
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.disable()
+            self.profiler.dump_stats(self.fname)
+        else:
+            self.profiler.stop()
+            with open(self.fname, "w", encoding="utf-8") as f:
+                f.write(self.profiler.output_html())
+        return False
@@ -84,6 +84,36 @@ def safe_abs_path(res):
     return str(res)
 
 
+def get_mtimes(fnames):
+    """
+    Stat fnames with a single os.scandir() per directory instead of
+    separate is_file() and getmtime() calls per file. Returns
+    {fname: mtime} for the fnames which are regular files.
+    """
+    by_dir = dict()
+    for fname in fnames:
+        dname, basename = os.path.split(fname)
+        by_dir.setdefault(dname, dict())[basename] = fname
+
+    mtimes = dict()
+    for dname, basenames in by_dir.items():
+        try:
+            with os.scandir(dname or ".") as entries:
+                for entry in entries:
+                    fname = basenames.get(entry.name)
+                    if fname is None:
+                        continue
+                    try:
+                        if entry.is_file():
+                            mtimes[fname] = entry.stat().st_mtime
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+    return mtimes
+
+
 def show_messages(messages, title=None, functions=None):
     if title:
         print(title.upper(), "*" * 50)
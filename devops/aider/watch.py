@@ -0,0 +1,232 @@
+import os
+import threading
+
+from aider.utils import get_mtimes
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+from .dump import dump  # noqa: F401
+
+
+class WatchHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed", "closed_no_write"):
+            return
+
+        if event.is_directory:
+            # a dir was moved or removed, let the next read rescan the tree
+            if event.event_type in ("deleted", "moved"):
+                self.watcher.mark_stale()
+            return
+
+        self.watcher.path_changed(event.src_path)
+        dest_path = getattr(event, "dest_path", None)
+        if dest_path:
+            self.watcher.path_changed(dest_path)
+
+
+class FileWatcher:
+    """
+    Keeps a live set of the repo's tracked files and of the paths which
+    changed since the last chat turn, so a turn doesn't need to walk the git
+    tree or stat every file. Uses watchdog (inotify, FSEvents, ...) when it
+    is installed, and otherwise polls from a background thread. Changes to
+    git are picked up when the files are asked for.
+    """
+
+    poll_interval = 1.0
+
+    def __init__(self, repo, use_watchdog=True, poll_interval=None, verbose=False):
+        self.repo = repo
+        self.root = repo.root
+        self.git_dir = os.path.abspath(repo.repo.git_dir)
+        self.verbose = verbose
+
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+
+        self.git_state = None
+        self.stale = True
+        self.files = dict()  # rel_fname -> abs_fname, for tracked files which exist
+        self.tracked = dict()  # rel_fname -> abs_fname, for all tracked files
+        self.mtimes = dict()
+        self.changed = set()
+
+        self.observer = None
+        self.thread = None
+        self.use_watchdog = use_watchdog and Observer is not None
+
+    def start(self):
+        self.refresh()
+
+        if self.use_watchdog:
+            try:
+                self.observer = Observer()
+                self.observer.schedule(WatchHandler(self), self.root, recursive=True)
+                self.observer.daemon = True
+                self.observer.start()
+            except OSError as err:
+                # eg: out of inotify watches on a huge tree
+                if self.verbose:
+                    self.repo.io.tool_error(f"Unable to watch {self.root}, polling: {err}")
+                self.observer = None
+
+        if not self.observer:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.observer:
+            self.observer.stop()
+            self.observer = None
+
+    def run(self):
+        # without watchdog, stat the files. The GitRepo isn't touched here,
+        # check_git_state() reloads it on the main thread
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as err:
+                if self.verbose:
+                    self.repo.io.tool_error(f"File watcher error: {err}")
+
+    def check_git_state(self):
+        """Reload the tracked files if git changed them, from the main thread"""
+        with self.lock:
+            if self.stale:
+                self.refresh()
+            elif self.repo.get_tracked_files_key() != self.git_state:
+                self.refresh(full=False)
+
+    def refresh(self, full=True):
+        """
+        Re-read the tracked files from git. Unless full, only the files which
+        just became tracked are statted, the rest are kept up to date by
+        path_changed() or poll().
+        """
+        with self.lock:
+            self.git_state = self.repo.get_tracked_files_key()
+            self.stale = False
+
+            tracked = dict()
+            for rel_fname in self.repo.get_tracked_files():
+                abs_fname = self.tracked.get(rel_fname)
+                if abs_fname is None:
+                    abs_fname = self.repo.abs_root_path(rel_fname)
+                tracked[rel_fname] = abs_fname
+
+            if full:
+                fresh = get_mtimes(tracked.values())
+            else:
+                fresh = get_mtimes(
+                    abs_fname
+                    for rel_fname, abs_fname in tracked.items()
+                    if rel_fname not in self.tracked
+                )
+
+            mtimes = dict()
+            for rel_fname, abs_fname in tracked.items():
+                if full or rel_fname not in self.tracked:
+                    mtime = fresh.get(abs_fname)
+                else:
+                    mtime = self.mtimes.get(abs_fname)
+
+                if mtime is not None:
+                    mtimes[abs_fname] = mtime
+                if mtime != self.mtimes.get(abs_fname):
+                    self.changed.add(abs_fname)
+
+            for rel_fname, abs_fname in self.tracked.items():
+                if rel_fname not in tracked:
+                    self.changed.add(abs_fname)
+
+            self.tracked = tracked
+            self.mtimes = mtimes
+            self.files = dict(
+                (rel_fname, abs_fname)
+                for rel_fname, abs_fname in tracked.items()
+                if abs_fname in mtimes
+            )
+
+    def mark_stale(self):
+        with self.lock:
+            self.stale = True
+
+    def path_changed(self, path):
+        path = os.path.abspath(path)
+
+        if path == self.git_dir or path.startswith(self.git_dir + os.sep):
+            # index, HEAD or refs changed, check_git_state() will notice
+            return
+
+        rel_fname = os.path.relpath(path, self.root)
+        with self.lock:
+            abs_fname = self.tracked.get(rel_fname)
+            if abs_fname is None:
+                return
+
+            try:
+                mtime = os.path.getmtime(abs_fname) if os.path.isfile(abs_fname) else None
+            except OSError:
+                mtime = None
+
+            # always report it, the mtime may not have ticked yet
+            self.changed.add(abs_fname)
+            self.set_mtime(rel_fname, abs_fname, mtime)
+
+    def poll(self):
+        """Without watchdog, find the changed files by statting them all"""
+        with self.lock:
+            tracked = dict(self.tracked)
+
+        mtimes = get_mtimes(tracked.values())
+
+        with self.lock:
+            for rel_fname, abs_fname in tracked.items():
+                if self.tracked.get(rel_fname) != abs_fname:
+                    # untracked by a refresh() while we were statting
+                    continue
+                self.set_mtime(rel_fname, abs_fname, mtimes.get(abs_fname))
+
+    def set_mtime(self, rel_fname, abs_fname, mtime):
+        if mtime == self.mtimes.get(abs_fname):
+            return
+
+        self.changed.add(abs_fname)
+        if mtime is None:
+            self.mtimes.pop(abs_fname, None)
+            self.files.pop(rel_fname, None)
+        else:
+            self.mtimes[abs_fname] = mtime
+            self.files[rel_fname] = abs_fname
+
+    def get_files(self):
+        """Sorted relative paths of the tracked files which exist"""
+        self.check_git_state()
+        with self.lock:
+            return sorted(self.files)
+
+    def get_abs_files(self):
+        self.check_git_state()
+        with self.lock:
+            return [self.files[rel_fname] for rel_fname in sorted(self.files)]
+
+    def pop_changed(self):
+        """The abs paths which changed since the last call"""
+        self.check_git_state()
+        with self.lock:
+            changed = self.changed
+            self.changed = set()
+        return changed
@@ -1,14 +1,17 @@
 #!/usr/bin/env python
 import datetime
 import json
+import multiprocessing
 import os
 import random
 import re
 import shutil
 import subprocess
+import tempfile
+import threading
 import time
 import traceback
-from collections import defaultdict
+from functools import lru_cache
 from json.decoder import JSONDecodeError
 from pathlib import Path
 from types import SimpleNamespace
@@ -21,7 +24,9 @@ import prompts
 import typer
 from dotenv import load_dotenv
 from plots import plot_refactoring
+from results_table import RESULTS_FNAME, TABLE_FNAME, aggregate, load_table
 from rich.console import Console
+from tqdm import tqdm
 
 from aider import models
 from aider.coders import Coder
@@ -39,11 +44,23 @@ app = typer.Typer(add_completion=False, pretty_exceptions_enable=False)
 
 NUM_TESTS = (89, 133)
 
+RESULTS_LOCK = threading.Lock()
+
+# warm per process, reused by all the tests a worker runs
+MODELS = dict()
+
 
 def show_stats(dirnames, graphs):
+    tables = [load_table(dirname) for dirname in dirnames]
+    tables = [df for df in tables if len(df)]
+    all_stats = aggregate(pd.concat(tables, ignore_index=True)) if tables else None
+
     raw_rows = []
     for dirname in dirnames:
-        row = summarize_results(dirname)
+        stats = None
+        if all_stats is not None and str(dirname) in all_stats.index:
+            stats = all_stats.loc[str(dirname)]
+        row = summarize_results(dirname, stats)
         raw_rows.append(row)
 
     # return
@@ -137,6 +154,12 @@ def main(
     diffs_only: bool = typer.Option(False, "--diffs", help="Just diff the provided stats dirs"),
     tries: int = typer.Option(2, "--tries", "-r", help="Number of tries for running tests"),
     threads: int = typer.Option(1, "--threads", "-t", help="Number of threads to run in parallel"),
+    processes: int = typer.Option(
+        0,
+        "--processes",
+        "-p",
+        help="Number of worker processes to run in parallel, instead of threads",
+    ),
     num_tests: int = typer.Option(-1, "--num-tests", "-n", help="Number of tests to run"),
     exercises_dir: str = typer.Option(
         EXERCISES_DIR_DEFAULT, "--exercises-dir", help="Directory with exercise files"
@@ -178,7 +201,8 @@ def main(
 
     if clean and dirname.exists():
         print("Cleaning up and replacing", dirname)
-        dir_files = set(fn.name for fn in dirname.glob("*"))
+        results_fnames = (RESULTS_FNAME, TABLE_FNAME)
+        dir_files = set(fn.name for fn in dirname.glob("*") if fn.name not in results_fnames)
         original_files = set(fn.name for fn in original_dname.glob("*"))
         if dir_files != original_files:
             print("ERROR: will not delete dir that does not look like original tests", dirname)
@@ -196,7 +220,7 @@ def main(
         shutil.copytree(original_dname, dirname)
         print("...done")
 
-    test_dnames = sorted(os.listdir(dirname))
+    test_dnames = sorted(dn for dn in os.listdir(dirname) if (dirname / dn).is_dir())
 
     if keywords:
         keywords = keywords.split(",")
@@ -206,42 +230,33 @@ def main(
     if num_tests > 0:
         test_dnames = test_dnames[:num_tests]
 
-    if threads == 1:
-        all_results = []
-        for testname in test_dnames:
-            results = run_test(
-                original_dname,
-                dirname / testname,
-                model,
-                edit_format,
-                tries,
-                no_unit_tests,
-                no_aider,
-                verbose,
-                commit_hash,
-                replay,
-                max_apply_update_errors,
-            )
+    # skip the tests which finished in a previous run
+    done = set(load_table(dirname)["testcase"])
+    test_dnames = [dn for dn in test_dnames if dn not in done]
 
-            all_results.append(results)
+    test_args = (
+        model,
+        edit_format,
+        tries,
+        no_unit_tests,
+        no_aider,
+        verbose,
+        commit_hash,
+        replay,
+        max_apply_update_errors,
+    )
+
+    if processes:
+        run_test_processes(processes, original_dname, dirname, test_dnames, test_args)
+    elif threads == 1:
+        for testname in test_dnames:
+            run_and_record(original_dname, dirname / testname, *test_args)
             summarize_results(dirname)
     else:
-        run_test_threaded = lox.thread(threads)(run_test)
+        run_test_threaded = lox.thread(threads)(run_and_record)
         for testname in test_dnames:
-            run_test_threaded.scatter(
-                original_dname,
-                dirname / testname,
-                model,
-                edit_format,
-                tries,
-                no_unit_tests,
-                no_aider,
-                verbose,
-                commit_hash,
-                replay,
-                max_apply_update_errors,
-            )
-        all_results = run_test_threaded.gather(tqdm=True)
+            run_test_threaded.scatter(original_dname, dirname / testname, *test_args)
+        run_test_threaded.gather(tqdm=True)
 
     print()
     print()
@@ -288,72 +303,121 @@ def show_diffs(dirnames):
     print("unchanged:", len(unchanged), ",".join(sorted(unchanged)))
 
 
+def run_test_processes(processes, original_dname, dirname, test_dnames, test_args):
+    """
+    Run the tests in a pool of processes, which each take the next test
+    when they finish one. Each worker has its own cwd and temp dir, and
+    keeps its Model warm across tests. Only this process writes results.
+    """
+    # the workers chdir, so they need absolute paths
+    original_dname = original_dname.resolve()
+    dirname = dirname.resolve()
+
+    tmp_root = tempfile.mkdtemp(prefix="aider-benchmark-")
+    tasks = [(original_dname, dirname / testname, *test_args) for testname in test_dnames]
+
+    # spawn, so the workers don't inherit litellm's threads and locks
+    context = multiprocessing.get_context("spawn")
+    try:
+        with context.Pool(processes, initializer=init_worker, initargs=(tmp_root,)) as pool:
+            results = pool.imap_unordered(run_test_task, tasks, chunksize=1)
+            for res in tqdm(results, total=len(tasks)):
+                if res:
+                    append_results(dirname, res)
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+def init_worker(tmp_root):
+    worker_dname = tempfile.mkdtemp(prefix=f"worker-{os.getpid()}-", dir=tmp_root)
+
+    # the unit test subprocesses inherit TMPDIR
+    os.environ["TMPDIR"] = worker_dname
+    tempfile.tempdir = worker_dname
+    os.chdir(worker_dname)
+
+
+def run_test_task(args):
+    return run_test(*args)
+
+
+def run_and_record(original_dname, testdir, *args, **kwargs):
+    results = run_test(original_dname, testdir, *args, **kwargs)
+    if results:
+        append_results(Path(testdir).parent, results)
+    return results
+
+
+def append_results(dirname, results):
+    line = json.dumps(results) + "\n"
+    with RESULTS_LOCK:
+        with open(Path(dirname) / RESULTS_FNAME, "a") as fh:
+            fh.write(line)
+
+
 def load_results(dirname):
+    """
+    The results of each finished test case, from the run's jsonl and from
+    the per test .aider.results.json files written by older runs.
+    """
     dirname = Path(dirname)
     all_results = [json.loads(fname.read_text()) for fname in dirname.glob("*/.aider.results.json")]
-    return all_results
 
+    results_fname = dirname / RESULTS_FNAME
+    if results_fname.exists():
+        by_testcase = dict()
+        for line in results_fname.read_text().splitlines():
+            try:
+                results = json.loads(line)
+            except JSONDecodeError:
+                # a partial line, from a run which was killed
+                continue
+            by_testcase[results.get("testcase")] = results
+        all_results += by_testcase.values()
 
-def summarize_results(dirname):
-    all_results = load_results(dirname)
+    return all_results
 
-    res = SimpleNamespace()
-    res.total_tests = len(list(Path(dirname).glob("*")))
 
-    try:
-        tries = max(len(results.get("tests_outcomes", [])) for results in all_results if results)
-    except ValueError:
-        tries = 0
+def summarize_results(dirname, stats=None):
+    """
+    Print the stats of a run. They are aggregated from the run's results
+    table, unless show_stats() already did that for many runs at once.
+    """
+    dirname = Path(dirname)
+    if stats is None:
+        df = load_table(dirname)
+        if len(df):
+            stats = aggregate(df).iloc[0]
 
+    res = SimpleNamespace()
+    res.total_tests = len([fname for fname in dirname.glob("*") if fname.is_dir()])
     res.dir_name = str(dirname)
 
-    passed_tests = [0] * tries
-
-    res.completed_tests = 0
-    res.duration = 0
-    res.cost = 0
-    res.error_outputs = 0
-    res.user_asks = 0
-    res.test_timeouts = 0
-    res.exhausted_context_windows = 0
-    res.num_malformed_responses = 0
-    res.num_with_malformed_responses = 0
-    res.syntax_errors = 0
-    res.indentation_errors = 0
-    res.lazy_comments = 0
-
-    variants = defaultdict(set)
-
-    for results in all_results:
-        if not results:
-            continue
+    if stats is None:
+        return
 
-        res.completed_tests += 1
-        tests_outcomes = results.get("tests_outcomes", [])
-        passed = tests_outcomes and tests_outcomes[-1]
-        if passed:
-            for i in range(len(tests_outcomes) - 1, tries):
-                passed_tests[i] += 1
-
-        res.cost += results.get("cost", 0)
-        res.duration += results.get("duration", 0)
-        res.test_timeouts += results.get("test_timeouts", 0)
-
-        res.error_outputs += results.get("num_error_outputs", 0)
-        res.user_asks += results.get("num_user_asks", 0)
-        res.exhausted_context_windows += results.get("num_exhausted_context_windows", 0)
-        res.num_malformed_responses += results.get("num_malformed_responses", 0)
-        if results.get("num_malformed_responses"):
-            res.num_with_malformed_responses += 1
-        res.lazy_comments += results.get("lazy_comments", 0)
-
-        res.syntax_errors += results.get("syntax_errors", 0)
-        res.indentation_errors += results.get("indentation_errors", 0)
-
-        for key in "model edit_format commit_hash".split():
-            val = results.get(key)
-            if val:
-                variants[key].add(val)
+    tries = int(stats["tries"])
+    passed_tests = [int(stats[f"passed_{i+1}"]) for i in range(tries)]
+
+    res.completed_tests = int(stats["completed_tests"])
+    res.duration = float(stats["duration"])
+    res.cost = float(stats["cost"])
+    for stat in (
+        "error_outputs",
+        "user_asks",
+        "test_timeouts",
+        "exhausted_context_windows",
+        "num_malformed_responses",
+        "num_with_malformed_responses",
+        "syntax_errors",
+        "indentation_errors",
+        "lazy_comments",
+    ):
+        setattr(res, stat, int(stats[stat]))
+
+    variants = dict(
+        (key, stats[key]) for key in ("model", "edit_format", "commit_hash") if stats[key]
+    )
 
     if not res.completed_tests:
         return
@@ -364,7 +428,7 @@ def summarize_results(dirname):
     console = Console(highlight=False)
     console.rule(title=str(dirname))
 
-    commit_hashes = variants["commit_hash"]
+    commit_hashes = variants.get("commit_hash", set())
     versions = get_versions(commit_hashes)
     date = dirname.name[:10]
 
@@ -441,18 +505,24 @@ def get_versions(commit_hashes):
     for hsh in commit_hashes:
         if not hsh:
             continue
-        hsh = hsh.split("-")[0]
-        try:
-            version = subprocess.check_output(
-                ["git", "show", f"{hsh}:aider/__init__.py"], universal_newlines=True
-            )
-            version = re.search(r'__version__ = "(.*)"', version).group(1)
+        version = get_version(hsh.split("-")[0])
+        if version:
             versions.add(version)
-        except subprocess.CalledProcessError:
-            pass
     return versions
 
 
+@lru_cache(maxsize=None)
+def get_version(hsh):
+    # most of the runs shown together share a few commits
+    try:
+        version = subprocess.check_output(
+            ["git", "show", f"{hsh}:aider/__init__.py"], universal_newlines=True
+        )
+        return re.search(r'__version__ = "(.*)"', version).group(1)
+    except subprocess.CalledProcessError:
+        pass
+
+
 def get_replayed_content(replay_dname, test_dname):
     replay_dname = Path(replay_dname)
     test_dname = Path(test_dname)
@@ -480,8 +550,7 @@ def run_test(original_dname, testdir, *args, **kwargs):
         traceback.print_exc()
 
         testdir = Path(testdir)
-        results_fname = testdir / ".aider.results.json"
-        results_fname.write_text(json.dumps(dict(exception=str(err))))
+        return dict(testdir=str(testdir), testcase=testdir.name, exception=str(err))
 
 
 def run_test_real(
@@ -505,15 +574,6 @@ def run_test_real(
 
     history_fname = testdir / ".aider.chat.history.md"
 
-    results_fname = testdir / ".aider.results.json"
-    if results_fname.exists():
-        try:
-            res = json.loads(results_fname.read_text())
-            return res
-        except JSONDecodeError:
-            print(f"{results_fname} failed to parse, skipping")
-            return
-
     fnames = []
     for fname in testdir.glob("*"):
         if (
@@ -549,7 +609,7 @@ def run_test_real(
         chat_history_file=history_fname,
     )
 
-    main_model = models.Model(model_name)
+    main_model = get_model(model_name)
     edit_format = edit_format or main_model.edit_format
 
     dump(main_model)
@@ -659,11 +719,16 @@ def run_test_real(
     )
     dump(results)
 
-    results_fname.write_text(json.dumps(results, indent=4))
-
     return results
 
 
+def get_model(model_name):
+    model = MODELS.get(model_name)
+    if model is None:
+        model = MODELS[model_name] = models.Model(model_name)
+    return model
+
+
 def run_unit_tests(testdir, history_fname):
     command = [
         "python",
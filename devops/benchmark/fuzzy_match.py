@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Benchmark find_similar_lines() in editblock_coder against the plain
+SequenceMatcher scan it replaced, and check they pick the same lines. It
+runs when a SEARCH block fails to match, to suggest the lines it may have
+meant.
+
+replace_closest_edit_distance() isn't benchmarked: replace_most_similar_chunk()
+returns before reaching it, so fuzzy replacement is disabled and its speed
+doesn't matter to users. tests/test_editblock.py still covers its results.
+
+Uses the fuzzy fixtures from tests/test_editblock.py, then SEARCH blocks cut
+from a large source file with some of their lines mangled, like a model
+misremembering the code.
+
+    python benchmark/fuzzy_match.py [FILE] [NUM_EDITS]
+"""
+
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+
+from aider.coders import editblock_coder as eb
+from aider.dump import dump  # noqa: F401
+
+# from tests/test_editblock.py
+FIXTURES = [
+    (
+        "This is a sample text.\nAnother line of text.\nYet another line.\n",
+        "This is a sample text\n",
+        "This is a replaced text.\n",
+    ),
+    (
+        "This is a sample text.\nAnother line of text.\nYet another line.\n",
+        "This was a sample text.\nAnother line of txt\n",
+        "This is a replaced text.\nModified line of text.\n",
+    ),
+]
+
+
+def old_find_similar_lines(search_lines, content_lines, threshold=0.6):
+    search_lines = search_lines.splitlines()
+    content_lines = content_lines.splitlines()
+
+    best_ratio = 0
+    best_match = None
+
+    for i in range(len(content_lines) - len(search_lines) + 1):
+        chunk = content_lines[i : i + len(search_lines)]
+        ratio = SequenceMatcher(None, search_lines, chunk).ratio()
+        if ratio > best_ratio:
+            best_ratio = ratio
+            best_match = chunk
+            best_match_i = i
+
+    if best_ratio < threshold:
+        return ""
+
+    if best_match[0] == search_lines[0] and best_match[-1] == search_lines[-1]:
+        return "\n".join(best_match)
+
+    N = 5
+    best_match_end = min(len(content_lines), best_match_i + len(search_lines) + N)
+    best_match_i = max(0, best_match_i - N)
+
+    best = content_lines[best_match_i:best_match_end]
+    return "\n".join(best)
+
+
+def mangle(line, rnd):
+    if not line.strip():
+        return line
+    pos = rnd.randrange(len(line.rstrip("\n")) or 1)
+    return line[:pos] + line[pos + 1 :]
+
+
+def make_edits(whole, num_edits, seed=0):
+    rnd = random.Random(seed)
+    lines = whole.splitlines(keepends=True)
+
+    edits = list(FIXTURES)
+    for _ in range(num_edits):
+        size = rnd.randint(5, 30)
+        start = rnd.randrange(len(lines) - size)
+        part = lines[start : start + size]
+        part = [mangle(line, rnd) if rnd.random() < 0.2 else line for line in part]
+        edits.append((whole, "".join(part), "replaced\n"))
+    return edits
+
+
+def run(edits, find_similar):
+    results = []
+    start = time.perf_counter()
+    for whole, part, replace in edits:
+        whole, _ = eb.prep(whole)
+        part, _ = eb.prep(part)
+        results.append(find_similar(part, whole))
+    return results, time.perf_counter() - start
+
+
+def main():
+    fname = sys.argv[1] if len(sys.argv) > 1 else "aider/coders/base_coder.py"
+    num_edits = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with open(fname, encoding="utf-8") as f:
+        whole = f.read()
+
+    edits = make_edits(whole, num_edits)
+    num_lines = len(whole.splitlines())
+    print(f"{len(edits)} edits, {num_edits} against {fname} ({num_lines:,} lines)")
+    print()
+
+    old, old_time = run(edits, old_find_similar_lines)
+    new, new_time = run(edits, eb.find_similar_lines)
+
+    matched = sum(1 for res in new if res)
+    print(f"find_similar_lines: {old_time:8.2f}s -> {new_time:8.3f}s", end="")
+    print(f"  {old_time / new_time:.0f}x, {matched} matched")
+
+    if old != new:
+        bad = sum(1 for a, b in zip(old, new) if a != b)
+        print(f"MISMATCH: {bad} edits gave different results")
+        return 1
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Benchmark GitRepo.path_in_repo() on a large synthetic repo.
+
+Commits NUM_FILES empty files, then times path_in_repo() with the tracked
+files rebuilt on every call (the old behavior) and with them cached by
+(HEAD sha, index stat, aiderignore stat).
+
+    python benchmark/path_in_repo.py [NUM_FILES]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import git
+
+from aider.dump import dump  # noqa: F401
+from aider.io import InputOutput
+from aider.repo import GitRepo
+from aider.utils import GitTemporaryDirectory
+
+
+def make_repo(num_files):
+    raw_repo = git.Repo()
+
+    for num in range(num_files):
+        fname = Path(f"dir{num % 500}") / f"file{num}.py"
+        fname.parent.mkdir(exist_ok=True)
+        fname.touch()
+
+    Path(".aiderignore").write_text("dir499/\n")
+
+    raw_repo.git.add(".")
+    raw_repo.git.commit("-m", "files", "--no-verify")
+
+
+def time_calls(git_repo, fnames, cached):
+    start = time.perf_counter()
+    for fname in fnames:
+        if not cached:
+            git_repo.tracked_files_key = None
+            git_repo.head_files = None
+        git_repo.path_in_repo(fname)
+    return (time.perf_counter() - start) / len(fnames)
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+    with GitTemporaryDirectory():
+        print(f"creating {num_files:,} files...")
+        make_repo(num_files)
+
+        git_repo = GitRepo(InputOutput(), None, ".", ".aiderignore")
+        fnames = [os.path.join("dir1", "file1.py"), "missing.py", "dir499/file499.py"]
+
+        num_tracked = len(git_repo.get_tracked_files())
+
+        uncached = time_calls(git_repo, fnames * 2, cached=False)
+        cached = time_calls(git_repo, fnames * 1000, cached=True)
+
+        print(f"tracked files: {num_tracked:,}")
+        print(f"rebuilt every call: {uncached * 1e3:10.2f} ms/call")
+        print(f"cached:             {cached * 1e3:10.3f} ms/call")
+        print(f"speedup: {uncached / cached:.0f}x")
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
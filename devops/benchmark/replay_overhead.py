@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+"""
+Measure aider's own overhead, without the LLM, by replaying the responses
+recorded in a benchmark run's .aider.chat.history.md files through
+Coder.run().
+
+Each test case is copied fresh from the original exercises into a temp git
+repo. Its recorded user messages are sent again, and the LLM is replaced by
+a stub which returns the recorded responses in order. Commit messages are
+stubbed too, so only local work is timed.
+
+Reports the wall time of each phase: format_messages, the repo map, token
+counting, edit parsing, applying the edits and the fallbacks they tried,
+the hint shown for edits which failed, lint and the git commit. Phases
+nest, eg token counting also happens inside format_messages, so the times
+don't add up to the total.
+
+With --stream, edit blocks are parsed as the reply streams in, so
+edit_parsing also includes that time inside send(). It includes matching
+each streamed edit against its file, which apply_edits then reuses.
+
+    python benchmark/replay_overhead.py RUN_DIR [--originals DIR] [--json OUT]
+
+The --json output can be diffed across aider versions to catch regressions
+in the local overhead, independent of model latency.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from aider.coders import Coder, editblock_coder, udiff_coder
+from aider.coders import base_coder as base_coder_module
+from aider.dump import dump  # noqa: F401
+from aider.io import InputOutput
+from aider.models import Model
+from aider.utils import make_repo
+
+BENCHMARK_DNAME = Path(os.environ.get("AIDER_BENCHMARK_DIR", "tmp.benchmarks"))
+
+# (phase, attribute of the coder)
+CODER_PHASES = [
+    ("format_messages", "format_messages"),
+    ("repo_map", "get_repo_map"),
+    ("send", "send"),
+    ("edit_parsing", "get_edits"),
+    ("apply_edits", "apply_edits"),
+    ("lint", "lint_edited"),
+    ("git_commit", "auto_commit"),
+]
+
+# the strategies apply_edits() falls back through, (phase, module, function).
+# Patched in the module which calls them, udiff_coder imports its by name.
+STRATEGY_PHASES = [
+    ("apply_edits.replace_most_similar_chunk", editblock_coder, "replace_most_similar_chunk"),
+    ("apply_edits.perfect_replace", editblock_coder, "perfect_replace"),
+    (
+        "apply_edits.replace_part_with_missing_leading_whitespace",
+        editblock_coder,
+        "replace_part_with_missing_leading_whitespace",
+    ),
+    ("apply_edits.try_dotdotdots", editblock_coder, "try_dotdotdots"),
+    ("apply_edits.flexible_search_and_replace", udiff_coder, "flexible_search_and_replace"),
+    # not a strategy, the "did you mean" hint once they all failed
+    ("edit_error_hint", editblock_coder, "find_similar_lines"),
+]
+
+
+class PhaseTimer:
+    """Accumulates the calls and wall time of each phase"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.depth = defaultdict(int)
+
+    def wrap(self, phase, func, count=True):
+        # count=False adds the time to the phase, but not another call
+        def wrapper(*args, **kwargs):
+            # only time the outermost call of recursive phases, like token_count
+            if self.depth[phase]:
+                return func(*args, **kwargs)
+
+            self.depth[phase] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[phase] += time.perf_counter() - start
+                self.calls[phase] += count
+                self.depth[phase] -= 1
+
+        return wrapper
+
+    def wrap_generator(self, phase, func):
+        # send() is a generator, time it while it is being consumed
+        def wrapper(*args, **kwargs):
+            self.depth[phase] += 1
+            start = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            finally:
+                self.seconds[phase] += time.perf_counter() - start
+                self.calls[phase] += 1
+                self.depth[phase] -= 1
+
+        return wrapper
+
+    def add(self, other):
+        for phase, calls in other.calls.items():
+            self.calls[phase] += calls
+            self.seconds[phase] += other.seconds[phase]
+
+    def as_dict(self):
+        return dict(
+            (
+                phase,
+                dict(
+                    calls=self.calls[phase],
+                    seconds=round(self.seconds[phase], 6),
+                    ms_per_call=round(self.seconds[phase] * 1e3 / self.calls[phase], 3),
+                ),
+            )
+            for phase in sorted(self.calls)
+        )
+
+
+def parse_history(text):
+    """
+    Split a chat history into turns of (user message, [responses]). The
+    responses after one user message are the reply and its reflections.
+    Lines starting with "> " are aider's own output, and separate them.
+    """
+    turns = []
+    user_lines = None
+    response = None
+
+    def end_response():
+        if response is not None and "".join(response).strip():
+            turns[-1][1].append("".join(response).strip() + "\n")
+
+    for line in text.splitlines(keepends=True):
+        if line.startswith("#### "):
+            if user_lines is None:
+                end_response()
+                response = None
+                user_lines = []
+                turns.append((user_lines, []))
+            user_lines.append(line[5:].rstrip("\n").removesuffix("  ") + "\n")
+            continue
+
+        user_lines = None
+        if not turns:
+            continue
+
+        if line.startswith("> "):
+            end_response()
+            response = None
+        elif response is None:
+            response = [line]
+        else:
+            response.append(line)
+
+    end_response()
+
+    return [("".join(lines).rstrip("\n"), responses) for lines, responses in turns]
+
+
+def make_completion(content):
+    message = SimpleNamespace(content=content, function_call=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def make_stream(content, chunk_size=20):
+    for i in range(0, len(content), chunk_size):
+        delta = SimpleNamespace(content=content[i : i + chunk_size], function_call=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+
+
+class ReplayLLM:
+    """Stands in for send_with_retries(), returns the recorded responses"""
+
+    def __init__(self, responses=None):
+        self.responses = list(responses or [])
+
+    def __call__(self, model_name, messages, functions, stream, temperature=0):
+        content = self.responses.pop(0) if self.responses else ""
+
+        hash_object = hashlib.sha1(json.dumps(messages, sort_keys=True).encode())
+        if stream:
+            return hash_object, make_stream(content)
+        return hash_object, make_completion(content)
+
+
+def replay_test(testdir, original_dname, model, edit_format, stream, timer):
+    turns = parse_history((testdir / ".aider.chat.history.md").read_text())
+    if not turns:
+        return
+
+    test_dname = Path(tempfile.mkdtemp()) / testdir.name
+    shutil.copytree(original_dname / testdir.name, test_dname)
+
+    cwd = os.getcwd()
+    os.chdir(test_dname)
+    try:
+        repo = make_repo()
+        repo.git.add(".")
+        repo.git.commit("-m", "initial", "--no-verify")
+
+        fnames = [
+            fname.name
+            for fname in test_dname.glob("*.py")
+            if "test" not in fname.name and fname.name[0] != "."
+        ]
+
+        io = InputOutput(pretty=False, yes=False)
+        llm = ReplayLLM()
+
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.object(base_coder_module, "send_with_retries", llm))
+
+            # before the coder is made, so the repo map and the summarizer
+            # keep the wrapped token_count too
+            models = {id(model): model, id(model.weak_model): model.weak_model}
+            for counted_model in filter(None, models.values()):
+                token_count = timer.wrap("token_count", counted_model.token_count)
+                stack.enter_context(mock.patch.object(counted_model, "token_count", token_count))
+
+            for phase, module, name in STRATEGY_PHASES:
+                func = getattr(module, name)
+                stack.enter_context(mock.patch.object(module, name, timer.wrap(phase, func)))
+
+            coder = Coder.create(
+                model,
+                edit_format,
+                io,
+                fnames=fnames,
+                stream=stream,
+                pretty=False,
+                speculative_commit_messages=False,
+            )
+            coder.repo.get_commit_message = lambda diffs, context: "replayed edits"
+
+            for phase, attr in CODER_PHASES:
+                func = getattr(coder, attr)
+                if phase == "send":
+                    setattr(coder, attr, timer.wrap_generator(phase, func))
+                else:
+                    setattr(coder, attr, timer.wrap(phase, func))
+
+            # streamed edits are parsed as they arrive, inside send()
+            make_edit_stream = coder.make_edit_stream
+
+            def make_timed_edit_stream():
+                edit_stream = make_edit_stream()
+                if edit_stream:
+                    edit_stream.feed = timer.wrap("edit_parsing", edit_stream.feed, count=False)
+                return edit_stream
+
+            coder.make_edit_stream = make_timed_edit_stream
+
+            for message, turn_responses in turns:
+                llm.responses = list(turn_responses)
+                start = time.perf_counter()
+                coder.run(with_message=message)
+                timer.seconds["total"] += time.perf_counter() - start
+                timer.calls["total"] += 1
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(test_dname.parent, ignore_errors=True)
+
+    return len(turns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time aider's local overhead per phase")
+    parser.add_argument("run_dir", help="A benchmark run dir, with recorded chat histories")
+    parser.add_argument(
+        "--originals",
+        default=str(BENCHMARK_DNAME / "exercism-python"),
+        help="The original exercises the run was made from",
+    )
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--edit-format", default=None)
+    parser.add_argument("--stream", action="store_true", help="Replay the responses as streams")
+    parser.add_argument("--num-tests", type=int, default=0)
+    parser.add_argument("--json", help="Write the timings as json to this file, - for stdout")
+    args = parser.parse_args()
+
+    run_dname = Path(args.run_dir).resolve()
+    original_dname = Path(args.originals).resolve()
+
+    testdirs = sorted(
+        fname.parent
+        for fname in run_dname.glob("*/.aider.chat.history.md")
+        if (original_dname / fname.parent.name).is_dir()
+    )
+    if args.num_tests:
+        testdirs = testdirs[: args.num_tests]
+    if not testdirs:
+        print(f"No recorded chat histories in {run_dname} with originals in {original_dname}")
+        return 1
+
+    model = Model(args.model)
+    edit_format = args.edit_format or model.edit_format
+
+    tests = dict()
+    totals = PhaseTimer()
+    for testdir in testdirs:
+        timer = PhaseTimer()
+        with open(os.devnull, "w") as devnull, mock.patch("sys.stdout", devnull):
+            num_turns = replay_test(testdir, original_dname, model, edit_format, args.stream, timer)
+        if not num_turns:
+            continue
+
+        tests[testdir.name] = timer.as_dict()
+        totals.add(timer)
+        print(f"{testdir.name}: {timer.seconds['total'] * 1e3:.1f} ms", file=sys.stderr)
+
+    report = dict(
+        model=model.name,
+        edit_format=edit_format,
+        stream=args.stream,
+        num_tests=len(tests),
+        phases=totals.as_dict(),
+        tests=tests,
+    )
+
+    print(file=sys.stderr)
+    print(f"{'phase':56} {'calls':>7} {'total s':>9} {'ms/call':>9}", file=sys.stderr)
+    for phase, stats in report["phases"].items():
+        print(
+            f"{phase:56} {stats['calls']:7} {stats['seconds']:9.3f} {stats['ms_per_call']:9.2f}",
+            file=sys.stderr,
+        )
+
+    if args.json == "-":
+        print(json.dumps(report, indent=4))
+    elif args.json:
+        Path(args.json).write_text(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
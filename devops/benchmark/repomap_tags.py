@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for repo-map tag extraction.
+
+Builds a synthetic tree of python and javascript files and times
+RepoMap.get_tags_raw() per file, first rebuilding the tree-sitter parser and
+query for every file (the old behavior) and then with the per-language
+registry warm.
+
+    python benchmark/repomap_tags.py [NUM_FILES]
+"""
+
+import os
+import sys
+import time
+
+from aider import repomap
+from aider.dump import dump  # noqa: F401
+from aider.io import InputOutput
+from aider.models import Model
+from aider.repomap import RepoMap
+from aider.utils import IgnorantTemporaryDirectory
+
+PY_TEMPLATE = """\
+import os
+
+from pkg{prev} import Thing{prev}
+
+
+class Thing{num}(Thing{prev}):
+    def __init__(self, value):
+        self.value = value
+
+    def method_{num}(self, other):
+        return helper_{num}(self.value, other)
+
+
+def helper_{num}(a, b):
+    return os.path.join(str(a), str(b))
+"""
+
+JS_TEMPLATE = """\
+import {{ Widget{prev} }} from "./widget{prev}";
+
+export class Widget{num} extends Widget{prev} {{
+  constructor(value) {{
+    super(value);
+    this.value = value;
+  }}
+
+  render{num}(other) {{
+    return helper{num}(this.value, other);
+  }}
+}}
+
+export function helper{num}(a, b) {{
+  return [a, b].join("/");
+}}
+"""
+
+
+def make_tree(root, num_files):
+    fnames = []
+    for num in range(num_files):
+        subdir = os.path.join(root, f"dir{num % 50}")
+        os.makedirs(subdir, exist_ok=True)
+
+        if num % 2:
+            fname = os.path.join(subdir, f"widget{num}.js")
+            content = JS_TEMPLATE.format(num=num, prev=num - 1)
+        else:
+            fname = os.path.join(subdir, f"pkg{num}.py")
+            content = PY_TEMPLATE.format(num=num, prev=num - 1)
+
+        with open(fname, "w") as f:
+            f.write(content)
+        fnames.append(fname)
+
+    return fnames
+
+
+def time_tags(rm, fnames, cold):
+    repomap.LANG_TAGGERS.clear()
+
+    num_tags = 0
+    start = time.perf_counter()
+    for fname in fnames:
+        if cold:
+            repomap.LANG_TAGGERS.clear()
+        num_tags += len(list(rm.get_tags_raw(fname, rm.get_rel_fname(fname))))
+    elapsed = time.perf_counter() - start
+
+    return elapsed, num_tags
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+
+    with IgnorantTemporaryDirectory() as root:
+        fnames = make_tree(root, num_files)
+        rm = RepoMap(root=root, main_model=Model("gpt-3.5-turbo"), io=InputOutput())
+
+        before, before_tags = time_tags(rm, fnames, cold=True)
+        after, after_tags = time_tags(rm, fnames, cold=False)
+
+        assert before_tags == after_tags
+
+        print(f"files: {num_files:,}  tags: {after_tags:,}")
+        print(f"per-language rebuild: {before * 1e6 / num_files:8.1f} us/file  {before:.2f}s")
+        print(f"registry reused:      {after * 1e6 / num_files:8.1f} us/file  {after:.2f}s")
+        print(f"speedup: {before / after:.1f}x")
+
+        del rm
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,193 @@
+"""
+Compacts the results of a benchmark run into one table, so the stats for
+many runs can be computed with a few vectorized group-bys instead of
+re-reading and looping over every test's json.
+
+The table is cached next to the results, in parquet when pyarrow is
+installed and as a pandas pickle otherwise. It remembers how much of the
+results jsonl it has ingested, so refreshing it while a run is still in
+progress only parses the newly appended lines.
+"""
+
+import json
+from json.decoder import JSONDecodeError
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+# one json line per finished test case, appended as they finish
+RESULTS_FNAME = ".aider.results.jsonl"
+
+# older runs wrote a results file into each test's dir
+LEGACY_RESULTS_GLOB = "*/.aider.results.json"
+
+TABLE_FNAME = ".aider.results.parquet" if pyarrow else ".aider.results.pkl"
+
+# bumped when the columns change, to discard old cached tables
+TABLE_VERSION = 1
+
+VARIANT_COLUMNS = ["model", "edit_format", "commit_hash"]
+
+# summed per run, as results key -> column
+SUM_COLUMNS = dict(
+    cost="cost",
+    duration="duration",
+    test_timeouts="test_timeouts",
+    num_error_outputs="error_outputs",
+    num_user_asks="user_asks",
+    num_exhausted_context_windows="exhausted_context_windows",
+    num_malformed_responses="num_malformed_responses",
+    lazy_comments="lazy_comments",
+    syntax_errors="syntax_errors",
+    indentation_errors="indentation_errors",
+)
+
+
+def results_to_row(results):
+    tests_outcomes = results.get("tests_outcomes") or []
+
+    row = dict(testcase=results.get("testcase"))
+    for key in VARIANT_COLUMNS:
+        row[key] = results.get(key) or None
+    row["num_tries"] = len(tests_outcomes)
+    row["passed"] = bool(tests_outcomes and tests_outcomes[-1])
+    for key, col in SUM_COLUMNS.items():
+        row[col] = results.get(key) or 0
+    return row
+
+
+def make_table(rows, dirname):
+    columns = ["testcase"] + VARIANT_COLUMNS + ["num_tries", "passed"] + list(SUM_COLUMNS.values())
+    df = pd.DataFrame.from_records(rows, columns=columns)
+
+    df["cost"] = df["cost"].astype(float)
+    df["duration"] = df["duration"].astype(float)
+    for col in list(SUM_COLUMNS.values())[2:] + ["num_tries"]:
+        df[col] = df[col].astype(int)
+    df["passed"] = df["passed"].astype(bool)
+
+    df.insert(0, "dir_name", str(dirname))
+    return df
+
+
+def read_new_lines(fname, offset):
+    """
+    The results appended to the jsonl since offset, and the offset after
+    the last complete line. A partly written last line is left for later.
+    """
+    with open(fname, "rb") as fh:
+        fh.seek(offset)
+        data = fh.read()
+
+    end = data.rfind(b"\n") + 1
+    all_results = []
+    for line in data[:end].splitlines():
+        try:
+            all_results.append(json.loads(line))
+        except JSONDecodeError:
+            # a partial line, from a run which was killed
+            continue
+
+    return all_results, offset + end
+
+
+def get_legacy_key(dirname):
+    fnames = sorted(dirname.glob(LEGACY_RESULTS_GLOB))
+    return [[str(fname), fname.stat().st_mtime] for fname in fnames]
+
+
+def load_table(dirname, refresh=True):
+    """
+    The run's results as a DataFrame with one row per test case. With
+    refresh, results appended since the table was cached are added to it.
+    """
+    dirname = Path(dirname)
+    table_fname = dirname / TABLE_FNAME
+    results_fname = dirname / RESULTS_FNAME
+
+    df = None
+    if table_fname.exists():
+        try:
+            df = pd.read_parquet(table_fname) if pyarrow else pd.read_pickle(table_fname)
+        except Exception:
+            df = None
+
+    if df is not None and df.attrs.get("version") != TABLE_VERSION:
+        df = None
+
+    if df is not None and not refresh:
+        return df
+
+    legacy_key = get_legacy_key(dirname)
+    size = results_fname.stat().st_size if results_fname.exists() else 0
+
+    offset = 0
+    if df is not None:
+        offset = df.attrs.get("offset", 0)
+        if df.attrs.get("legacy_key") != legacy_key or offset > size:
+            # the results were rewritten, start over
+            df = None
+            offset = 0
+        elif offset == size:
+            return df
+
+    rows = []
+    if df is None:
+        for fname, _ in legacy_key:
+            results = json.loads(Path(fname).read_text())
+            if results:
+                rows.append(results_to_row(results))
+
+    if size:
+        new_results, offset = read_new_lines(results_fname, offset)
+        rows += [results_to_row(results) for results in new_results if results]
+
+    new_df = make_table(rows, dirname)
+    if df is not None and len(df):
+        new_df = pd.concat([df, new_df], ignore_index=True)
+
+    # a test case which was re-run keeps only its latest results
+    df = new_df.drop_duplicates("testcase", keep="last").reset_index(drop=True)
+
+    df.attrs = dict(version=TABLE_VERSION, offset=offset, legacy_key=legacy_key)
+
+    if pyarrow:
+        df.to_parquet(table_fname)
+    else:
+        df.to_pickle(table_fname)
+
+    return df
+
+
+def aggregate(df):
+    """
+    The stats of each run in df, one row per dir_name: the summed counts,
+    completed_tests, tries, num_with_malformed_responses, the number of
+    cases passed_N within N tries, and the sets of variants.
+    """
+    df = df.assign(with_malformed_responses=df["num_malformed_responses"] > 0)
+
+    tries = int(df["num_tries"].max()) if len(df) else 0
+    passed_cols = []
+    for i in range(tries):
+        col = f"passed_{i+1}"
+        df[col] = df["passed"] & (df["num_tries"] <= i + 1)
+        passed_cols.append(col)
+
+    grouped = df.groupby("dir_name", sort=False)
+
+    stats = grouped[list(SUM_COLUMNS.values()) + passed_cols].sum()
+    stats["completed_tests"] = grouped.size()
+    stats["tries"] = grouped["num_tries"].max()
+    stats["num_with_malformed_responses"] = grouped["with_malformed_responses"].sum()
+
+    for key in VARIANT_COLUMNS:
+        uniques = grouped[key].unique()
+        stats[key] = [set(val for val in vals if isinstance(val, str) and val) for vals in uniques]
+
+    return stats
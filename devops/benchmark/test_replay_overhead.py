@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from aider.models import Model
+from benchmark.replay_overhead import PhaseTimer, replay_test
+
+UDIFF_HISTORY = """
+#### Change func1 to add 2.
+
+```diff
+--- foo.py
++++ foo.py
+@@ ... @@
+ def func1(x):
+-    return x + 1
++    return x + 2
+```
+
+> Applied edit to foo.py
+"""
+
+DIFF_HISTORY = """
+#### Change func1 to add 2, and func9.
+
+foo.py
+```python
+<<<<<<< SEARCH
+def func1(x):
+    return x + 1
+=======
+def func1(x):
+    return x + 2
+>>>>>>> REPLACE
+```
+
+foo.py
+```python
+<<<<<<< SEARCH
+def func9(x):
+    return x + 9
+=======
+def func9(x):
+    return x + 10
+>>>>>>> REPLACE
+```
+
+> The SEARCH section must exactly match an existing block of lines
+"""
+
+
+class TestReplayOverhead(unittest.TestCase):
+    def replay(self, edit_format, history):
+        with tempfile.TemporaryDirectory() as dname:
+            dname = Path(dname)
+
+            original = dname / "originals" / "foo"
+            original.mkdir(parents=True)
+            lines = [f"def func{i}(x):\n    return x + {i}\n\n" for i in range(5)]
+            (original / "foo.py").write_text("".join(lines))
+
+            testdir = dname / "run" / "foo"
+            testdir.mkdir(parents=True)
+            (testdir / ".aider.chat.history.md").write_text(history)
+
+            timer = PhaseTimer()
+            num_turns = replay_test(
+                testdir, original.parent, Model("gpt-4"), edit_format, False, timer
+            )
+            self.assertEqual(num_turns, 1)
+            return timer
+
+    def test_udiff_strategies(self):
+        timer = self.replay("udiff", UDIFF_HISTORY)
+        self.assertGreater(timer.calls["apply_edits.flexible_search_and_replace"], 0)
+        self.assertEqual(timer.calls["edit_error_hint"], 0)
+
+    def test_editblock_strategies(self):
+        timer = self.replay("diff", DIFF_HISTORY)
+        self.assertGreater(timer.calls["apply_edits.replace_most_similar_chunk"], 0)
+        self.assertGreater(timer.calls["apply_edits.perfect_replace"], 0)
+
+        # func9 doesn't exist, so its failure got a hint
+        self.assertEqual(timer.calls["edit_error_hint"], 1)
@@ -0,0 +1,77 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmark.results_table import RESULTS_FNAME, aggregate, load_table
+
+
+def make_results(testcase, tests_outcomes, **kwargs):
+    results = dict(
+        testcase=testcase,
+        model="gpt-4",
+        edit_format="diff",
+        commit_hash="abc1234",
+        tests_outcomes=tests_outcomes,
+        cost=0.5,
+        duration=10.0,
+    )
+    results.update(kwargs)
+    return results
+
+
+class TestResultsTable(unittest.TestCase):
+    def test_aggregate(self):
+        with tempfile.TemporaryDirectory() as dname:
+            dname = Path(dname)
+
+            # an older run's per test results file
+            (dname / "one").mkdir()
+            legacy = make_results("one", [False, True], num_malformed_responses=2)
+            (dname / "one" / ".aider.results.json").write_text(json.dumps(legacy))
+
+            lines = [
+                make_results("two", [True], test_timeouts=1),
+                make_results("three", [False, False]),
+                dict(testdir=str(dname / "four"), testcase="four", exception="boom"),
+            ]
+            lines = "".join(json.dumps(results) + "\n" for results in lines)
+            (dname / RESULTS_FNAME).write_text(lines)
+
+            stats = aggregate(load_table(dname)).loc[str(dname)]
+
+            self.assertEqual(stats["completed_tests"], 4)
+            self.assertEqual(stats["tries"], 2)
+            self.assertEqual(stats["passed_1"], 1)
+            self.assertEqual(stats["passed_2"], 2)
+            self.assertEqual(stats["cost"], 1.5)
+            self.assertEqual(stats["test_timeouts"], 1)
+            self.assertEqual(stats["num_malformed_responses"], 2)
+            self.assertEqual(stats["num_with_malformed_responses"], 1)
+            self.assertEqual(stats["model"], {"gpt-4"})
+
+    def test_incremental_refresh(self):
+        with tempfile.TemporaryDirectory() as dname:
+            dname = Path(dname)
+            results_fname = dname / RESULTS_FNAME
+
+            line = json.dumps(make_results("one", [False])) + "\n"
+            partial = json.dumps(make_results("two", [True]))
+            results_fname.write_text(line + partial[:20])
+
+            df = load_table(dname)
+            self.assertEqual(list(df["testcase"]), ["one"])
+            self.assertEqual(df.attrs["offset"], len(line))
+
+            # the rest of the partial line, and a re-run of "one"
+            with open(results_fname, "a") as fh:
+                fh.write(partial[20:] + "\n")
+                fh.write(json.dumps(make_results("one", [True])) + "\n")
+
+            df = load_table(dname)
+            self.assertEqual(sorted(df["testcase"]), ["one", "two"])
+            self.assertTrue(df["passed"].all())
+            self.assertEqual(df.attrs["offset"], results_fname.stat().st_size)
+
+            # the cached table is reused as is
+            self.assertTrue(load_table(dname, refresh=False).equals(df))
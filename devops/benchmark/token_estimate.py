@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Compare Model.token_count(estimate=True) against the real tokenizer
+(litellm.encode) on the source files under a directory.
+
+Reports the time per file of each, the relative error of the estimates and
+how often they come in under the real count. Also prints the measured
+bytes per token, used to calibrate models.BYTES_PER_TOKEN.
+
+    python benchmark/token_estimate.py [DIR] [MODEL]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+from aider.dump import dump  # noqa: F401
+from aider.models import Model
+
+EXTENSIONS = {".py", ".js", ".ts", ".tsx", ".go", ".rs", ".c", ".h", ".java", ".rb", ".md"}
+
+
+def find_files(root, max_size=256 * 1024):
+    for dname, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d != "node_modules"]
+        for fname in files:
+            if os.path.splitext(fname)[1] not in EXTENSIONS:
+                continue
+            fname = os.path.join(dname, fname)
+            if os.path.getsize(fname) > max_size:
+                continue
+            try:
+                with open(fname, encoding="utf-8") as f:
+                    yield f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+
+
+def main():
+    root = sys.argv[1] if len(sys.argv) > 1 else "."
+    model = Model(sys.argv[2] if len(sys.argv) > 2 else "gpt-4o")
+
+    texts = [text for text in find_files(root) if len(text) >= 200]
+    if not texts:
+        print(f"No source files found in {root}")
+        return 1
+
+    start = time.perf_counter()
+    exact = [len(model.tokenizer(text)) for text in texts]
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    estimated = [model.token_count(text, estimate=True) for text in texts]
+    estimate_time = time.perf_counter() - start
+
+    errors = sorted((est - real) / real for est, real in zip(estimated, exact))
+    under = sum(1 for err in errors if err < 0)
+    bytes_per_token = sum(len(text.encode("utf-8")) for text in texts) / sum(exact)
+
+    num = len(texts)
+    print(f"model: {model.name}  files: {num:,}  tokens: {sum(exact):,}")
+    print(f"measured bytes/token: {bytes_per_token:.2f}  configured: {model.bytes_per_token}")
+    print()
+    print(f"litellm.encode: {exact_time * 1e6 / num:10.1f} us/file")
+    print(f"estimate:       {estimate_time * 1e6 / num:10.1f} us/file")
+    print(f"speedup: {exact_time / estimate_time:.0f}x")
+    print()
+    print(f"mean error:   {statistics.mean(errors):+.1%}")
+    print(f"median error: {statistics.median(errors):+.1%}")
+    print(f"error range:  {errors[0]:+.1%} .. {errors[-1]:+.1%}")
+    print(f"5th pct:      {errors[num // 20]:+.1%}")
+    print(f"under-estimated: {under:,} files ({under / num:.1%})")
+    print(f"total: {sum(estimated) / sum(exact) - 1:+.1%}")
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
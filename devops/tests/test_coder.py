@@ -391,6 +391,124 @@ new
             num_commits = len(list(repo.iter_commits(repo.active_branch.name)))
             self.assertEqual(num_commits, 1)
 
+    @patch("aider.repo.simple_send_with_retries")
+    @patch("aider.repo.simple_send_with_retries_async")
+    def test_commit_message_starts_before_lint(self, mock_send_async, mock_send_sync):
+        mock_send_async.return_value = "early commit message"
+
+        with GitTemporaryDirectory():
+            repo = git.Repo()
+
+            fname = Path("file.txt")
+            fname.write_text("one\n")
+            repo.git.add(str(fname))
+            repo.git.commit("-m", "new")
+
+            io = InputOutput(yes=True)
+            coder = Coder.create(self.GPT35, "diff", io=io, fnames=[str(fname)])
+
+            def mock_send(*args, **kwargs):
+                coder.partial_response_content = f"""
+Do this:
+
+{str(fname)}
+<<<<<<< SEARCH
+one
+=======
+two
+>>>>>>> REPLACE
+
+"""
+                coder.partial_response_function_call = dict()
+                return []
+
+            def mock_lint_edited(fnames):
+                # the commit message is already being written
+                self.assertEqual(len(coder.repo.commit_message_futures), 1)
+                return ""
+
+            coder.send = mock_send
+            coder.lint_edited = mock_lint_edited
+
+            coder.run(with_message="hi")
+
+            self.assertEqual(fname.read_text(), "two\n")
+            self.assertEqual(repo.head.commit.summary, "aider: early commit message")
+            mock_send_sync.assert_not_called()
+            mock_send_async.assert_called_once()
+
+    @patch("aider.repo.simple_send_with_retries")
+    @patch("aider.repo.simple_send_with_retries_async")
+    def test_dirty_commit_message_starts_while_streaming(self, mock_send_async, mock_send_sync):
+        mock_send_async.return_value = "dirty commit message"
+        mock_send_sync.return_value = "commit message"
+
+        with GitTemporaryDirectory():
+            repo = git.Repo()
+
+            fname = Path("file.txt")
+            fname.write_text("one\n")
+            fname2 = Path("other.txt")
+            fname2.write_text("other\n")
+            repo.git.add(".")
+            repo.git.commit("-m", "new")
+
+            # both chat files are dirty, the reply only edits one
+            fname.write_text("two\n")
+            fname2.write_text("OTHER\n")
+
+            io = InputOutput(yes=True)
+            coder = Coder.create(
+                self.GPT35, "diff", io=io, fnames=[str(fname), str(fname2)], stream=True
+            )
+            coder.auto_commits = False
+
+            edit_reply = f"""
+Do this:
+
+{str(fname)}
+<<<<<<< SEARCH
+two
+=======
+three
+>>>>>>> REPLACE
+
+"""
+            reply = edit_reply
+
+            def mock_send_with_retries(model, messages, functions, stream, temperature=0):
+                self.assertEqual(coder.repo.commit_message_futures, dict())
+                chunks = []
+                for line in reply.splitlines(keepends=True):
+                    delta = MagicMock(content=line, function_call=None)
+                    chunks.append(MagicMock(choices=[MagicMock(delta=delta)]))
+                return MagicMock(hexdigest=lambda: "hash"), iter(chunks)
+
+            with patch("aider.coders.base_coder.send_with_retries", mock_send_with_retries):
+                coder.run(with_message="hi")
+
+            self.assertEqual(fname.read_text(), "three\n")
+            self.assertEqual(coder.streamed_dirty_fnames, {str(fname)})
+            self.assertEqual(repo.head.commit.summary, "dirty commit message")
+            mock_send_async.assert_called_once()
+            mock_send_sync.assert_not_called()
+
+            # no speculation without edits, or when it is turned off
+            mock_send_async.reset_mock()
+            reply = "No changes needed."
+            with patch("aider.coders.base_coder.send_with_retries", mock_send_with_retries):
+                coder.run(with_message="hi")
+            mock_send_async.assert_not_called()
+
+            coder.speculative_commit_messages = False
+            fname2.write_text("OTHER2\n")
+            reply = edit_reply.replace(str(fname), str(fname2)).replace("two", "OTHER2")
+            with patch("aider.coders.base_coder.send_with_retries", mock_send_with_retries):
+                coder.run(with_message="hi")
+            mock_send_async.assert_not_called()
+            self.assertEqual(fname2.read_text(), "three\n")
+            self.assertEqual(repo.head.commit.summary, "commit message")
+
     def test_only_commit_gpt_edited_file(self):
         """
         Only commit file that gpt edits, not other dirty files.
@@ -36,6 +36,36 @@ class TestUtils(unittest.TestCase):
         result = eb.replace_most_similar_chunk(whole, part, replace)
         self.assertEqual(result, expected_output)
 
+    def test_replace_closest_edit_distance(self):
+        whole = "This is a sample text.\nAnother line of text.\nYet another line.\n" * 3
+        part = "This was a sample text.\nAnother line of txt\n"
+        replace = "This is a replaced text.\nModified line of text.\n"
+
+        whole, whole_lines = eb.prep(whole)
+        part, part_lines = eb.prep(part)
+        replace, replace_lines = eb.prep(replace)
+
+        # the first of the equally close chunks is replaced
+        result = eb.replace_closest_edit_distance(whole_lines, part, part_lines, replace_lines)
+        self.assertEqual(result, replace + whole_lines[2] + "".join(whole_lines[3:]))
+
+        part = "Something else entirely\n"
+        result = eb.replace_closest_edit_distance(whole_lines, part, [part], replace_lines)
+        self.assertIsNone(result)
+
+    def test_find_similar_lines(self):
+        content = "".join(f"line {i}\n" for i in range(20))
+
+        search = "line 10\nline 11\nline 12\n"
+        self.assertEqual(eb.find_similar_lines(search, content), search.strip())
+
+        # the first chunk as close as any, and 5 lines around it
+        search = "line 10\nline 11\nline 12\nline 13\nline 14 changed\n"
+        expected = "\n".join(f"line {i}" for i in range(4, 19))
+        self.assertEqual(eb.find_similar_lines(search, content), expected)
+
+        self.assertEqual(eb.find_similar_lines("nothing\nlike it\n", content), "")
+
     def test_strip_quoted_wrapping(self):
         input_text = (
             "filename.ext\n```\nWe just want this content\nNot the filename and triple quotes\n```"
@@ -287,6 +317,22 @@ These changes replace the `subprocess.run` patches with `subprocess.check_output
         result = eb.replace_most_similar_chunk(whole, part, replace)
         self.assertEqual(result, expected_output)
 
+    def test_line_index_candidates(self):
+        index = eb.LineIndex("    one\ntwo\n\n    one\n  one\nthree")
+        self.assertEqual(index.lines[-1], "three\n")
+
+        self.assertEqual(index.candidates(["two\n", "\n"]), [1])
+        # seeded by the first non-blank line
+        self.assertEqual(index.candidates(["\n", "    one\n"]), [2])
+        self.assertEqual(index.candidates(["one\n"], stripped=True), [0, 3, 4])
+        # no room left for the rest of the block
+        self.assertEqual(index.candidates(["one\n", "x\n"], stripped=True), [0, 3, 4])
+        self.assertEqual(index.candidates(["one\n", "x\n", "y\n"], stripped=True), [0, 3])
+        self.assertEqual(index.candidates(["\n"]), range(0, 6))
+
+        # the same file content shares an index
+        self.assertIs(eb.get_line_index("a\nb\n"), eb.get_line_index("a\nb\n"))
+
     def test_full_edit(self):
         # Create a few temporary files
         _, file1 = tempfile.mkstemp()
@@ -398,6 +444,119 @@ Hope you like it!
             ],
         )
 
+    def test_edit_block_stream(self):
+        edit = """
+Here's the change:
+
+```text
+foo.txt
+<<<<<<< SEARCH
+one
+=======
+two
+>>>>>>> REPLACE
+
+...
+
+<<<<<<< SEARCH
+three
+=======
+four
+>>>>>>> REPLACE
+```
+
+bar.txt
+```text
+<<<<<<< SEARCH
+five
+=======
+six
+>>>>>>> REPLACE
+```
+"""
+        expected = list(eb.find_original_update_blocks(edit))
+
+        for size in (1, 7, 1000):
+            seen = []
+            stream = eb.EditBlockStream(on_edit=seen.append)
+            for i in range(0, len(edit), size):
+                chunk = edit[i : i + size]
+                stream.feed(chunk)
+
+                # each block is parsed as soon as its REPLACE marker line is complete
+                content = edit[: i + len(chunk)]
+                num_done = content.count(eb.UPDATED + "\n")
+                self.assertEqual(seen, expected[:num_done])
+
+            self.assertEqual(stream.finish(edit), expected)
+
+        # the last block is still open, it is parsed by finish()
+        stream = eb.EditBlockStream()
+        stream.feed(edit[: edit.rindex(eb.UPDATED)])
+        self.assertEqual(stream.edits, expected[:2])
+        self.assertEqual(stream.finish(edit), expected)
+
+    def test_edit_block_stream_malformed(self):
+        edit = """
+foo.txt
+<<<<<<< SEARCH
+one
+>>>>>>> REPLACE
+"""
+        stream = eb.EditBlockStream()
+        stream.feed(edit)
+        self.assertTrue(stream.failed)
+
+        with self.assertRaises(ValueError) as cm:
+            stream.finish(edit)
+        self.assertIn("Expected `=======`", str(cm.exception))
+
+    def test_full_edit_uses_streamed_previews(self):
+        _, file1 = tempfile.mkstemp()
+
+        with open(file1, "w", encoding="utf-8") as f:
+            f.write("one\ntwo\nthree\n")
+
+        coder = Coder.create(self.GPT35, "diff", io=InputOutput(), fnames=[file1])
+
+        content = f"""
+{Path(file1).name}
+<<<<<<< SEARCH
+two
+=======
+new
+>>>>>>> REPLACE
+
+<<<<<<< SEARCH
+three
+=======
+last
+>>>>>>> REPLACE
+"""
+
+        def mock_send(*args, **kwargs):
+            coder.partial_response_content = ""
+            coder.partial_response_function_call = dict()
+            coder.edit_stream = coder.make_edit_stream()
+            for line in content.splitlines(keepends=True):
+                coder.partial_response_content += line
+                coder.edit_stream.feed(line)
+
+            # both edits were matched against the file while streaming
+            self.assertEqual(len(coder.edit_previews), 2)
+            return []
+
+        coder.send = mock_send
+
+        with patch.object(eb, "do_replace", wraps=eb.do_replace) as mock_replace:
+            coder.run(with_message="hi")
+
+        # apply_edits() reused the previews
+        self.assertEqual(mock_replace.call_count, 2)
+
+        content = Path(file1).read_text(encoding="utf-8")
+        self.assertEqual(content, "one\nnew\nlast\n")
+
 
 if __name__ == "__main__":
     unittest.main()
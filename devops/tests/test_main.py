@@ -177,6 +177,12 @@ class TestMain(TestCase):
             main(["--dirty-commits"], input=DummyInput())
             _, kwargs = MockCoder.call_args
             assert kwargs["dirty_commits"] is True
+            assert kwargs["speculative_commit_messages"] is True
+
+        with patch("aider.main.Coder.create") as MockCoder:
+            main(["--no-speculative-commit-messages"], input=DummyInput())
+            _, kwargs = MockCoder.call_args
+            assert kwargs["speculative_commit_messages"] is False
 
     def test_message_file_flag(self):
         message_file_content = "This is a test message from a file."
@@ -0,0 +1,77 @@
+import io
+import re
+import unittest
+from unittest.mock import MagicMock
+
+from rich.console import Console
+from rich.markdown import Markdown
+
+from aider.dump import dump  # noqa: F401
+from aider.mdstream import MarkdownStream
+
+CODE = "".join(f"def func{num}():\n    return {num}\n\n" for num in range(40))
+
+TEXT = f"""
+# Header
+
+Some text.
+
+```python
+{CODE}```
+
+- one
+- two
+
+---
+> a quote
+continued
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+## Sub header
+The end.
+"""
+
+
+def strip_ansi(text):
+    text = re.sub(r"\x1b\][^\x1b]*\x1b\\|\x1b\[[0-9;]*m", "", text)
+    return "\n".join(line.rstrip() for line in text.splitlines())
+
+
+class TestMarkdownStream(unittest.TestCase):
+    def stream(self, text, step):
+        mdstream = MarkdownStream()
+        mdstream.live.stop()
+        mdstream.live = MagicMock()
+        mdstream.min_delay = mdstream.max_delay = 0
+
+        output = []
+        mdstream.print_lines = lambda lines: output.append("".join(lines))
+
+        for end in range(step, len(text), step):
+            mdstream.update(text[:end])
+        mdstream.update(text, final=True)
+
+        return mdstream, "".join(output)
+
+    def test_incremental_matches_full_render(self):
+        string_io = io.StringIO()
+        Console(file=string_io, force_terminal=True).print(Markdown(TEXT))
+        expected = strip_ansi(string_io.getvalue())
+
+        for step in (1, 7, 50, 1000):
+            mdstream, output = self.stream(TEXT, step)
+            self.assertEqual(strip_ansi(output), expected, f"step={step}")
+
+        # everything but the last block was frozen
+        self.assertGreater(mdstream.frozen, len(TEXT) - len("## Sub header\nThe end.\n"))
+
+    def test_long_code_block_is_frozen_in_chunks(self):
+        text = f"```python\n{CODE}"
+        mdstream, output = self.stream(text, 20)
+
+        self.assertEqual(mdstream.fence, "```python\n")
+        self.assertGreater(mdstream.frozen, len(text) // 2)
+        self.assertEqual(strip_ansi(output).count("return 39"), 1)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from aider.coders import Coder
+from aider.coders.base_coder import ExhaustedContextWindow
+from aider.dump import dump  # noqa: F401
+from aider.io import InputOutput
+from aider.metrics import ResponseMetrics, SessionMetrics, percentile
+from aider.models import Model
+from aider.utils import GitTemporaryDirectory
+
+
+def make_chunk(text):
+    delta = SimpleNamespace(content=text, function_call=None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+
+
+class TestMetrics(unittest.TestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 90), 90)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+        self.assertEqual(percentile([5], 99), 5)
+
+        # odd lengths, where rounding half to even would pick too low
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile(range(1, 10), 50), 5)
+        self.assertEqual(percentile(range(1, 10), 90), 9)
+        self.assertEqual(percentile(range(1, 101), 7), 7)
+
+    def test_response_metrics(self):
+        times = iter([10.0, 10.5, 10.6, 10.8, 11.5])
+        with patch("aider.metrics.time.perf_counter", lambda: next(times)):
+            metrics = ResponseMetrics("gpt-4", True)
+            metrics.chunk()
+            metrics.chunk()
+            metrics.chunk()
+            metrics.finish()
+        metrics.output_tokens = 100
+
+        res = metrics.as_dict()
+        self.assertEqual(res["latency"], 1.5)
+        self.assertEqual(res["ttft"], 0.5)
+        self.assertEqual(res["chunks"], 3)
+        self.assertEqual(res["gap_p50"], 0.1)
+        self.assertEqual(res["gap_p99"], 0.2)
+
+        # generation is timed from the first token
+        self.assertEqual(res["tokens_per_sec"], 100)
+
+        session = SessionMetrics()
+        session.add(metrics)
+        session.add(metrics)
+        summary = session.summary()
+        self.assertEqual(summary["requests"], 2)
+        self.assertEqual(summary["output_tokens"], 200)
+        self.assertEqual(summary["tokens_per_sec"], 100)
+        self.assertEqual(summary["ttft_p90"], 0.5)
+
+        res = json.loads(session.to_json(total_cost=1.5))
+        self.assertEqual(res["summary"]["total_cost"], 1.5)
+        self.assertEqual(len(res["requests"]), 2)
+
+        lines = session.format_lines()
+        self.assertIn("output speed: 100.0 tokens/sec", lines)
+
+    def test_coder_records_stream_metrics(self):
+        with GitTemporaryDirectory():
+            io = InputOutput(yes=True)
+            coder = Coder.create(Model("gpt-3.5-turbo"), "diff", io=io, stream=True)
+            self.assertEqual(coder.metrics.format_lines(), [])
+
+            def mock_send(model, messages, functions, stream, temperature=0):
+                chunks = [make_chunk(text) for text in ["", "Hello", " there", "!"]]
+                return hashlib.sha1(b"hi"), iter(chunks)
+
+            with patch("aider.coders.base_coder.send_with_retries", mock_send):
+                coder.run(with_message="hi")
+
+            (res,) = coder.metrics.requests
+            self.assertTrue(res["stream"])
+            self.assertEqual(res["chunks"], 3)
+            self.assertIsNotNone(res["ttft"])
+            self.assertIsNone(res["error"])
+
+            # streams are counted with the real tokenizer once they finish
+            self.assertFalse(res["output_tokens_estimated"])
+            self.assertEqual(res["output_tokens"], coder.main_model.token_count("Hello there!"))
+
+            # switching models keeps the session's metrics
+            clone = coder.clone()
+            self.assertIs(clone.metrics, coder.metrics)
+
+            with patch.object(io, "tool_output") as mock_output:
+                coder.commands.cmd_tokens("")
+            output = [call.args[0] for call in mock_output.call_args_list if call.args]
+            self.assertTrue(any("1 LLM responses" in line for line in output))
+
+            with patch.object(io, "tool_output") as mock_output:
+                coder.commands.cmd_metrics("")
+            res = json.loads(mock_output.call_args.args[0])
+            self.assertEqual(res["summary"]["requests"], 1)
+
+    def test_coder_records_failed_requests(self):
+        with GitTemporaryDirectory():
+            io = InputOutput(yes=True)
+            coder = Coder.create(Model("gpt-3.5-turbo"), "diff", io=io, stream=True)
+
+            def mock_send(model, messages, functions, stream, temperature=0):
+                raise ExhaustedContextWindow()
+
+            with patch("aider.coders.base_coder.send_with_retries", mock_send):
+                coder.run(with_message="hi")
+
+            (res,) = coder.metrics.requests
+            self.assertEqual(res["error"], "ExhaustedContextWindow")
+            self.assertIsNotNone(res["latency"])
+            self.assertIsNone(res["output_tokens"])
+            self.assertEqual(coder.metrics.summary()["errors"], 1)
+            self.assertIn("1 requests failed", coder.metrics.format_lines())
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import MagicMock
 
 from aider.models import Model
 
@@ -23,6 +24,44 @@ class TestModels(unittest.TestCase):
         model = Model("gpt-4-0613")
         self.assertEqual(model.info["max_input_tokens"], 8 * 1024)
 
+    def test_token_count_is_cached(self):
+        model = Model("gpt-3.5-turbo")
+        model.tokenizer = MagicMock(side_effect=lambda text: text.split())
+
+        messages = [
+            dict(role="user", content="one two three"),
+            dict(role="assistant", content="four five"),
+        ]
+        total = model.token_count(messages)
+        self.assertEqual(total, model.token_count(messages[0]) + model.token_count(messages[1]) + 2)
+        self.assertEqual(model.tokenizer.call_count, 2)
+
+        # only the new message gets tokenized
+        messages.append(dict(role="user", content="six"))
+        model.token_count(messages)
+        self.assertEqual(model.tokenizer.call_count, 3)
+
+        self.assertEqual(model.token_count("a b c"), 3)
+        self.assertEqual(model.token_count("a b c"), 3)
+        self.assertEqual(model.tokenizer.call_count, 4)
+        self.assertEqual(model.token_cache.misses, 4)
+
+    def test_token_count_estimate(self):
+        model = Model("gpt-3.5-turbo")
+
+        with open(__file__) as f:
+            content = f.read()
+
+        exact = model.token_count(content)
+        estimate = model.token_count(content, estimate=True)
+        self.assertGreater(estimate, exact * 0.8)
+        self.assertLess(estimate, exact * 1.3)
+
+        model.tokenizer = MagicMock()
+        messages = [dict(role="user", content=content)]
+        self.assertGreater(model.token_count(messages, estimate=True), estimate)
+        model.tokenizer.assert_not_called()
+
 
 if __name__ == "__main__":
     unittest.main()
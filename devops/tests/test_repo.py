@@ -1,5 +1,6 @@
 import os
 import tempfile
+import threading
 import unittest
 from pathlib import Path
 from unittest.mock import patch
@@ -277,6 +278,74 @@ class TestRepo(unittest.TestCase):
             fnames = git_repo.get_tracked_files()
             self.assertIn(str(fname), fnames)
 
+    def test_get_tracked_files_is_cached(self):
+        with GitTemporaryDirectory():
+            raw_repo = git.Repo()
+
+            fname = Path("new.txt")
+            fname.touch()
+            raw_repo.git.add(str(fname))
+            raw_repo.git.commit("-m", "new")
+
+            git_repo = GitRepo(InputOutput(), None, None)
+
+            with patch.object(
+                git_repo, "load_tracked_files", wraps=git_repo.load_tracked_files
+            ) as mock_load:
+                self.assertEqual(git_repo.get_tracked_files(), [str(fname)])
+                self.assertTrue(git_repo.path_in_repo(fname))
+                self.assertFalse(git_repo.path_in_repo("other.txt"))
+                self.assertEqual(mock_load.call_count, 1)
+
+                # staging a file rewrites the index
+                fname2 = Path("new2.txt")
+                fname2.touch()
+                raw_repo.git.add(str(fname2))
+                self.assertTrue(git_repo.path_in_repo(fname2))
+                self.assertEqual(mock_load.call_count, 2)
+
+                # HEAD moves
+                raw_repo.git.commit("-m", "new2")
+                self.assertEqual(set(git_repo.get_tracked_files()), {str(fname), str(fname2)})
+                self.assertEqual(mock_load.call_count, 3)
+
+            # callers get a frozenset, so they can't change the cache
+            tracked = git_repo.get_tracked_files_set()
+            self.assertIsInstance(tracked, frozenset)
+            self.assertIs(git_repo.get_tracked_files_set(), tracked)
+
+    def test_get_tracked_files_from_threads(self):
+        with GitTemporaryDirectory():
+            raw_repo = git.Repo()
+            fnames = [f"file{i}.txt" for i in range(20)]
+            for fname in fnames:
+                Path(fname).touch()
+            raw_repo.git.add(".")
+            raw_repo.git.commit("-m", "new")
+
+            aiderignore = Path(".aiderignore")
+            git_repo = GitRepo(InputOutput(), None, None, aider_ignore_file=str(aiderignore))
+
+            results = []
+
+            def worker():
+                for _ in range(20):
+                    results.append(git_repo.get_tracked_files_set())
+
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for i in range(10):
+                # a different size each time, in case the mtime doesn't tick
+                aiderignore.write_text(f"file{i}.txt\n" * (i + 1))
+            for thread in threads:
+                thread.join()
+
+            # every load matched against a whole spec, and the last one is current
+            for tracked in results:
+                self.assertIn(len(tracked), (19, 20))
+            self.assertEqual(git_repo.get_tracked_files_set(), set(fnames) - {"file9.txt"})
+
     @patch("aider.repo.simple_send_with_retries")
     def test_noop_commit(self, mock_send):
         mock_send.return_value = '"a good commit message"'
@@ -294,3 +363,33 @@ class TestRepo(unittest.TestCase):
             git_repo = GitRepo(InputOutput(), None, None)
 
             git_repo.commit(fnames=[str(fname)])
+
+    @patch("aider.repo.simple_send_with_retries")
+    @patch("aider.repo.simple_send_with_retries_async")
+    def test_start_commit_message(self, mock_send_async, mock_send):
+        mock_send_async.return_value = '"early commit message"'
+        mock_send.return_value = "late commit message"
+
+        with GitTemporaryDirectory():
+            raw_repo = git.Repo()
+
+            fname = Path("file.txt")
+            fname.write_text("one\n")
+            raw_repo.git.add(str(fname))
+            raw_repo.git.commit("-m", "new")
+
+            git_repo = GitRepo(InputOutput(), None, None, models=[self.GPT35])
+
+            fname.write_text("two\n")
+            git_repo.start_commit_message([str(fname)])
+            git_repo.commit(fnames=[str(fname)])
+            self.assertEqual(raw_repo.head.commit.message.strip(), "early commit message")
+            mock_send.assert_not_called()
+
+            # the diff changed after the message was started, so it's not used
+            fname.write_text("three\n")
+            git_repo.start_commit_message([str(fname)])
+            fname.write_text("four\n")
+            git_repo.commit(fnames=[str(fname)])
+            self.assertEqual(raw_repo.head.commit.message.strip(), "late commit message")
+            mock_send.assert_called_once()
@@ -1,10 +1,22 @@
 import os
+import random
 import unittest
+from collections import defaultdict
 
 from aider.dump import dump  # noqa: F401
 from aider.io import InputOutput
 from aider.models import Model
-from aider.repomap import RepoMap
+from aider.repomap import (
+    RenderCache,
+    RepoMap,
+    Tag,
+    get_fallback_lexer,
+    get_lang_tagger,
+    pack_tags,
+    pagerank_networkx,
+    pagerank_sparse,
+    unpack_tags,
+)
 from aider.utils import IgnorantTemporaryDirectory
 
 
@@ -153,6 +165,317 @@ print(my_function(3, 4))
             # close the open cache files, so Windows won't error
             del repo_map
 
+    def test_get_tags_parallel_matches_serial(self):
+        file_content = """\
+class MyClass{num}:
+    def my_method(self, arg1, arg2):
+        return helper{num}(arg1) + arg2
+
+def helper{num}(arg1):
+    return MyClass{prev}().my_method(arg1, 1)
+"""
+
+        with IgnorantTemporaryDirectory() as temp_dir:
+            fnames = []
+            for num in range(6):
+                fname = os.path.join(temp_dir, f"file{num}.py")
+                with open(fname, "w") as f:
+                    f.write(file_content.format(num=num, prev=num - 1))
+                fnames.append(fname)
+
+            fname = os.path.join(temp_dir, "notes.md")
+            with open(fname, "w") as f:
+                f.write("# notes\n")
+            fnames.append(fname)
+
+            io = InputOutput()
+            repo_map = RepoMap(main_model=self.GPT35, root=temp_dir, io=io, map_workers=2)
+            repo_map.map_batch_size = 2
+
+            serial = dict()
+            for fname in fnames:
+                rel_fname = repo_map.get_rel_fname(fname)
+                serial[fname] = list(repo_map.get_tags_raw(fname, rel_fname))
+
+            parallel = repo_map.get_tags_parallel(fnames, repo_map.get_mtimes(fnames))
+
+            for fname in fnames:
+                rel_fname = repo_map.get_rel_fname(fname)
+                self.assertEqual(unpack_tags(parallel[fname], rel_fname, fname), serial[fname])
+                self.assertIn(fname, repo_map.TAGS_CACHE)
+                self.assertEqual(repo_map.TAGS_CACHE[fname]["data"], parallel[fname])
+                self.assertEqual(repo_map.get_tags(fname, rel_fname), serial[fname])
+
+            # close the open cache files, so Windows won't error
+            del repo_map
+
+    def test_pack_tags_roundtrip(self):
+        tags = [
+            Tag(rel_fname="a.py", fname="/r/a.py", line=3, name="foo", kind="def"),
+            Tag(rel_fname="a.py", fname="/r/a.py", line=-1, name="bar", kind="ref"),
+            Tag(rel_fname="a.py", fname="/r/a.py", line=9, name="foo", kind="ref"),
+        ]
+
+        record = pack_tags(tags)
+        names, name_ids, kinds, lines = record
+        self.assertEqual(names, ("foo", "bar"))
+        self.assertIsInstance(name_ids, bytes)
+        self.assertEqual(unpack_tags(record, "a.py", "/r/a.py"), tags)
+
+        self.assertEqual(unpack_tags(pack_tags([]), "a.py", "/r/a.py"), [])
+
+    def test_symbol_index_is_incremental(self):
+        with IgnorantTemporaryDirectory() as temp_dir:
+            fnames = []
+            for num in range(3):
+                fname = os.path.join(temp_dir, f"file{num}.py")
+                with open(fname, "w") as f:
+                    f.write(f"def func{num}():\n    return func{(num + 1) % 3}()\n")
+                fnames.append(fname)
+
+            io = InputOutput()
+            repo_map = RepoMap(main_model=self.GPT35, root=temp_dir, io=io)
+            repo_map.get_ranked_tags([], fnames, set(), set())
+            self.assertEqual(repo_map.defines["func1"], {"file1.py"})
+            generation = repo_map.index_generation
+            graph = repo_map.ranking_graph
+
+            # nothing changed, the index and graph are reused
+            repo_map.get_ranked_tags([], fnames, set(), set())
+            self.assertEqual(repo_map.index_generation, generation)
+            self.assertIs(repo_map.ranking_graph, graph)
+
+            # rewrite file1 so it defines something else
+            with open(fnames[1], "w") as f:
+                f.write("def renamed():\n    return func0()\n")
+            mtime = os.path.getmtime(fnames[1])
+            os.utime(fnames[1], (mtime + 1, mtime + 1))
+
+            ranked = repo_map.get_ranked_tags([], fnames, set(), set())
+            self.assertNotIn("func1", repo_map.defines)
+            self.assertEqual(repo_map.defines["renamed"], {"file1.py"})
+            self.assertNotIn("file1.py", repo_map.references["func2"])
+            self.assertEqual(repo_map.references["func0"]["file1.py"], 1)
+            self.assertIsNot(repo_map.ranking_graph, graph)
+
+            fresh_map = RepoMap(main_model=self.GPT35, root=temp_dir, io=io)
+            self.assertEqual(
+                sorted(ranked), sorted(fresh_map.get_ranked_tags([], fnames, set(), set()))
+            )
+
+            # files that leave the map are dropped from the index
+            repo_map.get_ranked_tags([], fnames[:2], set(), set())
+            self.assertNotIn(fnames[2], repo_map.file_index)
+            self.assertNotIn("func2", repo_map.defines)
+
+            # close the open cache files, so Windows won't error
+            del repo_map
+            del fresh_map
+
+    def test_estimated_map_fits_budget(self):
+        with IgnorantTemporaryDirectory() as temp_dir:
+            fnames = []
+            for num in range(30):
+                fname = os.path.join(temp_dir, f"file{num}.py")
+                with open(fname, "w") as f:
+                    f.write(
+                        f"class Thing{num}:\n"
+                        f"    def method{num}(self, value):\n"
+                        f"        return Thing{(num + 1) % 30}().method{(num + 1) % 30}(value)\n"
+                    )
+                fnames.append(fname)
+
+            io = InputOutput()
+            repo_map = RepoMap(main_model=self.GPT35, root=temp_dir, io=io)
+
+            max_map_tokens = 300
+            repo_map.estimate_map_tokens = False
+            exact = repo_map.get_ranked_tags_map([], fnames, max_map_tokens)
+            repo_map.estimate_map_tokens = True
+            estimated = repo_map.get_ranked_tags_map([], fnames, max_map_tokens)
+
+            self.assertLess(self.GPT35.token_count(exact), max_map_tokens)
+            self.assertLess(self.GPT35.token_count(estimated), max_map_tokens)
+            self.assertGreater(
+                self.GPT35.token_count(estimated), self.GPT35.token_count(exact) * 0.8
+            )
+
+            # nothing fits by the estimate, the exact counts still find the map
+            repo_map.estimate_tree_tokens = lambda tags, chat_rel_fnames: max_map_tokens
+            self.assertEqual(repo_map.get_ranked_tags_map([], fnames, max_map_tokens), exact)
+
+            # close the open cache files, so Windows won't error
+            del repo_map
+
+    def test_render_cache(self):
+        with IgnorantTemporaryDirectory() as temp_dir:
+            fname = os.path.join(temp_dir, "file.py")
+            with open(fname, "w") as f:
+                f.write("def one():\n    pass\n\ndef two():\n    pass\n")
+
+            io = InputOutput()
+            repo_map = RepoMap(main_model=self.GPT35, root=temp_dir, io=io, render_cache_disk=True)
+
+            first = repo_map.render_tree(fname, "file.py", [0, 3])
+            self.assertEqual(repo_map.tree_cache.misses, 1)
+            self.assertEqual(repo_map.render_tree(fname, "file.py", [3, 0]), first)
+            self.assertEqual(repo_map.tree_cache.hits, 1)
+
+            # a new content hash is a miss
+            with open(fname, "w") as f:
+                f.write("def uno():\n    pass\n\ndef dos():\n    pass\n")
+            mtime = os.path.getmtime(fname)
+            os.utime(fname, (mtime + 1, mtime + 1))
+            self.assertIn("uno", repo_map.render_tree(fname, "file.py", [0, 3]))
+            self.assertEqual(repo_map.tree_cache.misses, 2)
+
+            # the disk cache is shared with the next session
+            next_map = RepoMap(main_model=self.GPT35, root=temp_dir, io=io, render_cache_disk=True)
+            self.assertIn("uno", next_map.render_tree(fname, "file.py", [0, 3]))
+            self.assertEqual(next_map.tree_cache.hits, 1)
+            self.assertEqual(next_map.tree_cache.misses, 0)
+
+            # close the open cache files, so Windows won't error
+            del repo_map
+            del next_map
+
+    def test_render_cache_is_bounded(self):
+        cache = RenderCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(list(cache.memory), ["a", "c"])
+        self.assertIsNone(cache.get("b"))
+
+    def test_get_mtimes(self):
+        with IgnorantTemporaryDirectory() as temp_dir:
+            fname = os.path.join(temp_dir, "file.py")
+            with open(fname, "w") as f:
+                f.write("pass\n")
+            subdir = os.path.join(temp_dir, "subdir")
+            os.mkdir(subdir)
+            missing = os.path.join(temp_dir, "missing.py")
+
+            repo_map = RepoMap(main_model=self.GPT35, root=temp_dir, io=InputOutput())
+            mtimes = repo_map.get_mtimes([fname, subdir, missing])
+            self.assertEqual(mtimes, {fname: os.path.getmtime(fname)})
+
+            # fresh cache entries are fetched in bulk, stale ones are reparsed
+            tags = repo_map.get_tags_bulk([fname], mtimes)
+            self.assertEqual(repo_map.get_cached_tags([fname], mtimes), tags)
+            mtimes[fname] += 1
+            self.assertEqual(repo_map.get_cached_tags([fname], mtimes), {})
+
+            # close the open cache files, so Windows won't error
+            del repo_map
+
+    def test_cached_mtimes_need_invalidate(self):
+        with IgnorantTemporaryDirectory() as temp_dir:
+            fname = os.path.join(temp_dir, "file.py")
+            with open(fname, "w") as f:
+                f.write("pass\n")
+            mtime = os.path.getmtime(fname)
+
+            repo_map = RepoMap(
+                main_model=self.GPT35, root=temp_dir, io=InputOutput(), cache_mtimes=True
+            )
+            self.assertEqual(repo_map.get_mtimes([fname]), {fname: mtime})
+
+            os.utime(fname, (mtime + 10, mtime + 10))
+            self.assertEqual(repo_map.get_mtimes([fname]), {fname: mtime})
+
+            repo_map.invalidate([fname])
+            self.assertEqual(repo_map.get_mtimes([fname]), {fname: mtime + 10})
+
+            # close the open cache files, so Windows won't error
+            del repo_map
+
+    def test_lang_tagger_is_reused(self):
+        tagger = get_lang_tagger("python")
+        self.assertIsNotNone(tagger)
+        self.assertIs(get_lang_tagger("python"), tagger)
+
+        # no tags query for this language
+        self.assertIsNone(get_lang_tagger("markdown"))
+
+    def test_fallback_lexer_for_ambiguous_extension(self):
+        tagger = get_lang_tagger("c")
+        c_code = "int main(void);\n"
+        objc_code = "@interface Foo : NSObject\n- (void)bar;\n@end\n"
+
+        # .h may be C or Objective-C, so it is guessed from each file's content
+        self.assertEqual(get_fallback_lexer(tagger, "one.h", c_code).name, "C")
+        self.assertEqual(get_fallback_lexer(tagger, "two.h", objc_code).name, "Objective-C")
+        self.assertEqual(get_fallback_lexer(tagger, "three.h", c_code).name, "C")
+        self.assertNotIn(".h", tagger.lexers)
+
+        lexer = get_fallback_lexer(tagger, "one.c", c_code)
+        self.assertIs(get_fallback_lexer(tagger, "two.c", objc_code), lexer)
+
+
+class TestPageRank(unittest.TestCase):
+    def make_graph(self, num_files=40, num_idents=60, seed=0):
+        rnd = random.Random(seed)
+        fnames = [f"file{i}.py" for i in range(num_files)]
+
+        defines = defaultdict(set)
+        references = defaultdict(list)
+        for i in range(num_idents):
+            ident = f"ident{i}"
+            for fname in rnd.sample(fnames, rnd.randint(1, 3)):
+                defines[ident].add(fname)
+            for _ in range(rnd.randint(0, 8)):
+                references[ident].append(rnd.choice(fnames))
+
+        idents = set(defines).intersection(set(references))
+        return fnames, defines, references, idents
+
+    def assert_rankings_agree(self, *args, **kwargs):
+        ranked_nx, definitions_nx = pagerank_networkx(*args, **kwargs)
+        ranked_sp, definitions_sp = pagerank_sparse(*args, **kwargs)
+
+        self.assertEqual(set(ranked_nx), set(ranked_sp))
+        for node, rank in ranked_nx.items():
+            self.assertAlmostEqual(rank, ranked_sp[node], places=6)
+
+        self.assertEqual(set(definitions_nx), set(definitions_sp))
+        for key, rank in definitions_nx.items():
+            self.assertAlmostEqual(rank, definitions_sp[key], places=6)
+
+    def test_rankings_agree(self):
+        for seed in range(5):
+            fnames, defines, references, idents = self.make_graph(seed=seed)
+            self.assert_rankings_agree(defines, references, idents, {"ident1", "ident7"})
+
+    def test_rankings_agree_personalized(self):
+        fnames, defines, references, idents = self.make_graph(seed=3)
+        personalization = {fnames[0]: 0.25, fnames[5]: 0.25, "not_in_graph.py": 0.25}
+        self.assert_rankings_agree(
+            defines,
+            references,
+            idents,
+            set(),
+            personalization=personalization,
+            dangling=personalization,
+        )
+
+    def test_empty_graph(self):
+        self.assertEqual(pagerank_sparse({}, {}, set(), set()), ({}, {}))
+
+    def test_personalization_outside_graph(self):
+        fnames, defines, references, idents = self.make_graph()
+        personalization = {"not_in_graph.py": 1.0}
+        with self.assertRaises(ZeroDivisionError):
+            pagerank_sparse(
+                defines,
+                references,
+                idents,
+                set(),
+                personalization=personalization,
+                dangling=personalization,
+            )
+
 
 class TestRepoMapTypescript(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,65 @@
+import unittest
+
+from aider.coders import search_replace as sr
+from aider.dump import dump  # noqa: F401
+
+
+class TestDiff3Merge(unittest.TestCase):
+    def test_merge(self):
+        base = "a\nb\nc\nd\ne\n"
+        ours = "a\nB\nc\nd\ne\n"
+        theirs = "a\nb\nc\nD\ne\n"
+        self.assertEqual(sr.diff3_merge(base, ours, theirs), "a\nB\nc\nD\ne\n")
+
+        # the same change on both sides is not a conflict
+        self.assertEqual(sr.diff3_merge(base, ours, ours), ours)
+
+    def test_conflicts(self):
+        base = "a\nb\nc\nd\n"
+
+        # the same line
+        self.assertIsNone(sr.diff3_merge(base, "a\nX\nc\nd\n", "a\nY\nc\nd\n"))
+
+        # adjacent lines, like git
+        self.assertIsNone(sr.diff3_merge(base, "a\nX\nc\nd\n", "a\nb\nY\nd\n"))
+
+        # both insert at the same spot
+        self.assertIsNone(sr.diff3_merge(base, "a\nb\nX\nc\nd\n", "a\nb\nY\nc\nd\n"))
+
+    def test_ambiguous_change_slides_down(self):
+        # either "x" line could be the one inserted, git picks the last
+        base = "x\n"
+        ours = "y\nx\nz\nx\n"
+        theirs = "x\nw\n"
+        self.assertEqual(sr.diff3_merge(base, ours, theirs), "y\nx\nz\nx\nw\n")
+
+    def test_osr_onto_o(self):
+        original = "".join(f"line {i}\n" for i in range(30))
+
+        # line 13 drifted in search, line 11 is still changed
+        search = "line 10\nline 11\nline 12\nlyne 13\nline 14\n"
+        replace = "line 10\nline 1!\nline 12\nlyne 13\nline 14\n"
+        res = sr.diff3_osr_onto_o((search, replace, original))
+        self.assertEqual(res, original.replace("line 11\n", "line 1!\n"))
+
+        # nothing changes, like an empty cherry-pick
+        self.assertIsNone(sr.diff3_osr_onto_o((search, search, original)))
+
+    def test_matches_git_cherry_pick(self):
+        original = "".join(f"line {i}\n" for i in range(30))
+        cases = [
+            # search drifted from original, replace edits lines nearby
+            ("line 10\nline 11\nline 12\n", "line 10\nline eleven\nline 12\n"),
+            ("line 10\nline 11\nline 12\nlyne 13\n", "line 10\nline 1!\nline 12\nlyne 13\n"),
+            ("line 10\nline 11\nlyne 12\nline 13\n", "line 10\nline 11\nlyne 12\nline 13!\n"),
+            ("line 10\nline 11\nlyne 12\nline 13\n", "line 10\nline 11\nline 12?\nline 13\n"),
+            ("line 20\nline 22\n", "line 20\nnew\nline 22\n"),
+            ("line 5\n", "line 5\nline 5.5\n"),
+            ("line 29\n", "line 28\n"),
+        ]
+
+        for search, replace in cases:
+            texts = search, replace, original
+            self.assertEqual(
+                sr.diff3_osr_onto_o(texts), sr.git_cherry_pick_osr_onto_o(texts), search
+            )
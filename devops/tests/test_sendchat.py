@@ -1,10 +1,17 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import httpx
 
+from aider import sendchat
 from aider.litellm import litellm
-from aider.sendchat import send_with_retries
+from aider.sendchat import (
+    send_with_retries,
+    send_with_retries_async,
+    simple_send_with_retries_async,
+    submit,
+)
+from aider.utils import IgnorantTemporaryDirectory
 
 
 class PrintCalled(Exception):
@@ -45,3 +52,51 @@ class TestSendChat(unittest.TestCase):
         # Call the send_with_retries method
         send_with_retries("model", ["message"], None, False)
         mock_print.assert_called_once()
+
+    @patch("litellm.completion")
+    def test_send_with_retries_cache(self, mock_completion):
+        chunks = ["chunk1", "chunk2"]
+        mock_completion.side_effect = [iter(chunks), "response", iter(chunks)]
+
+        with IgnorantTemporaryDirectory() as temp_dir:
+            with patch.object(sendchat, "CACHE", None):
+                cache = sendchat.enable_cache(temp_dir)
+
+                # streams are recorded as they are consumed, then replayed
+                _hash, res = send_with_retries("model", ["message"], None, True)
+                self.assertEqual(list(res), chunks)
+                _hash, res = send_with_retries("model", ["message"], None, True)
+                self.assertEqual(list(res), chunks)
+                self.assertEqual(mock_completion.call_count, 1)
+
+                _hash, res = send_with_retries("model", ["message"], None, False)
+                _hash, res = send_with_retries("model", ["message"], None, False)
+                self.assertEqual(res, "response")
+                self.assertEqual(mock_completion.call_count, 2)
+
+                # an interrupted stream isn't cached
+                _hash, res = send_with_retries("model", ["other"], None, True)
+                next(res)
+                res.close()
+                self.assertEqual(len(cache), 2)
+
+                cache.close()
+
+    @patch("litellm.acompletion", new_callable=AsyncMock)
+    def test_send_with_retries_async(self, mock_acompletion):
+        response = MagicMock()
+        response.choices[0].message.content = "async reply"
+        mock_acompletion.return_value = response
+
+        future = submit(simple_send_with_retries_async("model", ["message"]))
+        self.assertEqual(future.result(timeout=10), "async reply")
+
+        mock_acompletion.side_effect = [
+            httpx.ConnectError("Connection error"),
+            response,
+        ]
+        with patch("builtins.print") as mock_print:
+            future = submit(send_with_retries_async("model", ["message"], None, False))
+            _hash, res = future.result(timeout=10)
+            self.assertIs(res, response)
+            mock_print.assert_called_once()
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from aider import trace
+from aider.dump import dump  # noqa: F401
+
+
+class TestTrace(unittest.TestCase):
+    def tearDown(self):
+        trace.disable_trace()
+        trace.PROFILE_FNAME = None
+
+    def test_disabled(self):
+        self.assertIs(trace.span("x"), trace.NULL_SPAN)
+        self.assertIs(trace.profile(), trace.NULL_SPAN)
+
+        @trace.traced("double")
+        def double(x):
+            return 2 * x
+
+        with trace.span("x", a=1) as s:
+            s.set(b=2)
+            self.assertEqual(double(3), 6)
+        trace.complete("y", trace.now())
+
+    def test_trace_events(self):
+        @trace.traced("double")
+        def double(x):
+            return 2 * x
+
+        with tempfile.TemporaryDirectory() as dname:
+            fname = os.path.join(dname, "trace.json")
+            trace.enable_trace(fname)
+
+            with trace.span("outer", a=1) as s:
+                self.assertEqual(double(3), 6)
+                s.set(b=2)
+
+            with self.assertRaises(KeyError):
+                with trace.span("failed"):
+                    raise KeyError
+
+            start = trace.now()
+            trace.complete("first_token", start, tokens=1)
+
+            # a partly written trace is valid chrome trace json, less the ]
+            partial = open(fname).read()
+            self.assertTrue(partial.endswith(",\n"))
+
+            trace.disable_trace()
+            events = json.loads(open(fname).read())
+
+        names = [event["name"] for event in events]
+        self.assertEqual(names, ["double", "outer", "failed", "first_token", "trace_end"])
+
+        double_event, outer, failed, first_token = events[:4]
+        self.assertEqual(outer["ph"], "X")
+        self.assertEqual(outer["args"], dict(a=1, b=2))
+        self.assertNotIn("args", double_event)
+        self.assertEqual(failed["args"], dict(error="KeyError"))
+        self.assertEqual(first_token["args"], dict(tokens=1))
+
+        # double() ran inside outer
+        self.assertGreaterEqual(double_event["ts"], outer["ts"])
+        self.assertLessEqual(
+            double_event["ts"] + double_event["dur"], outer["ts"] + outer["dur"]
+        )
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as dname:
+            trace.enable_profile(os.path.join(dname, "aider.prof"))
+
+            for _ in range(2):
+                with trace.profile():
+                    sum(range(1000))
+
+            self.assertEqual(sorted(os.listdir(dname)), ["aider-1.prof", "aider-2.prof"])
+
+    def test_profile_html_without_pyinstrument(self):
+        with tempfile.TemporaryDirectory() as dname:
+            with patch.object(trace, "pyinstrument", None):
+                fname = trace.enable_profile(os.path.join(dname, "aider.html"))
+                self.assertEqual(fname, os.path.join(dname, "aider.prof"))
+
+                with trace.profile():
+                    sum(range(1000))
+
+            self.assertEqual(os.listdir(dname), ["aider-1.prof"])
+
+    def test_turn_leaves_out_the_caller(self):
+        def gen():
+            for i in range(3):
+                time.sleep(0.01)
+                yield i
+            return "done"
+
+        def consume(turn):
+            items = []
+            while True:
+                try:
+                    items.append(next(turn))
+                except StopIteration as stop:
+                    return items, stop.value
+                # the caller rendering the chunk
+                time.sleep(0.05)
+
+        # untraced, it is just the generator
+        self.assertEqual(consume(trace.turn("turn", gen())), ([0, 1, 2], "done"))
+
+        with tempfile.TemporaryDirectory() as dname:
+            fname = os.path.join(dname, "trace.json")
+            trace.enable_trace(fname)
+            trace.enable_profile(os.path.join(dname, "aider.prof"))
+
+            self.assertEqual(consume(trace.turn("turn", gen())), ([0, 1, 2], "done"))
+
+            trace.disable_trace()
+            (event,) = [event for event in json.load(open(fname)) if event["name"] == "turn"]
+            self.assertIn("aider-1.prof", os.listdir(dname))
+
+        # the span's duration includes the caller's 0.15s, own_ms doesn't
+        self.assertGreater(event["dur"], 150_000)
+        self.assertLess(event["args"]["own_ms"], 100)
+        self.assertGreater(event["args"]["own_ms"], 25)
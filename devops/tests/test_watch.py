@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import git
+
+from aider.dump import dump  # noqa: F401
+from aider.io import InputOutput
+from aider.repo import GitRepo
+from aider.utils import GitTemporaryDirectory
+from aider.watch import FileWatcher
+
+
+class TestFileWatcher(unittest.TestCase):
+    def make_watcher(self):
+        repo = git.Repo()
+        for name in ("one.py", "two.py"):
+            Path(name).write_text(f"# {name}\n")
+            repo.git.add(name)
+        repo.git.commit("-m", "init")
+
+        watcher = FileWatcher(GitRepo(InputOutput(), None, "."), use_watchdog=False)
+        watcher.refresh()
+        return repo, watcher
+
+    def test_poll_tracks_changes(self):
+        with GitTemporaryDirectory():
+            repo, watcher = self.make_watcher()
+            self.assertEqual(watcher.get_files(), ["one.py", "two.py"])
+            one, two = watcher.get_abs_files()
+            self.assertEqual(watcher.pop_changed(), {one, two})
+
+            # nothing changed
+            watcher.poll()
+            self.assertEqual(watcher.pop_changed(), set())
+
+            later = time.time() + 10
+            os.utime("one.py", (later, later))
+            os.remove("two.py")
+            watcher.poll()
+
+            self.assertEqual(watcher.pop_changed(), {one, two})
+            self.assertEqual(watcher.get_files(), ["one.py"])
+
+            # untracked files are ignored
+            Path("three.py").write_text("# three\n")
+            watcher.poll()
+            self.assertEqual(watcher.get_files(), ["one.py"])
+
+    def test_git_changes_refresh_tracked_files(self):
+        with GitTemporaryDirectory():
+            repo, watcher = self.make_watcher()
+            watcher.pop_changed()
+
+            Path("three.py").write_text("# three\n")
+            repo.git.add("three.py")
+
+            self.assertEqual(watcher.get_files(), ["one.py", "three.py", "two.py"])
+            self.assertEqual(watcher.pop_changed(), {str(Path("three.py").resolve())})
+
+    def test_path_changed(self):
+        with GitTemporaryDirectory():
+            repo, watcher = self.make_watcher()
+            watcher.pop_changed()
+
+            two = str(Path("two.py").resolve())
+            os.remove("two.py")
+            watcher.path_changed(two)
+            self.assertEqual(watcher.pop_changed(), {two})
+            self.assertEqual(watcher.get_files(), ["one.py"])
+
+            # changes inside .git and to untracked files don't count as file changes
+            watcher.path_changed(os.path.join(watcher.git_dir, "index"))
+            watcher.path_changed(str(Path("untracked.py").resolve()))
+            self.assertEqual(watcher.pop_changed(), set())
+
+            Path("two.py").write_text("# back\n")
+            watcher.path_changed(two)
+            self.assertEqual(watcher.get_files(), ["one.py", "two.py"])
+
+    def test_thread_leaves_git_to_main_thread(self):
+        with GitTemporaryDirectory():
+            repo, watcher = self.make_watcher()
+            watcher.pop_changed()
+
+            threads = set()
+            get_key = watcher.repo.get_tracked_files_key
+
+            def mock_get_key():
+                threads.add(threading.get_ident())
+                return get_key()
+
+            watcher.poll_interval = 0.01
+            with patch.object(watcher.repo, "get_tracked_files_key", mock_get_key):
+                watcher.start()
+                try:
+                    Path("three.py").write_text("# three\n")
+                    repo.git.add("three.py")
+                    time.sleep(0.2)
+
+                    # the git change is picked up when the changes are asked for
+                    self.assertEqual(watcher.pop_changed(), {str(Path("three.py").resolve())})
+                finally:
+                    watcher.stop()
+
+            self.assertEqual(threads, {threading.get_ident()})